@@ -0,0 +1,373 @@
+"""
+Compact binary solution format. The plans of a solution that follows solution_schema.json are stored in flat numpy
+arrays (an .npz archive): per-plan offsets into the action arrays (CSR layout), the plan and action times as integers
+and the optional fields with missing-value masks. The top-level fields other than the plans (cost, dropped requests,
+feasibility) are stored as a JSON string, as they are small. The conversion is lossless in both directions: the JSON
+solution converted to the compact format and back is equal to the original. The JSON variants produced by the
+solvers are supported (datetime strings or POSIX timestamps, node positions as numbers or as objects), but each
+variant has to be used consistently within a file.
+"""
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from darpinstances.inout import load_json, save_json
+from darpinstances.instance_objects import ActionType
+
+COMPACT_SOLUTION_VERSION = 2
+"""Version of the compact solution format. Increase on any change of the stored arrays."""
+
+COMPACT_SOLUTION_SUFFIX = '.npz'
+
+_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_PLAN_KEYS = {'cost', 'vehicle', 'departure_time', 'arrival_time', 'actions'}
+_VEHICLE_KEYS = {'index', 'id', 'init_position', 'capacity'}
+_ACTION_DATA_KEYS = {'action', 'arrival_time', 'departure_time'}
+_ACTION_KEYS = {'id', 'request_index', 'type', 'position', 'min_time', 'max_time', 'service_duration'}
+_ACTION_TYPES = {'pickup': ActionType.PICKUP.value, 'drop_off': ActionType.DROP_OFF.value}
+
+_COST_INTEGER = 0
+_COST_FLOAT = 1
+_COST_MISSING = 2
+
+_FLAGS = ('has_plans', 'times_are_timestamps', 'vehicle_positions_are_objects', 'action_positions_are_objects',
+          'vehicles_have_index')
+
+
+def _check_keys(json_object: Dict, allowed_keys: set, name: str):
+    unknown_keys = json_object.keys() - allowed_keys
+    if unknown_keys:
+        raise ValueError(f"The {name} field(s) {sorted(unknown_keys)} cannot be stored in the compact solution format")
+
+
+def _get_variant(values: Sequence, is_variant, name: str) -> bool:
+    """Returns whether all values are of the variant, or raises ValueError if the variants are mixed."""
+    variant_count = sum(1 for value in values if is_variant(value))
+    if 0 < variant_count < len(values):
+        raise ValueError(f"Mixed {name} representations cannot be stored in the compact solution format")
+    return variant_count > 0
+
+
+def _encode_times(times: list) -> Tuple[np.ndarray, bool]:
+    """
+    Encodes the non-missing times to int64: the POSIX timestamps as they are, the datetime strings as seconds since
+    1970-01-01 of the naive datetime.
+    """
+    if _get_variant(times, lambda time: isinstance(time, int), 'time'):
+        return np.array(times, dtype=np.int64), True
+    seconds = pd.to_datetime(pd.Series(times, dtype=object), format=_DATETIME_FORMAT).to_numpy() \
+        .astype('datetime64[s]').astype(np.int64)
+    if not np.array_equal(_decode_times(seconds, False), np.array(times, dtype=str)):
+        raise ValueError("Times in a non-canonical format cannot be stored in the compact solution format")
+    return seconds, False
+
+
+def _decode_times(values: np.ndarray, as_timestamps: bool) -> np.ndarray:
+    if as_timestamps:
+        return values
+    if values.size == 0:
+        return np.empty(0, dtype=str)
+    return np.char.replace(np.datetime_as_string(values.astype('datetime64[s]'), unit='s'), 'T', ' ')
+
+
+def _get_missing(json_objects: List[Dict], key: str) -> np.ndarray:
+    return np.fromiter((key not in json_object for json_object in json_objects), dtype=bool, count=len(json_objects))
+
+
+def _encode_optional(json_objects: List[Dict], key: str, encode=lambda value: value) -> Tuple[np.ndarray, np.ndarray]:
+    """Encodes the optional integer field of the JSON objects to the values and the missing-value mask."""
+    values = [0 if key not in json_object else encode(json_object[key]) for json_object in json_objects]
+    _check_integers(values, key)
+    return np.array(values, dtype=np.int64), _get_missing(json_objects, key)
+
+
+def _encode_optional_times(
+    json_objects: List[Dict], key: str, times_are_timestamps: bool
+) -> Tuple[np.ndarray, np.ndarray]:
+    missing = _get_missing(json_objects, key)
+    values = np.zeros(len(json_objects), dtype=np.int64)
+    present_times = [json_object[key] for json_object in json_objects if key in json_object]
+    if present_times:
+        values[~missing], present_as_timestamps = _encode_times(present_times)
+        if present_as_timestamps != times_are_timestamps:
+            raise ValueError("Mixed time representations cannot be stored in the compact solution format")
+    return values, missing
+
+
+def _encode_position(position: Union[int, Dict]) -> int:
+    return position['index'] if isinstance(position, dict) else position
+
+
+def _decode_position(index: int, as_object: bool) -> Union[int, Dict]:
+    return {'index': index} if as_object else index
+
+
+def _check_integers(values: Sequence, name: str):
+    for value in values:
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f"Non-integer {name} {value!r} cannot be stored in the compact solution format")
+
+
+def _encode_costs(costs: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Encodes the plan costs to the integer costs, the float costs and the cost kind of each plan, so that both the
+    integer and the float costs are restored exactly.
+    """
+    kinds = np.empty(len(costs), dtype=np.int8)
+    integer_costs = np.zeros(len(costs), dtype=np.int64)
+    float_costs = np.zeros(len(costs), dtype=np.float64)
+    for index, cost in enumerate(costs):
+        if cost is None:
+            kinds[index] = _COST_MISSING
+        elif isinstance(cost, float):
+            kinds[index] = _COST_FLOAT
+            float_costs[index] = cost
+        elif isinstance(cost, int) and not isinstance(cost, bool) and -2 ** 63 <= cost < 2 ** 63:
+            kinds[index] = _COST_INTEGER
+            integer_costs[index] = cost
+        else:
+            raise ValueError(f"Plan cost {cost!r} cannot be stored in the compact solution format")
+    return integer_costs, float_costs, kinds
+
+
+def _decode_costs(arrays: Dict[str, np.ndarray]) -> list:
+    return [
+        None if kind == _COST_MISSING else float_cost if kind == _COST_FLOAT else integer_cost
+        for integer_cost, float_cost, kind in zip(
+            arrays['plan_cost'].tolist(), arrays['plan_cost_float'].tolist(), arrays['plan_cost_kind'].tolist()
+        )
+    ]
+
+
+def get_plan_costs(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    """Returns the plan costs as float64, NaN for the plans without a cost (see SolutionColumns)."""
+    kinds = arrays['plan_cost_kind']
+    costs = np.where(kinds == _COST_FLOAT, arrays['plan_cost_float'], arrays['plan_cost'].astype(np.float64))
+    costs[kinds == _COST_MISSING] = np.nan
+    return costs
+
+
+def json_to_compact(json_data: Dict) -> Dict[str, np.ndarray]:
+    """
+    Converts the JSON solution to the arrays of the compact format.
+
+    :raises ValueError: if the solution cannot be represented in the compact format without a loss
+    """
+    metadata = {key: value for key, value in json_data.items() if key != 'plans'}
+    plans = json_data.get('plans', [])
+    for plan in plans:
+        _check_keys(plan, _PLAN_KEYS, 'plan')
+        _check_keys(plan['vehicle'], _VEHICLE_KEYS, 'vehicle')
+        if 'index' in plan['vehicle'] and 'id' in plan['vehicle']:
+            raise ValueError("Vehicles with both the index and the id cannot be stored in the compact solution format")
+    actions_data = [action_data for plan in plans for action_data in plan['actions']]
+    actions = [action_data['action'] for action_data in actions_data]
+    for action_data, action in zip(actions_data, actions):
+        _check_keys(action_data, _ACTION_DATA_KEYS, 'action data')
+        _check_keys(action, _ACTION_KEYS, 'action')
+        if action['type'] not in _ACTION_TYPES:
+            raise ValueError(f"Unknown action type {action['type']!r}")
+
+    vehicles = [plan['vehicle'] for plan in plans]
+    vehicles_have_index = _get_variant(vehicles, lambda vehicle: 'index' in vehicle, 'vehicle id')
+    vehicle_ids = [vehicle['index'] if vehicles_have_index else vehicle['id'] for vehicle in vehicles]
+    _check_integers(vehicle_ids, 'vehicle id')
+    vehicle_positions_are_objects = _get_variant(
+        [vehicle['init_position'] for vehicle in vehicles if 'init_position' in vehicle],
+        lambda position: isinstance(position, dict),
+        'vehicle position'
+    )
+    action_positions_are_objects = _get_variant(
+        [action['position'] for action in actions if 'position' in action],
+        lambda position: isinstance(position, dict),
+        'action position'
+    )
+
+    plan_times, times_are_timestamps = _encode_times(
+        [time for plan in plans for time in (plan['departure_time'], plan['arrival_time'])]
+        + [time for action_data in actions_data for time in (action_data['arrival_time'], action_data['departure_time'])]
+    )
+    action_times = plan_times[2 * len(plans):]
+    vehicle_positions, vehicle_positions_missing = _encode_optional(vehicles, 'init_position', _encode_position)
+    vehicle_capacities, vehicle_capacities_missing = _encode_optional(vehicles, 'capacity')
+    action_ids, action_ids_missing = _encode_optional(actions, 'id')
+    action_positions, action_positions_missing = _encode_optional(actions, 'position', _encode_position)
+    min_times, min_times_missing = _encode_optional_times(actions, 'min_time', times_are_timestamps)
+    max_times, max_times_missing = _encode_optional_times(actions, 'max_time', times_are_timestamps)
+    service_durations, service_durations_missing = _encode_optional(actions, 'service_duration')
+    plan_costs, plan_float_costs, plan_cost_kinds = _encode_costs([plan['cost'] for plan in plans])
+    plan_offsets = np.zeros(len(plans) + 1, dtype=np.int64)
+    np.cumsum([len(plan['actions']) for plan in plans], out=plan_offsets[1:])
+
+    return {
+        'version': np.array(COMPACT_SOLUTION_VERSION),
+        'metadata': np.array(json.dumps(metadata)),
+        'flags': np.array([
+            'plans' in json_data,
+            times_are_timestamps,
+            vehicle_positions_are_objects,
+            action_positions_are_objects,
+            vehicles_have_index
+        ]),
+        'plan_offsets': plan_offsets,
+        'plan_cost': plan_costs,
+        'plan_cost_float': plan_float_costs,
+        'plan_cost_kind': plan_cost_kinds,
+        'plan_vehicle_id': np.array(vehicle_ids, dtype=np.int64),
+        'plan_vehicle_position': vehicle_positions,
+        'plan_vehicle_position_missing': vehicle_positions_missing,
+        'plan_vehicle_capacity': vehicle_capacities,
+        'plan_vehicle_capacity_missing': vehicle_capacities_missing,
+        'plan_departure_time': plan_times[0:2 * len(plans):2],
+        'plan_arrival_time': plan_times[1:2 * len(plans):2],
+        'action_request_index': np.array([action['request_index'] for action in actions], dtype=np.int64),
+        'action_type': np.array([_ACTION_TYPES[action['type']] for action in actions], dtype=np.int8),
+        'action_arrival_time': action_times[0::2],
+        'action_departure_time': action_times[1::2],
+        'action_id': action_ids,
+        'action_id_missing': action_ids_missing,
+        'action_position': action_positions,
+        'action_position_missing': action_positions_missing,
+        'action_min_time': min_times,
+        'action_min_time_missing': min_times_missing,
+        'action_max_time': max_times,
+        'action_max_time_missing': max_times_missing,
+        'action_service_duration': service_durations,
+        'action_service_duration_missing': service_durations_missing,
+    }
+
+
+def get_flags(arrays: Dict[str, np.ndarray]) -> Dict[str, bool]:
+    return dict(zip(_FLAGS, arrays['flags'].tolist()))
+
+
+def get_metadata(arrays: Dict[str, np.ndarray]) -> Dict:
+    """Returns the top-level fields of the solution other than the plans (cost, dropped requests, feasibility)."""
+    return json.loads(arrays['metadata'].item())
+
+
+def compact_to_json(arrays: Dict[str, np.ndarray]) -> Dict:
+    """Converts the arrays of the compact format to the JSON solution."""
+    flags = get_flags(arrays)
+    json_data = get_metadata(arrays)
+    if not flags['has_plans']:
+        return json_data
+
+    def get_optional(name: str, values=None) -> list:
+        values = arrays[name].tolist() if values is None else values
+        return [None if missing else value for value, missing in zip(values, arrays[f'{name}_missing'].tolist())]
+
+    def decode_times(name: str) -> list:
+        return _decode_times(arrays[name], flags['times_are_timestamps']).tolist()
+
+    action_type_names = {value: name for name, value in _ACTION_TYPES.items()}
+    action_columns = zip(
+        get_optional('action_id'),
+        arrays['action_request_index'].tolist(),
+        arrays['action_type'].tolist(),
+        get_optional('action_position'),
+        get_optional('action_min_time', decode_times('action_min_time')),
+        get_optional('action_max_time', decode_times('action_max_time')),
+        get_optional('action_service_duration'),
+        decode_times('action_arrival_time'),
+        decode_times('action_departure_time')
+    )
+    actions_data = []
+    for action_id, request_index, action_type, position, min_time, max_time, service_duration, arrival_time, \
+            departure_time in action_columns:
+        action = {}
+        if action_id is not None:
+            action['id'] = action_id
+        action['request_index'] = request_index
+        action['type'] = action_type_names[action_type]
+        if position is not None:
+            action['position'] = _decode_position(position, flags['action_positions_are_objects'])
+        if min_time is not None:
+            action['min_time'] = min_time
+        if max_time is not None:
+            action['max_time'] = max_time
+        if service_duration is not None:
+            action['service_duration'] = service_duration
+        actions_data.append({'action': action, 'arrival_time': arrival_time, 'departure_time': departure_time})
+
+    plan_columns = zip(
+        _decode_costs(arrays),
+        arrays['plan_vehicle_id'].tolist(),
+        get_optional('plan_vehicle_position'),
+        get_optional('plan_vehicle_capacity'),
+        decode_times('plan_departure_time'),
+        decode_times('plan_arrival_time'),
+        arrays['plan_offsets'][:-1].tolist(),
+        arrays['plan_offsets'][1:].tolist()
+    )
+    plans = []
+    for cost, vehicle_id, position, capacity, departure_time, arrival_time, start, end in plan_columns:
+        vehicle = {'index' if flags['vehicles_have_index'] else 'id': vehicle_id}
+        if position is not None:
+            vehicle['init_position'] = _decode_position(position, flags['vehicle_positions_are_objects'])
+        if capacity is not None:
+            vehicle['capacity'] = capacity
+        plans.append({
+            'cost': cost,
+            'vehicle': vehicle,
+            'departure_time': departure_time,
+            'arrival_time': arrival_time,
+            'actions': actions_data[start:end]
+        })
+    json_data['plans'] = plans
+    return json_data
+
+
+def save_compact_solution(json_data: Dict, filepath: Union[str, Path]):
+    """
+    Stores the JSON solution in the compact format.
+
+    :raises ValueError: if the solution cannot be represented in the compact format without a loss
+    """
+    with open(filepath, 'wb') as file:
+        np.savez_compressed(file, **json_to_compact(json_data))
+    logging.info("Compact solution saved to %s", os.path.realpath(filepath))
+
+
+def load_compact_arrays(filepath: Union[str, Path]) -> Dict[str, np.ndarray]:
+    """
+    Loads the arrays of the compact solution file.
+
+    :raises ValueError: if the file is stored in an incompatible version of the format
+    """
+    logging.info("Loading compact solution from: %s", os.path.realpath(filepath))
+    with np.load(filepath, allow_pickle=False) as compact_solution:
+        version = int(compact_solution['version'])
+        if version != COMPACT_SOLUTION_VERSION:
+            raise ValueError(
+                f"Unsupported compact solution version {version}, expected {COMPACT_SOLUTION_VERSION}: {filepath}"
+            )
+        return {key: compact_solution[key] for key in compact_solution.files}
+
+
+def convert_solution(input_path: Path, output_path: Path):
+    """Converts the solution between the JSON and the compact format, in the direction given by the file suffixes."""
+    if input_path.suffix == '.json' and output_path.suffix == COMPACT_SOLUTION_SUFFIX:
+        save_compact_solution(load_json(input_path), output_path)
+    elif input_path.suffix == COMPACT_SOLUTION_SUFFIX and output_path.suffix == '.json':
+        save_json(compact_to_json(load_compact_arrays(input_path)), output_path)
+    else:
+        raise ValueError(
+            f"Unsupported conversion from {input_path.suffix} to {output_path.suffix}, "
+            f"expected .json and {COMPACT_SOLUTION_SUFFIX}"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converts DARP solutions between the JSON and the compact format')
+    parser.add_argument('input', type=Path, help='Path to the input solution (.json or .npz)')
+    parser.add_argument('output', type=Path, help='Path to the output solution (.npz or .json)')
+    args = parser.parse_args()
+    convert_solution(args.input, args.output)
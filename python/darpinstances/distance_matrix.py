@@ -0,0 +1,804 @@
+import atexit
+import contextlib
+import hashlib
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import h5py
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from tqdm.autonotebook import tqdm
+
+INSTANCE_DM_FILENAME = 'dm_instance.h5'
+NODE_MAP_DATASET_NAME = 'node_map'
+
+
+def get_dm_dataset_name(dm_file: h5py.File) -> str:
+    """
+    Returns the name of the dataset holding the distance matrix. The distance matrix is always the first dataset in
+    the file, apart from the node map of instance distance matrices.
+    """
+    return next(key for key in dm_file.keys() if key != NODE_MAP_DATASET_NAME)
+
+
+def get_npy_export_path(dm_filepath: Union[str, Path]) -> Path:
+    return Path(dm_filepath).with_suffix('.npy')
+
+
+def open_hdf_memmap(dm_filepath: Union[str, Path]) -> Optional[np.memmap]:
+    """
+    Memory-maps the distance matrix dataset directly in the HDF5 file. This is possible only for datasets stored
+    in the contiguous layout without any filters (compression).
+
+    :param dm_filepath: path to the HDF5 distance matrix file
+    :return: read-only memory map of the distance matrix or None if the dataset cannot be memory-mapped
+    """
+    with h5py.File(dm_filepath, 'r') as dm_file:
+        dataset = dm_file[get_dm_dataset_name(dm_file)]
+        if dataset.chunks is not None or dataset.compression is not None:
+            return None
+        offset = dataset.id.get_offset()
+
+        # the space for the dataset was never allocated
+        if offset is None:
+            return None
+
+        dtype = dataset.dtype
+        shape = dataset.shape
+
+    return np.memmap(dm_filepath, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+
+def export_hdf_to_npy(
+    dm_filepath: Union[str, Path], npy_filepath: Optional[Union[str, Path]] = None, rows_per_block: int = 1024
+) -> Path:
+    """
+    Exports the HDF5 distance matrix to a raw .npy file that can be memory-mapped. The export is done by row blocks, so
+    the whole matrix is never held in memory.
+
+    :param dm_filepath: path to the HDF5 distance matrix file
+    :param npy_filepath: target path. By default, the .npy file is created next to the HDF5 file.
+    :param rows_per_block: number of rows copied at once
+    :return: path to the exported file
+    """
+    if npy_filepath is None:
+        npy_filepath = get_npy_export_path(dm_filepath)
+
+    logging.info("Exporting distance matrix %s to %s", os.path.realpath(dm_filepath), os.path.realpath(npy_filepath))
+
+    # the export is written to a temporary file first so that an interrupted export is never used
+    tmp_filepath = Path(f"{npy_filepath}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with h5py.File(dm_filepath, 'r') as dm_file:
+        dataset = dm_file[get_dm_dataset_name(dm_file)]
+        exported = np.lib.format.open_memmap(tmp_filepath, mode='w+', dtype=dataset.dtype, shape=dataset.shape)
+        for start in range(0, dataset.shape[0], rows_per_block):
+            end = min(start + rows_per_block, dataset.shape[0])
+            exported[start:end] = dataset[start:end]
+        exported.flush()
+        del exported
+
+    os.replace(tmp_filepath, npy_filepath)
+    return Path(npy_filepath)
+
+
+def read_dm_attributes(dm_filepath: Union[str, Path]) -> dict:
+    """
+    Reads the attributes of a compacted distance matrix (see compact_dm). Matrices that are not compacted have
+    a unit of 1 and no travel time divider applied.
+
+    :return: dict with the `unit` and `travel_time_divider` keys
+    """
+    with h5py.File(dm_filepath, 'r') as dm_file:
+        attributes = dm_file[get_dm_dataset_name(dm_file)].attrs
+        return {
+            'unit': int(attributes.get('unit', 1)),
+            'travel_time_divider': int(attributes.get('travel_time_divider', 1))
+        }
+
+
+def compact_dm(
+    dm, travel_time_divider: int = 1, dtype=np.uint16, allow_scaling: bool = True, rows_per_block: int = 1024
+) -> Tuple[np.ndarray, int]:
+    """
+    Converts the distance matrix to a compact integer type with the travel time divider already applied, so that the
+    values are in seconds. If the maximum travel time does not fit into the target type, the values are scaled by
+    a unit: a stored value multiplied by the unit gives the travel time in seconds. The values are rounded up to whole
+    units. The instance loaders and the solution checker do not use the rounded values, they read the exact travel
+    times from the uncompacted matrix (see TravelTimeProvider.source_provider).
+
+    :param dm: distance matrix. Any array-like object supporting row slicing (numpy array, memmap, HDF5 dataset)
+    :param travel_time_divider: divider converting the matrix values to seconds
+    :param dtype: target unsigned integer type
+    :param allow_scaling: if False, an OverflowError is raised when the values do not fit into the target type
+    :param rows_per_block: number of rows converted at once
+    :return: tuple (compact matrix, unit)
+    """
+    row_count = dm.shape[0]
+
+    max_value = 0
+    for start in range(0, row_count, rows_per_block):
+        block = np.asarray(dm[start:start + rows_per_block])
+        if block.size == 0:
+            continue
+        if block.min() < 0:
+            raise ValueError("The distance matrix contains negative travel times, it cannot be compacted")
+        max_value = max(max_value, int(block.max()))
+
+    max_seconds = math.ceil(max_value / travel_time_divider)
+    dtype_max = int(np.iinfo(dtype).max)
+    unit = 1
+    if max_seconds > dtype_max:
+        if not allow_scaling:
+            raise OverflowError(
+                f"Maximum travel time ({max_seconds} s) does not fit into {np.dtype(dtype).name} (max {dtype_max})"
+            )
+        unit = math.ceil(max_seconds / dtype_max)
+        logging.warning(
+            "Maximum travel time (%d s) does not fit into %s, the travel times are stored in units of %d s",
+            max_seconds,
+            np.dtype(dtype).name,
+            unit
+        )
+
+    compacted = np.empty(dm.shape, dtype=dtype)
+    for start in range(0, row_count, rows_per_block):
+        block = np.asarray(dm[start:start + rows_per_block])
+        compacted[start:start + rows_per_block] = np.ceil(block / (travel_time_divider * unit))
+
+    return compacted, unit
+
+
+def save_compact_dm(
+    dm_filepath: Union[str, Path],
+    compact_dm_filepath: Union[str, Path],
+    travel_time_divider: int = 1,
+    dtype=np.uint16,
+    allow_scaling: bool = True
+) -> Path:
+    """
+    Stores a compact version of the distance matrix (see compact_dm) to a new HDF5 file. The unit and the applied
+    travel time divider are stored as dataset attributes, so that the loaders can interpret the values.
+    """
+    logging.info(
+        "Compacting distance matrix %s to %s (%s)",
+        os.path.realpath(dm_filepath),
+        os.path.realpath(compact_dm_filepath),
+        np.dtype(dtype).name
+    )
+    with h5py.File(dm_filepath, 'r') as dm_file:
+        source_attributes = dm_file[get_dm_dataset_name(dm_file)].attrs
+        if int(source_attributes.get('unit', 1)) != 1 or int(source_attributes.get('travel_time_divider', 1)) != 1:
+            raise ValueError(f"Distance matrix {dm_filepath} is already compacted")
+        compacted, unit = compact_dm(
+            dm_file[get_dm_dataset_name(dm_file)], travel_time_divider, dtype, allow_scaling
+        )
+
+    with h5py.File(compact_dm_filepath, 'w') as compact_file:
+        dataset = compact_file.create_dataset('dm', data=compacted)
+        dataset.attrs['unit'] = unit
+        dataset.attrs['travel_time_divider'] = travel_time_divider
+
+    return Path(compact_dm_filepath)
+
+
+def read_node_map(dm_filepath: Union[str, Path]) -> Optional[np.ndarray]:
+    """
+    Reads the map from the local node indices of an instance distance matrix (see save_instance_dm) to the global
+    node indices.
+
+    :return: sorted array of global node indices, or None if the matrix is not an instance distance matrix
+    """
+    with h5py.File(dm_filepath, 'r') as dm_file:
+        if NODE_MAP_DATASET_NAME in dm_file:
+            return dm_file[NODE_MAP_DATASET_NAME][()]
+    return None
+
+
+def extract_sub_dm(dm, locations: np.ndarray, rows_per_block: int = 256) -> np.ndarray:
+    """
+    Extracts the sub-matrix dm[np.ix_(locations, locations)] by row blocks, so that only the selected rows are read.
+
+    :param dm: distance matrix. Any array-like object supporting row selection (numpy array, memmap, HDF5 dataset)
+    :param locations: sorted array of unique node indices
+    :param rows_per_block: number of rows read at once
+    """
+    sub_dm = np.empty((len(locations), len(locations)), dtype=dm.dtype)
+    for start in range(0, len(locations), rows_per_block):
+        rows = np.asarray(dm[locations[start:start + rows_per_block]])
+        sub_dm[start:start + rows_per_block] = rows[:, locations]
+    return sub_dm
+
+
+def save_instance_dm(
+    dm, locations, instance_dm_filepath: Union[str, Path], unit: int = 1, travel_time_divider: int = 1
+) -> Path:
+    """
+    Stores the distance matrix restricted to the given locations. Next to the matrix, the map from the local indices
+    to the global node indices is stored, so the loaders can translate the node indices used in the instance.
+
+    :param dm: distance matrix of the whole area
+    :param locations: global indices of the nodes used by the instance
+    :param instance_dm_filepath: target path, usually <instance dir>/dm_instance.h5
+    :param unit: unit of the area distance matrix (see compact_dm)
+    :param travel_time_divider: travel time divider applied to the area distance matrix (see compact_dm)
+    """
+    node_map = np.unique(np.asarray(locations, dtype=np.int64))
+    logging.info(
+        "Saving instance distance matrix with %d of %d nodes to %s",
+        len(node_map),
+        dm.shape[0],
+        os.path.realpath(instance_dm_filepath)
+    )
+    sub_dm = extract_sub_dm(dm, node_map)
+    with h5py.File(instance_dm_filepath, 'w') as dm_file:
+        dataset = dm_file.create_dataset('dm', data=sub_dm)
+        dataset.attrs['unit'] = unit
+        dataset.attrs['travel_time_divider'] = travel_time_divider
+        dm_file.create_dataset(NODE_MAP_DATASET_NAME, data=node_map)
+
+    return Path(instance_dm_filepath)
+
+
+def _open_dm_array(dm_file_stack: contextlib.ExitStack, dm_filepath: Path):
+    """
+    Opens the distance matrix as an array-like object supporting row slicing without reading the whole matrix, if
+    the format allows it.
+    """
+    if dm_filepath.suffix == '.npy':
+        return np.load(dm_filepath, mmap_mode='r')
+    if dm_filepath.suffix == '.csv':
+        return pd.read_csv(dm_filepath, header=None, dtype=np.int32).values
+    dm_file = dm_file_stack.enter_context(h5py.File(dm_filepath, 'r'))
+    return dm_file[get_dm_dataset_name(dm_file)]
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    # Before Python 3.13, attaching registers the block with the resource tracker, which would unlink it when the
+    # attaching process exits, despite the block being owned by another process.
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedDMRegistry:
+    """
+    Registry of distance matrices stored in shared memory (multiprocessing.shared_memory), so that all processes
+    working with the same area use a single copy of the distance matrix.
+
+    The shared memory blocks are named by the hash of the resolved distance matrix path, size and modification time, so
+    that a regenerated matrix is not served from a block of its previous version. The first process that
+    acquires the matrix loads it into a new block and becomes its owner; all other processes (forked or spawned)
+    attach to the existing block and get zero-copy read-only views. Each registry counts the references acquired in
+    its process. When the count drops to zero, the block is closed, and, in the owner process, also unlinked (forked
+    children inheriting the registry never unlink the block). The owner should therefore keep its reference until all
+    workers are finished. All blocks are released at process exit.
+    """
+
+    _HEADER_SIZE = 64
+    _MAGIC = b'DARPDM01'
+    _READY_TIMEOUT = 3600
+
+    def __init__(self):
+        self._entries: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        atexit.register(self.release_all)
+
+    @staticmethod
+    def get_block_name(dm_filepath: Union[str, Path]) -> str:
+        resolved_path = str(Path(dm_filepath).resolve())
+        stat = os.stat(resolved_path)
+        identity = f"{resolved_path}:{stat.st_size}:{stat.st_mtime_ns}"
+        return 'darp_dm_' + hashlib.sha1(identity.encode('utf-8')).hexdigest()[:16]
+
+    def acquire(self, dm_filepath: Union[str, Path]) -> np.ndarray:
+        """
+        Returns a read-only view of the distance matrix stored in shared memory. The matrix is loaded into shared
+        memory if it is not there yet. Each call has to be paired with a release call.
+        """
+        key = str(Path(dm_filepath).resolve())
+        with self._lock:
+            if key in self._entries:
+                entry = self._entries[key]
+                entry[2] += 1
+                return entry[1]
+
+            name = self.get_block_name(key)
+            try:
+                block = _attach_shared_memory(name)
+                owner_pid = None
+                logging.info("Attaching shared distance matrix %s (%s)", key, name)
+            except FileNotFoundError:
+                block, created = self._create_block(name, Path(key))
+                owner_pid = os.getpid() if created else None
+
+            dm = self._get_view(block)
+            self._entries[key] = [block, dm, 1, owner_pid]
+            return dm
+
+    def release(self, dm_filepath: Union[str, Path]):
+        key = str(Path(dm_filepath).resolve())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[2] -= 1
+            if entry[2] == 0:
+                del self._entries[key]
+                self._close_block(entry[0], entry[3])
+
+    def release_all(self):
+        with self._lock:
+            for block, _, _, owner_pid in self._entries.values():
+                self._close_block(block, owner_pid)
+            self._entries.clear()
+
+    def get_reference_count(self, dm_filepath: Union[str, Path]) -> int:
+        entry = self._entries.get(str(Path(dm_filepath).resolve()))
+        return 0 if entry is None else entry[2]
+
+    def _create_block(self, name: str, dm_filepath: Path) -> Tuple[shared_memory.SharedMemory, bool]:
+        with contextlib.ExitStack() as dm_file_stack:
+            source = _open_dm_array(dm_file_stack, dm_filepath)
+            dtype = np.dtype(source.dtype)
+            if len(dtype.str) > 8:
+                raise ValueError(f"Unsupported distance matrix type: {dtype}")
+            size = self._HEADER_SIZE + int(np.prod(source.shape)) * dtype.itemsize
+            try:
+                block = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # another process created the block in the meantime
+                return _attach_shared_memory(name), False
+
+            logging.info(
+                "Loading distance matrix %s to shared memory (%s, %.1f MB)", dm_filepath, name, size / 1_000_000
+            )
+            try:
+                self._fill_block(block, source, dtype)
+            except BaseException:
+                # a block that is never marked as ready would block all processes acquiring it until the timeout
+                logging.warning("Loading distance matrix %s to shared memory failed, removing %s", dm_filepath, name)
+                self._close_block(block, os.getpid())
+                raise
+        return block, True
+
+    def _fill_block(self, block: shared_memory.SharedMemory, source, dtype: np.dtype):
+        header = np.ndarray((8,), dtype=np.int64, buffer=block.buf)
+        header[1:3] = source.shape
+        block.buf[32:40] = dtype.str.encode('ascii').ljust(8)
+        dm = np.ndarray(source.shape, dtype=dtype, buffer=block.buf, offset=self._HEADER_SIZE)
+        for start in range(0, source.shape[0], 1024):
+            dm[start:start + 1024] = source[start:start + 1024]
+        del dm
+
+        # the magic marks the block as ready
+        block.buf[0:8] = self._MAGIC
+        del header
+
+    def _get_view(self, block: shared_memory.SharedMemory) -> np.ndarray:
+        deadline = time.monotonic() + self._READY_TIMEOUT
+        while bytes(block.buf[0:8]) != self._MAGIC:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Shared distance matrix {block.name} was not loaded in time")
+            time.sleep(0.1)
+
+        header = np.ndarray((8,), dtype=np.int64, buffer=block.buf)
+        shape = tuple(int(dim) for dim in header[1:3])
+        del header
+        dtype = np.dtype(bytes(block.buf[32:40]).decode('ascii').strip())
+        dm = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=self._HEADER_SIZE)
+        dm.flags.writeable = False
+        return dm
+
+    @staticmethod
+    def _close_block(block: shared_memory.SharedMemory, owner_pid: Optional[int]):
+        try:
+            block.close()
+        except BufferError:
+            # views of the block are still in use, the memory is released when they are garbage collected
+            logging.debug("Shared distance matrix %s is still referenced", block.name)
+        if owner_pid == os.getpid():
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+
+
+shared_dm_registry = SharedDMRegistry()
+
+
+def compute_edge_travel_times(edges: pd.DataFrame, allow_zero_length_edges: bool = True) -> pd.Series:
+    """
+    Computes the travel time in seconds for each edge of the road graph. The real speed is used if the edges have the
+    `speed` column (km/h), otherwise, the default speed of 50 km/h is used.
+    """
+    if 'speed' in edges:
+        logging.info("Using real speed from edges")
+        # estimated travel time in seconds
+        travel_times = round(edges["length"] / edges["speed"] * 3.6).astype(int)
+    else:
+        logging.info("Using default speed of 50 km/h")
+        try:
+            travel_times = edges["length"].apply(lambda x: round(int(x) / 14))
+        except ValueError as v:
+            logging.warning("Suspicious max speed, trying float conversion: %s", v)
+            travel_times = edges["length"].apply(lambda x: round(float(x) / 14))
+
+    if not allow_zero_length_edges:
+        travel_times[travel_times == 0] = 1
+
+    return travel_times
+
+
+def load_edges_graph(edges_filepath: Union[str, Path], node_count: Optional[int] = None) -> csr_matrix:
+    """
+    Loads the road graph from the map edges file as a sparse adjacency matrix with travel times in seconds as weights.
+    If there are more edges between the same pair of nodes, the fastest one is used.
+
+    :param edges_filepath: path to the edges file (map/edges.csv) with the u, v, and travel_time or length columns
+    :param node_count: number of nodes. By default, it is determined from the nodes file next to the edges file, or
+    from the edges if the nodes file does not exist.
+    """
+    edges_filepath = Path(edges_filepath)
+    logging.info("Loading road graph from %s", os.path.realpath(edges_filepath))
+    edges = pd.read_csv(edges_filepath, sep=r'\s+')
+    if 'travel_time' not in edges:
+        edges['travel_time'] = compute_edge_travel_times(edges)
+
+    if node_count is None:
+        nodes_filepath = edges_filepath.parent / 'nodes.csv'
+        if nodes_filepath.exists():
+            node_count = len(pd.read_csv(nodes_filepath, sep=r'\s+', usecols=[0]))
+        else:
+            node_count = int(max(edges['u'].max(), edges['v'].max())) + 1
+
+    return edges_to_graph(edges, node_count)
+
+
+def edges_to_graph(edges: pd.DataFrame, node_count: int) -> csr_matrix:
+    """
+    Converts the edges with the u, v, and travel_time columns to a sparse adjacency matrix. If there are more edges
+    between the same pair of nodes, the fastest one is used.
+    """
+    edges = edges.sort_values('travel_time').drop_duplicates(['u', 'v'])
+
+    # explicit zeros are kept in the matrix, so zero travel time edges are valid edges
+    return csr_matrix(
+        (edges['travel_time'].to_numpy(dtype=float), (edges['u'].to_numpy(), edges['v'].to_numpy())),
+        shape=(node_count, node_count)
+    )
+
+
+class CachedRowMatrix(ABC):
+    """
+    Read-only matrix whose rows are loaded or computed on demand by blocks of rows. The blocks are kept in an LRU
+    cache limited by a memory budget. The matrix supports the indexing used by the travel time providers: a row
+    (matrix[i]), an element (matrix[i, j]), pairwise gather (matrix[rows, cols]) and a block (matrix[np.ix_(rows,
+    cols)]).
+    """
+
+    def __init__(self, shape: Tuple[int, int], dtype, rows_per_block: int, max_cache_bytes: int):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.rows_per_block = rows_per_block
+        self.max_cache_bytes = max_cache_bytes
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_bytes = 0
+        # the matrix can be shared by threads (see instance.TravelTimeProviderRegistry)
+        self._cache_lock = threading.RLock()
+
+    @abstractmethod
+    def _load_blocks(self, block_indices: np.ndarray) -> List[np.ndarray]:
+        """
+        Loads the blocks of rows with the given indices. Each block is an array of shape (rows_per_block, column
+        count), the last block can be shorter.
+        """
+        pass
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self._cache_bytes
+
+    def get_block_capacity(self) -> int:
+        """
+        Returns the number of blocks that fit into the cache (at least one).
+        """
+        block_bytes = self.rows_per_block * self.shape[1] * self.dtype.itemsize
+        return max(1, self.max_cache_bytes // block_bytes)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def _get_blocks(self, block_indices: np.ndarray) -> Dict[int, np.ndarray]:
+        with self._cache_lock:
+            return self._get_blocks_locked(block_indices)
+
+    def _get_blocks_locked(self, block_indices: np.ndarray) -> Dict[int, np.ndarray]:
+        blocks = {}
+        missing = []
+        for block_index in block_indices:
+            block_index = int(block_index)
+            if block_index in self._cache:
+                self._cache.move_to_end(block_index)
+                blocks[block_index] = self._cache[block_index]
+            else:
+                missing.append(block_index)
+
+        if missing:
+            for block_index, block in zip(missing, self._load_blocks(np.array(missing))):
+                blocks[block_index] = block
+                self._cache[block_index] = block
+                self._cache_bytes += block.nbytes
+
+        # evict least recently used blocks, the blocks of the current request are returned regardless
+        while len(self._cache) > 1 and self._cache_bytes > self.max_cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.nbytes
+
+        return blocks
+
+    def get_row(self, row: int) -> np.ndarray:
+        block_index, row_in_block = divmod(int(row), self.rows_per_block)
+        return self._get_blocks(np.array([block_index]))[block_index][row_in_block]
+
+    def _gather(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        rows, cols = np.broadcast_arrays(rows, cols)
+        result = np.empty(rows.shape, dtype=self.dtype)
+        rows = rows.ravel()
+        cols = cols.ravel()
+        flat_result = result.reshape(-1)
+
+        # the queries are grouped by the block once, each block fills its contiguous range of the sorted queries
+        block_indices = rows // self.rows_per_block
+        order = np.argsort(block_indices, kind='stable')
+        sorted_blocks = block_indices[order]
+        unique_blocks, group_starts = np.unique(sorted_blocks, return_index=True)
+        group_ends = np.append(group_starts[1:], len(order))
+
+        # the blocks are processed in batches fitting into the cache
+        capacity = self.get_block_capacity()
+        for start in range(0, len(unique_blocks), capacity):
+            blocks = self._get_blocks(unique_blocks[start:start + capacity])
+            for group in range(start, min(start + capacity, len(unique_blocks))):
+                block_index = int(unique_blocks[group])
+                queries = order[group_starts[group]:group_ends[group]]
+                flat_result[queries] = blocks[block_index][
+                    rows[queries] - block_index * self.rows_per_block, cols[queries]
+                ]
+        return result
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            if np.ndim(key) == 0 and not isinstance(key, slice):
+                return self.get_row(key)
+            rows = np.arange(self.shape[0])[key] if isinstance(key, slice) else np.asarray(key)
+            return self._gather(rows[:, np.newaxis], np.arange(self.shape[1])[np.newaxis, :])
+
+        rows, cols = key
+        if np.ndim(rows) == 0 and np.ndim(cols) == 0:
+            return self.get_row(rows)[cols]
+        return self._gather(np.asarray(rows), np.asarray(cols))
+
+
+class ShortestPathMatrix(CachedRowMatrix):
+    """
+    Distance matrix computed on demand from the road graph. Each row is computed by a single-source Dijkstra search.
+    Unreachable nodes have the maximum value of the matrix type.
+    """
+
+    def __init__(self, graph: csr_matrix, max_cache_bytes: int, dtype=np.int32):
+        super().__init__(graph.shape, dtype, 1, max_cache_bytes)
+        self.graph = graph
+
+    def _load_blocks(self, block_indices: np.ndarray) -> List[np.ndarray]:
+        # the Dijkstra search returns float64 rows, so the batches of sources have to fit the budget as float64
+        batch_size = max(1, self.max_cache_bytes // (self.shape[1] * np.dtype(np.float64).itemsize))
+        blocks = []
+        for start in range(0, len(block_indices), batch_size):
+            rows = compute_shortest_path_rows(self.graph, block_indices[start:start + batch_size], self.dtype)
+            # each block owns its memory, so evicting it from the cache frees the memory
+            blocks.extend(row[np.newaxis, :].copy() for row in rows)
+        return blocks
+
+
+def compute_shortest_path_rows(graph: csr_matrix, sources: np.ndarray, dtype=np.int32) -> np.ndarray:
+    """
+    Computes the travel times from the sources to all nodes of the graph. Unreachable nodes have the maximum value of
+    the dtype.
+    """
+    travel_times = dijkstra(graph, directed=True, indices=sources)
+    travel_times[np.isinf(travel_times)] = np.iinfo(dtype).max
+    np.rint(travel_times, out=travel_times)
+    return travel_times.astype(dtype)
+
+
+_worker_graph: Optional[csr_matrix] = None
+
+
+def _init_dm_worker(graph: csr_matrix):
+    global _worker_graph
+    _worker_graph = graph
+
+
+def _compute_dm_block(task: Tuple[int, int, str]) -> Tuple[int, np.ndarray]:
+    start, end, dtype = task
+    return start, compute_shortest_path_rows(_worker_graph, np.arange(start, end), np.dtype(dtype))
+
+
+def build_dm(
+    graph: csr_matrix,
+    dm_filepath: Union[str, Path],
+    rows_per_block: int = 256,
+    processes: Optional[int] = None,
+    dtype=np.int32,
+    compression: Optional[str] = None
+) -> Path:
+    """
+    Computes the distance matrix of the road graph by many-source Dijkstra searches running on a process pool. Each
+    task computes a block of rows that is written to a chunked HDF5 dataset as soon as it is finished.
+
+    The matrix is built in a temporary file (<dm_filepath>.partial) that is renamed to the target path when all blocks
+    are computed. If the computation is interrupted, calling the function again resumes it from the finished blocks.
+
+    :param graph: road graph as a sparse adjacency matrix with travel times as weights (see load_edges_graph)
+    :param dm_filepath: target path of the distance matrix
+    :param rows_per_block: number of rows computed by a single task, also the chunk height of the dataset
+    :param processes: number of worker processes, all CPUs by default
+    :param dtype: type of the matrix values
+    :param compression: HDF5 compression filter of the dataset (e.g., 'lzf' or 'gzip')
+    :return: path to the distance matrix
+    """
+    node_count = graph.shape[0]
+    dtype = np.dtype(dtype)
+    partial_filepath = Path(f"{dm_filepath}.partial")
+    block_count = math.ceil(node_count / rows_per_block)
+    chunk_shape = (min(rows_per_block, node_count), node_count)
+
+    with h5py.File(partial_filepath, 'a') as dm_file:
+        if 'dm' in dm_file and dm_file['dm'].shape == (node_count, node_count) and dm_file['dm'].dtype == dtype \
+                and dm_file['dm'].chunks == chunk_shape:
+            dataset = dm_file['dm']
+            completed_blocks = np.array(dataset.attrs['completed_blocks'], dtype=bool)
+            logging.info(
+                "Resuming distance matrix computation in %s: %d of %d blocks already computed",
+                os.path.realpath(partial_filepath),
+                completed_blocks.sum(),
+                block_count
+            )
+        else:
+            if 'dm' in dm_file:
+                logging.warning("Discarding incompatible partial distance matrix %s", partial_filepath)
+                del dm_file['dm']
+            dataset = dm_file.create_dataset(
+                'dm',
+                shape=(node_count, node_count),
+                dtype=dtype,
+                chunks=chunk_shape,
+                compression=compression
+            )
+            completed_blocks = np.zeros(block_count, dtype=bool)
+            dataset.attrs['completed_blocks'] = completed_blocks
+
+        tasks = [
+            (block_index * rows_per_block, min((block_index + 1) * rows_per_block, node_count), dtype.str)
+            for block_index in np.flatnonzero(~completed_blocks)
+        ]
+        logging.info(
+            "Computing distance matrix for %d nodes: %d blocks of %d rows", node_count, len(tasks), rows_per_block
+        )
+
+        start_time = time.monotonic()
+        computed_rows = 0
+        with multiprocessing.Pool(processes, initializer=_init_dm_worker, initargs=(graph,)) as pool:
+            for start, rows in tqdm(pool.imap_unordered(_compute_dm_block, tasks), total=len(tasks), unit='block'):
+                dataset[start:start + len(rows)] = rows
+                completed_blocks[start // rows_per_block] = True
+                dataset.attrs['completed_blocks'] = completed_blocks
+                dm_file.flush()
+                computed_rows += len(rows)
+
+        elapsed = time.monotonic() - start_time
+        if computed_rows > 0:
+            logging.info(
+                "Computed %d rows in %.1f s (%.1f rows/s)", computed_rows, elapsed, computed_rows / max(elapsed, 1e-9)
+            )
+        del dataset.attrs['completed_blocks']
+
+    os.replace(partial_filepath, dm_filepath)
+    logging.info("Distance matrix saved to %s", os.path.realpath(dm_filepath))
+    return Path(dm_filepath)
+
+
+class HdfRowBlockMatrix(CachedRowMatrix):
+    """
+    Distance matrix read from a chunked (possibly compressed) HDF5 dataset on demand. The rows are read and
+    decompressed by whole chunks, and the decompressed blocks are kept in an LRU cache. The file stays open for the
+    lifetime of the matrix.
+    """
+
+    def __init__(self, dm_filepath: Union[str, Path], max_cache_bytes: int):
+        self.dm_file = h5py.File(dm_filepath, 'r')
+        self.dataset = self.dm_file[get_dm_dataset_name(self.dm_file)]
+        rows_per_block = self.dataset.chunks[0] if self.dataset.chunks is not None else 1
+        super().__init__(self.dataset.shape, self.dataset.dtype, rows_per_block, max_cache_bytes)
+
+    def _load_blocks(self, block_indices: np.ndarray) -> List[np.ndarray]:
+        return [
+            self.dataset[block_index * self.rows_per_block:(block_index + 1) * self.rows_per_block]
+            for block_index in block_indices
+        ]
+
+    def close(self):
+        self.dm_file.close()
+
+
+def save_chunked_dm(
+    dm_filepath: Union[str, Path],
+    chunked_dm_filepath: Union[str, Path],
+    rows_per_chunk: int = 64,
+    compression: Optional[str] = 'lzf',
+    compression_opts=None
+) -> Path:
+    """
+    Stores the distance matrix to a new HDF5 file in a chunked, compressed layout. Each chunk holds whole rows, so that
+    the rows can be read by HdfRowBlockMatrix without decompressing the whole matrix. The attributes and the node map
+    of the source matrix are preserved.
+
+    :param dm_filepath: path to the source HDF5 distance matrix
+    :param chunked_dm_filepath: target path
+    :param rows_per_chunk: number of rows in a chunk. Smaller chunks make random access cheaper, larger chunks compress
+    better.
+    :param compression: HDF5 compression filter, 'lzf' (fast) or 'gzip' (smaller), None for no compression
+    :param compression_opts: options of the compression filter, e.g., the gzip level
+    """
+    logging.info(
+        "Saving distance matrix %s to %s (chunk rows: %d, compression: %s)",
+        os.path.realpath(dm_filepath),
+        os.path.realpath(chunked_dm_filepath),
+        rows_per_chunk,
+        compression
+    )
+    with h5py.File(dm_filepath, 'r') as dm_file, h5py.File(chunked_dm_filepath, 'w') as chunked_file:
+        source = dm_file[get_dm_dataset_name(dm_file)]
+        dataset = chunked_file.create_dataset(
+            'dm',
+            shape=source.shape,
+            dtype=source.dtype,
+            chunks=(min(rows_per_chunk, source.shape[0]), source.shape[1]),
+            compression=compression,
+            compression_opts=compression_opts
+        )
+        for key, value in source.attrs.items():
+            dataset.attrs[key] = value
+
+        rows_per_copy = max(rows_per_chunk, (1024 // rows_per_chunk) * rows_per_chunk)
+        for start in range(0, source.shape[0], rows_per_copy):
+            dataset[start:start + rows_per_copy] = source[start:start + rows_per_copy]
+
+        if NODE_MAP_DATASET_NAME in dm_file:
+            chunked_file.create_dataset(NODE_MAP_DATASET_NAME, data=dm_file[NODE_MAP_DATASET_NAME][()])
+
+    return Path(chunked_dm_filepath)
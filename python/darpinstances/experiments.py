@@ -19,15 +19,15 @@ def load_experiment_config(path: Union[str,Path]):
         try:
             config = yaml.safe_load(config_file)
 
-            # check the file locations and make them absolute
-            os.chdir(os.path.dirname(path))
+            # check the file locations and make them absolute. The relative paths are relative to the config dir
+            config_dir = os.path.dirname(os.path.abspath(path))
+            config['instance'] = os.path.normpath(os.path.join(config_dir, config['instance']))
             check_file_exists(config['instance'])
-            config['instance'] = os.path.abspath(config['instance'])
 
             # if outdir is set in config, check that that it is correct
             if "outdir" in config:
+                config['outdir'] = os.path.normpath(os.path.join(config_dir, config['outdir']))
                 check_file_exists(config['outdir'])
-                config['outdir'] = os.path.abspath(config['outdir'])
             # othervise use the config file directory as outpath
             else:
                 config['outdir'] = os.path.dirname(path)
@@ -7,7 +7,7 @@ import numpy as np
 import h5py
 from pathlib import Path
 
-from typing import Tuple, Dict, Iterable, Union, List
+from typing import Tuple, Dict, Iterable, Iterator, Union, List, TextIO
 
 import yaml
 
@@ -25,6 +25,116 @@ def load_json(filepath: Union[str, Path]) -> Union[Dict, List]:
 	return json.load(open(filepath, encoding="utf-8"))
 
 
+def save_json(data: Union[Dict, List], filepath: Union[str, Path]):
+	logging.info("Saving json file to: {}".format(os.path.realpath(filepath)))
+	with open(filepath, 'w', encoding="utf-8") as file:
+		json.dump(data, file)
+
+
+class JsonStreamReader:
+	"""
+	Incremental reader of a large JSON document. The file is read in chunks and only the currently parsed value is kept
+	in memory, so the members of a top-level object and the elements of its arrays can be processed one by one, e.g.:
+
+		reader = JsonStreamReader(file)
+		for key in reader.iter_object():
+			if key == 'plans':
+				for plan in reader.iter_array():
+					...
+			else:
+				value = reader.read_value()
+
+	The value of each object member has to be consumed (by read_value or by a complete iteration of iter_array)
+	before the next member is requested. Unconsumed values are skipped.
+	"""
+
+	WHITESPACE = ' \t\n\r'
+
+	def __init__(self, file: TextIO, chunk_size: int = 1 << 20):
+		self._file = file
+		self._chunk_size = chunk_size
+		self._buffer = ''
+		self._position = 0
+		self._eof = False
+		self._decoder = json.JSONDecoder()
+		self._consumed_values = 0
+
+	def _read_more(self, size: int) -> bool:
+		if self._eof:
+			return False
+		# drop the parsed part of the buffer
+		self._buffer = self._buffer[self._position:]
+		self._position = 0
+		chunk = self._file.read(size)
+		if not chunk:
+			self._eof = True
+			return False
+		self._buffer += chunk
+		return True
+
+	def _peek(self) -> str:
+		"""Returns the next non-whitespace character without consuming it, or an empty string at the end of the file."""
+		while True:
+			while self._position < len(self._buffer) and self._buffer[self._position] in self.WHITESPACE:
+				self._position += 1
+			if self._position < len(self._buffer):
+				return self._buffer[self._position]
+			if not self._read_more(self._chunk_size):
+				return ''
+
+	def _expect(self, chars: str) -> str:
+		char = self._peek()
+		if not char or char not in chars:
+			raise ValueError(f"Invalid JSON: expected one of '{chars}', found '{char}'")
+		self._position += 1
+		return char
+
+	def read_value(self):
+		"""Reads the next complete JSON value."""
+		self._peek()
+		while True:
+			try:
+				value, end = self._decoder.raw_decode(self._buffer, self._position)
+				# a number at the end of the buffer (e.g., "1" of "1.5" or "1e5") may continue in the next chunk
+				if self._eof or (end < len(self._buffer) and self._buffer[end] not in '.eE+-'):
+					self._position = end
+					self._consumed_values += 1
+					return value
+			except json.JSONDecodeError:
+				if self._eof:
+					raise
+			# the value is incomplete: at least double the buffered part, so each value is re-parsed only a few times
+			self._read_more(max(self._chunk_size, len(self._buffer) - self._position))
+
+	def iter_array(self) -> Iterator:
+		"""Yields the elements of the next JSON array one by one."""
+		self._expect('[')
+		if self._peek() == ']':
+			self._position += 1
+		else:
+			while True:
+				yield self.read_value()
+				if self._expect(',]') == ']':
+					break
+		self._consumed_values += 1
+
+	def iter_object(self) -> Iterator[str]:
+		"""Yields the keys of the next JSON object. The value of each key has to be consumed by the caller."""
+		self._expect('{')
+		if self._peek() == '}':
+			self._position += 1
+			return
+		while True:
+			key = self.read_value()
+			self._expect(':')
+			consumed_values = self._consumed_values
+			yield key
+			if self._consumed_values == consumed_values:
+				self.read_value()
+			if self._expect(',}') == '}':
+				return
+
+
 def load_resource(package_path: str, filename: str) -> str:
 	try:
 		resource = pkgutil.get_data(package_path, filename)
@@ -2,13 +2,16 @@
 import logging
 import math
 import os
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from enum import Enum
 from functools import singledispatchmethod
 from io import TextIOWrapper
 from pathlib import Path
-from typing import Iterable, Dict, List, Optional, Sequence, TextIO
+from typing import Iterable, Iterator, Dict, List, Optional, Sequence, TextIO, Tuple, Union
 
 import darpinstances.log
 import geojson
@@ -16,6 +19,9 @@ import h5py
 import numpy as np
 import pandas as pd
 import yaml
+import darpinstances.distance_matrix
+import darpinstances.instance_snapshot
+import darpinstances.request_index
 from darpinstances.inout import check_file_exists
 from darpinstances.instance_objects import Coordinate, Request, Vehicle
 from pyproj import Transformer
@@ -24,6 +30,15 @@ from tqdm.autonotebook import tqdm
 
 
 class TravelTimeProvider(ABC):
+    applied_travel_time_divider: int = 1
+    """The travel time divider already applied to the provided travel times (see DARPInstanceConfiguration)."""
+
+    source_provider: Optional['TravelTimeProvider'] = None
+    """
+    Provider of the exact travel times for providers with rounded travel times (compacted distance matrices). The
+    instance loaders compute the travel times and time windows of the requests from it, so that the instance does not
+    depend on how the distance matrix is stored.
+    """
 
     @abstractmethod
     def get_travel_time(self, from_position, to_position) -> int:
@@ -35,6 +50,27 @@ class TravelTimeProvider(ABC):
         """
         pass
 
+    def get_travel_times(self, from_positions: Sequence, to_positions: Sequence) -> np.ndarray:
+        """
+        Provides travel times between pairs of locations, i.e., the i-th travel time is the travel time between
+        @param from_positions[i] and @param to_positions[i]. Providers should override this method with a vectorized
+        implementation.
+        :param from_positions: sequence of start locations
+        :param to_positions: sequence of target locations of the same length
+        :return: array of travel times in the same units as get_travel_time
+        """
+        return np.array([self.get_travel_time(from_position, to_position)
+            for from_position, to_position in zip(from_positions, to_positions)])
+
+    def get_travel_time_matrix(self, from_positions: Sequence, to_positions: Sequence) -> np.ndarray:
+        """
+        Provides the block of travel times between all pairs of locations from @param from_positions and
+        @param to_positions.
+        :return: matrix of shape (len(from_positions), len(to_positions))
+        """
+        return np.array([[self.get_travel_time(from_position, to_position) for to_position in to_positions]
+            for from_position in from_positions]).reshape(len(from_positions), len(to_positions))
+
 
 class EuclideanTravelTimeProvider(TravelTimeProvider):
     """
@@ -55,6 +91,48 @@ class EuclideanTravelTimeProvider(TravelTimeProvider):
         travel_time = round(distance * self.coordinate_resolution)
         return travel_time
 
+    def get_travel_times(self, from_positions: Sequence[Coordinate], to_positions: Sequence[Coordinate]) -> np.ndarray:
+        from_coords = _get_coordinate_array(from_positions)
+        to_coords = _get_coordinate_array(to_positions)
+        distances = np.hypot(from_coords[:, 0] - to_coords[:, 0], from_coords[:, 1] - to_coords[:, 1])
+        return np.round(distances * self.coordinate_resolution).astype(np.int64)
+
+    def get_travel_time_matrix(
+        self, from_positions: Sequence[Coordinate], to_positions: Sequence[Coordinate]
+    ) -> np.ndarray:
+        from_coords = _get_coordinate_array(from_positions)
+        to_coords = _get_coordinate_array(to_positions)
+        distances = np.hypot(
+            from_coords[:, 0, np.newaxis] - to_coords[np.newaxis, :, 0],
+            from_coords[:, 1, np.newaxis] - to_coords[np.newaxis, :, 1]
+        )
+        return np.round(distances * self.coordinate_resolution).astype(np.int64)
+
+
+def _get_coordinate_array(positions: Sequence[Coordinate]) -> np.ndarray:
+    """
+    Converts the positions to an array of shape (n, 2). Arrays of coordinates are returned as they are.
+    """
+    if isinstance(positions, np.ndarray) and positions.dtype != object:
+        return positions.reshape(-1, 2)
+    return np.array([(position.get_x(), position.get_y()) for position in positions], dtype=float).reshape(-1, 2)
+
+
+class DMMode(Enum):
+    """
+    Determines how the distance matrix is accessed.
+    """
+    LOAD = 'load'
+    """The whole matrix is read into memory."""
+    MMAP = 'mmap'
+    """The matrix is memory-mapped and only the rows that are actually accessed are paged in."""
+    SHARED = 'shared'
+    """The matrix is loaded once into shared memory and shared by all processes (see SharedDMRegistry)."""
+    CHUNKED = 'chunked'
+    """The rows are read from a chunked (compressed) HDF5 file on demand and cached (see HdfRowBlockMatrix)."""
+    GRAPH = 'graph'
+    """No matrix is used, the travel times are computed on demand from the road graph (see GraphTravelTimeProvider)."""
+
 
 class MatrixTravelTimeProvider(TravelTimeProvider):
     """
@@ -70,25 +148,245 @@ class MatrixTravelTimeProvider(TravelTimeProvider):
     def from_hdf(cls, path_to_dm: str):
         # dm = pd.read_hdf(path_to_dm, dtype=np.int32)
         with h5py.File(path_to_dm, 'r') as dm_file:
-            a_group_key = list(dm_file.keys())[0]
+            a_group_key = darpinstances.distance_matrix.get_dm_dataset_name(dm_file)
             dm_arr = dm_file[a_group_key][()]
-            return cls(dm_arr)
+        return cls._with_attributes(dm_arr, path_to_dm)
+
+    @classmethod
+    def _with_attributes(cls, dm: np.ndarray, path_to_hdf: Union[str, Path]):
+        attributes = darpinstances.distance_matrix.read_dm_attributes(path_to_hdf)
+        node_map = darpinstances.distance_matrix.read_node_map(path_to_hdf)
+        return cls(dm, attributes['unit'], attributes['travel_time_divider'], node_map)
+
+    @classmethod
+    def from_npy(cls, path_to_dm: str):
+        return cls(np.load(path_to_dm))
+
+    @classmethod
+    def open_mmap(cls, path_to_dm: Union[str, Path], export_if_needed: bool = True):
+        """
+        Opens the distance matrix memory-mapped, so that the memory usage depends on the nodes that are actually used,
+        not on the size of the matrix. Moreover, the mapped pages are shared by all processes using the same file.
 
-    def __init__(self, dm: np.ndarray):
+        Raw .npy files are mapped directly. HDF5 files are mapped directly if the dataset is stored contiguously and
+        uncompressed. Otherwise, the matrix is exported to a .npy file next to the HDF5 file first (only once, the
+        export is reused by subsequent calls).
+
+        :param path_to_dm: path to the distance matrix file (.h5 or .npy)
+        :param export_if_needed: if False, an exception is raised instead of exporting the matrix to a .npy file
+        """
+        path_to_dm = Path(path_to_dm)
+        if path_to_dm.suffix == '.npy':
+            return cls(np.load(path_to_dm, mmap_mode='r'))
+
+        npy_path = darpinstances.distance_matrix.get_npy_export_path(path_to_dm)
+        if npy_path.exists() and npy_path.stat().st_mtime >= path_to_dm.stat().st_mtime:
+            logging.info("Memory-mapping the .npy export of the distance matrix: %s", npy_path)
+            return cls._with_attributes(np.load(npy_path, mmap_mode='r'), path_to_dm)
+
+        dm_arr = darpinstances.distance_matrix.open_hdf_memmap(path_to_dm)
+        if dm_arr is not None:
+            return cls._with_attributes(dm_arr, path_to_dm)
+
+        if not export_if_needed:
+            raise ValueError(f"Distance matrix in {path_to_dm} cannot be memory-mapped (it is chunked or compressed)")
+
+        npy_path = darpinstances.distance_matrix.export_hdf_to_npy(path_to_dm, npy_path)
+        return cls._with_attributes(np.load(npy_path, mmap_mode='r'), path_to_dm)
+
+    @classmethod
+    def open_chunked(cls, path_to_dm: Union[str, Path], max_cache_bytes: int = 1_000_000_000):
+        """
+        Opens the distance matrix stored in the chunked HDF5 layout (see darpinstances.distance_matrix.save_chunked_dm)
+        for out-of-core access. The rows are read by chunks on demand and the decompressed chunks are kept in an LRU
+        cache.
+
+        :param path_to_dm: path to the HDF5 distance matrix
+        :param max_cache_bytes: memory budget of the cache of decompressed row blocks
+        """
+        dm_arr = darpinstances.distance_matrix.HdfRowBlockMatrix(path_to_dm, max_cache_bytes)
+        return cls._with_attributes(dm_arr, path_to_dm)
+
+    @classmethod
+    def from_shared_memory(
+        cls,
+        path_to_dm: Union[str, Path],
+        registry: Optional[darpinstances.distance_matrix.SharedDMRegistry] = None
+    ):
+        """
+        Creates the provider using a zero-copy view of the distance matrix stored in shared memory. The matrix is
+        loaded into shared memory by the first process that requests it. The reference should be released by
+        release_shared_memory() once the provider is no longer needed.
+
+        :param path_to_dm: path to the distance matrix file
+        :param registry: shared memory registry, the process-wide registry is used by default
+        """
+        if registry is None:
+            registry = darpinstances.distance_matrix.shared_dm_registry
+        dm_arr = registry.acquire(path_to_dm)
+        if Path(path_to_dm).suffix in ('.csv', '.npy'):
+            provider = cls(dm_arr)
+        else:
+            try:
+                provider = cls._with_attributes(dm_arr, path_to_dm)
+            except BaseException:
+                registry.release(path_to_dm)
+                raise
+        provider.shared_dm_registry = registry
+        provider.shared_dm_filepath = path_to_dm
+        return provider
+
+    def __init__(
+        self,
+        dm: np.ndarray,
+        unit: int = 1,
+        applied_travel_time_divider: int = 1,
+        node_map: Optional[np.ndarray] = None,
+        source_provider: Optional[TravelTimeProvider] = None
+    ):
+        """
+        :param dm: distance matrix
+        :param unit: travel time represented by one unit of the stored values (for matrices compacted with scaling)
+        :param applied_travel_time_divider: travel time divider already applied to the stored values
+        :param node_map: for matrices restricted to a subset of nodes, sorted array of the global node indices of the
+        matrix rows. The provider then translates the global node indices to the matrix indices.
+        :param source_provider: for compacted matrices, the provider of the exact travel times (see
+        TravelTimeProvider.source_provider)
+        """
         self.dm = dm
+        self.unit = unit
+        self.applied_travel_time_divider = applied_travel_time_divider
+        self.node_map = node_map
+        self.source_provider = source_provider
+        self.shared_dm_registry: Optional[darpinstances.distance_matrix.SharedDMRegistry] = None
+        self.shared_dm_filepath: Optional[Union[str, Path]] = None
+        self.local_indices = None if node_map is None else {int(node): i for i, node in enumerate(node_map)}
+
+    @property
+    def is_shared(self) -> bool:
+        """Whether the matrix is a view of a shared memory block (see from_shared_memory)."""
+        return self.shared_dm_registry is not None
+
+    def release_shared_memory(self):
+        """
+        Releases the reference to the shared memory block of the matrix acquired by from_shared_memory. The provider
+        must not be used afterwards. Does nothing for the providers that do not use shared memory.
+        """
+        if self.shared_dm_registry is not None:
+            self.shared_dm_registry.release(self.shared_dm_filepath)
+            self.shared_dm_registry = None
+
+    def _to_local_indices(self, node_indices: np.ndarray) -> np.ndarray:
+        if self.node_map is None:
+            return node_indices
+        local_indices = np.searchsorted(self.node_map, node_indices)
+        local_indices[local_indices == len(self.node_map)] = 0
+        missing = self.node_map[local_indices] != node_indices
+        if np.any(missing):
+            raise KeyError(f"Nodes {np.asarray(node_indices)[missing][:10]} are not in the distance matrix")
+        return local_indices
+
+    def to_compact(
+        self,
+        travel_time_divider: int = 1,
+        dtype=np.uint16,
+        allow_scaling: bool = True,
+        source_provider: Optional[TravelTimeProvider] = None
+    ):
+        """
+        Returns a new provider with the distance matrix converted to a compact type and the travel time divider
+        applied (see darpinstances.distance_matrix.compact_dm).
+
+        :param source_provider: provider of the exact travel times, from which the instance loaders compute the time
+        windows of the requests (see TravelTimeProvider.source_provider). By default, it is this provider, so the
+        uncompacted matrix stays in memory. A provider reading the matrix file on demand saves the memory.
+        """
+        if self.unit != 1 or self.applied_travel_time_divider != 1:
+            raise ValueError("The distance matrix is already compacted")
+        compacted, unit = darpinstances.distance_matrix.compact_dm(self.dm, travel_time_divider, dtype, allow_scaling)
+        return MatrixTravelTimeProvider(
+            compacted, unit, travel_time_divider, self.node_map, self if source_provider is None else source_provider
+        )
 
     @singledispatchmethod
     def get_travel_time(self, from_index: int, to_index: int):
-        return self.dm[from_index][to_index]
+        if self.local_indices is not None:
+            from_index = self.local_indices[from_index]
+            to_index = self.local_indices[to_index]
+        if self.unit == 1:
+            return self.dm[from_index][to_index]
+        return int(self.dm[from_index][to_index]) * self.unit
+
+    def get_travel_times(self, from_positions: Sequence, to_positions: Sequence) -> np.ndarray:
+        """
+        Vectorized travel time lookup. The positions can be node indices or Node objects.
+        """
+        travel_times = self.dm[
+            self._to_local_indices(get_node_indices(from_positions)),
+            self._to_local_indices(get_node_indices(to_positions))
+        ]
+        return travel_times if self.unit == 1 else travel_times.astype(np.int64) * self.unit
+
+    def get_travel_time_matrix(self, from_positions: Sequence, to_positions: Sequence) -> np.ndarray:
+        travel_times = self.dm[np.ix_(
+            self._to_local_indices(get_node_indices(from_positions)),
+            self._to_local_indices(get_node_indices(to_positions))
+        )]
+        return travel_times if self.unit == 1 else travel_times.astype(np.int64) * self.unit
 
     @classmethod
-    def read_from_file(cls, dm_filepath: str):
+    def read_from_file(
+        cls, dm_filepath: Union[str, Path], mode: DMMode = DMMode.LOAD, max_cache_bytes: int = 1_000_000_000
+    ):
+        dm_filepath = str(dm_filepath)
+        if mode == DMMode.MMAP:
+            return cls.open_mmap(dm_filepath)
+        if mode == DMMode.SHARED:
+            return cls.from_shared_memory(dm_filepath)
+        if mode == DMMode.CHUNKED:
+            return cls.open_chunked(dm_filepath, max_cache_bytes)
         if dm_filepath.endswith('csv'):
             return cls.from_csv(dm_filepath)
+        elif dm_filepath.endswith('npy'):
+            return cls.from_npy(dm_filepath)
         else:
             return cls.from_hdf(dm_filepath)
 
 
+class GraphTravelTimeProvider(MatrixTravelTimeProvider):
+    """
+    Travel time provider for areas too large for a full distance matrix. The travel times are computed on demand by
+    single-source shortest path searches over the road graph. The computed rows of the distance matrix are kept in an
+    LRU cache with a bounded memory budget.
+    """
+
+    DEFAULT_CACHE_SIZE = 1_000_000_000
+    """Default memory budget of the row cache in bytes."""
+
+    @classmethod
+    def from_edges_csv(
+        cls, path_to_edges: Union[str, Path], node_count: Optional[int] = None, max_cache_bytes: int = DEFAULT_CACHE_SIZE
+    ):
+        """
+        :param path_to_edges: path to the map edges file (<area_dir>/map/edges.csv)
+        :param node_count: number of nodes in the graph, determined from the map files by default
+        :param max_cache_bytes: memory budget of the cache of computed rows
+        """
+        return cls(darpinstances.distance_matrix.load_edges_graph(path_to_edges, node_count), max_cache_bytes)
+
+    def __init__(self, graph, max_cache_bytes: int = DEFAULT_CACHE_SIZE):
+        super().__init__(darpinstances.distance_matrix.ShortestPathMatrix(graph, max_cache_bytes))
+
+    def to_compact(
+        self,
+        travel_time_divider: int = 1,
+        dtype=np.uint16,
+        allow_scaling: bool = True,
+        source_provider: Optional[TravelTimeProvider] = None
+    ):
+        raise ValueError("The graph travel time provider has no distance matrix to compact")
+
+
 class DARPInstanceConfiguration:
     def __init__(
         self,
@@ -117,20 +415,387 @@ class DARPInstanceConfiguration:
         self.vehicle_capacity = vehicle_capacity
 
 
+MISSING_TIME = np.iinfo(np.int64).min
+"""Value of the missing times (e.g., undefined vehicle operation start) in the columnar instance representation."""
+
+
+def _to_seconds(times: Sequence[Optional[datetime]], time_origin: datetime) -> np.ndarray:
+    """
+    Converts the times to whole seconds since time_origin, rounded down. Missing times are represented by MISSING_TIME.
+    """
+    time_array = np.array(times, dtype='datetime64[ns]')
+    seconds = (time_array - np.datetime64(time_origin, 'ns')).astype('timedelta64[s]').astype(np.int64)
+    seconds[np.isnat(time_array)] = MISSING_TIME
+    return seconds
+
+
+def _to_datetimes(seconds: np.ndarray, time_origin: datetime) -> List[Optional[datetime]]:
+    times = (np.datetime64(time_origin, 's') + seconds.astype('timedelta64[s]')).astype('datetime64[us]').tolist()
+    missing = seconds == MISSING_TIME
+    if missing.any():
+        times = [None if is_missing else time for time, is_missing in zip(times, missing.tolist())]
+    return times
+
+
+def _times_to_seconds(times: Sequence, time_origin: datetime, integer_times: bool) -> np.ndarray:
+    """Converts the object times (datetimes, or seconds since time_origin if integer_times) to the column times."""
+    if integer_times:
+        return np.fromiter(
+            (MISSING_TIME if time is None else time for time in times), dtype=np.int64, count=len(times)
+        )
+    return _to_seconds(times, time_origin)
+
+
+def _seconds_to_times(seconds: np.ndarray, time_origin: datetime, integer_times: bool) -> list:
+    """Converts the column times to the object times (datetimes, or seconds since time_origin if integer_times)."""
+    if integer_times:
+        return [None if time == MISSING_TIME else time for time in seconds.tolist()]
+    return _to_datetimes(seconds, time_origin)
+
+
+def _get_time_origin(start_time: Optional[datetime], earliest_pickup_time: Optional[datetime]) -> datetime:
+    """
+    Returns the origin of the integer instance times: the instance start time if defined, otherwise the earliest
+    pickup time truncated to whole seconds.
+    """
+    if start_time is not None:
+        return start_time
+    if earliest_pickup_time is not None:
+        return earliest_pickup_time.replace(microsecond=0)
+    return datetime(1970, 1, 1)
+
+
+class RequestColumns:
+    """
+    Columnar (struct-of-arrays) representation of the instance requests. The i-th element of each array belongs to the
+    i-th request. The times are whole seconds since time_origin, the missing required vehicle is represented by -1.
+    """
+
+    def __init__(
+        self,
+        time_origin: datetime,
+        index: np.ndarray,
+        pickup_id: np.ndarray,
+        pickup_node: np.ndarray,
+        pickup_min_time: np.ndarray,
+        pickup_max_time: np.ndarray,
+        drop_off_id: np.ndarray,
+        drop_off_node: np.ndarray,
+        drop_off_max_time: np.ndarray,
+        min_travel_time: np.ndarray,
+        pickup_service_time: Optional[np.ndarray] = None,
+        drop_off_service_time: Optional[np.ndarray] = None,
+        equipment: Optional[np.ndarray] = None,
+        required_vehicle_id: Optional[np.ndarray] = None
+    ):
+        size = len(index)
+        self.time_origin = time_origin
+        self.index = np.asarray(index, dtype=np.int64)
+        self.pickup_id = np.asarray(pickup_id, dtype=np.int64)
+        self.pickup_node = np.asarray(pickup_node, dtype=np.int64)
+        self.pickup_min_time = np.asarray(pickup_min_time, dtype=np.int64)
+        self.pickup_max_time = np.asarray(pickup_max_time, dtype=np.int64)
+        self.drop_off_id = np.asarray(drop_off_id, dtype=np.int64)
+        self.drop_off_node = np.asarray(drop_off_node, dtype=np.int64)
+        self.drop_off_max_time = np.asarray(drop_off_max_time, dtype=np.int64)
+        self.min_travel_time = np.asarray(min_travel_time, dtype=np.int64)
+        self.pickup_service_time = np.zeros(size, dtype=np.int64) if pickup_service_time is None \
+            else np.asarray(pickup_service_time, dtype=np.int64)
+        self.drop_off_service_time = np.zeros(size, dtype=np.int64) if drop_off_service_time is None \
+            else np.asarray(drop_off_service_time, dtype=np.int64)
+        self.equipment = np.zeros(size, dtype=np.int64) if equipment is None \
+            else np.asarray(equipment, dtype=np.int64)
+        self.required_vehicle_id = np.full(size, -1, dtype=np.int64) if required_vehicle_id is None \
+            else np.asarray(required_vehicle_id, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def from_requests(cls, requests: Sequence[Request], time_origin: datetime, integer_times: bool = False):
+        """
+        @param integer_times: whether the times of the requests are seconds since time_origin instead of datetimes
+        """
+        pickups = [request.pickup_action for request in requests]
+        drop_offs = [request.drop_off_action for request in requests]
+        return cls(
+            time_origin,
+            np.fromiter((request.index for request in requests), dtype=np.int64, count=len(requests)),
+            np.fromiter((action.id for action in pickups), dtype=np.int64, count=len(requests)),
+            get_node_indices([action.node for action in pickups]),
+            _times_to_seconds([action.min_time for action in pickups], time_origin, integer_times),
+            _times_to_seconds([action.max_time for action in pickups], time_origin, integer_times),
+            np.fromiter((action.id for action in drop_offs), dtype=np.int64, count=len(requests)),
+            get_node_indices([action.node for action in drop_offs]),
+            _times_to_seconds([action.max_time for action in drop_offs], time_origin, integer_times),
+            np.fromiter((request.min_travel_time for request in requests), dtype=np.int64, count=len(requests)),
+            np.fromiter((action.service_time for action in pickups), dtype=np.int64, count=len(requests)),
+            np.fromiter((action.service_time for action in drop_offs), dtype=np.int64, count=len(requests)),
+            np.fromiter((request.equipment for request in requests), dtype=np.int64, count=len(requests)),
+            np.fromiter(
+                (-1 if request.required_vehicle_id is None else request.required_vehicle_id for request in requests),
+                dtype=np.int64,
+                count=len(requests)
+            )
+        )
+
+    def to_requests(self, integer_times: bool = False) -> List[Request]:
+        """
+        Creates the Request objects. The nodes are represented by Node objects and the times by datetimes, or by
+        seconds since time_origin if integer_times.
+        """
+        required_vehicle_ids = [
+            None if vehicle_id == -1 else vehicle_id for vehicle_id in self.required_vehicle_id.tolist()
+        ]
+        return [
+            Request(*columns) for columns in zip(
+                self.index.tolist(),
+                self.pickup_id.tolist(),
+                [Node(node) for node in self.pickup_node.tolist()],
+                _seconds_to_times(self.pickup_min_time, self.time_origin, integer_times),
+                _seconds_to_times(self.pickup_max_time, self.time_origin, integer_times),
+                self.drop_off_id.tolist(),
+                [Node(node) for node in self.drop_off_node.tolist()],
+                _seconds_to_times(self.drop_off_max_time, self.time_origin, integer_times),
+                self.min_travel_time.tolist(),
+                self.pickup_service_time.tolist(),
+                self.drop_off_service_time.tolist(),
+                self.equipment.tolist(),
+                required_vehicle_ids
+            )
+        ]
+
+
+class VehicleColumns:
+    """
+    Columnar representation of the instance vehicles. The operation times are whole seconds since time_origin, with
+    MISSING_TIME for undefined times. The configurations of the i-th vehicle are
+    configuration_offsets[i]:configuration_offsets[i + 1], and the equipment of the j-th configuration is
+    equipment[equipment_offsets[j]:equipment_offsets[j + 1]].
+    """
+
+    def __init__(
+        self,
+        time_origin: datetime,
+        index: np.ndarray,
+        initial_position: np.ndarray,
+        capacity: np.ndarray,
+        operation_start: Optional[np.ndarray] = None,
+        operation_end: Optional[np.ndarray] = None,
+        configuration_offsets: Optional[np.ndarray] = None,
+        equipment_offsets: Optional[np.ndarray] = None,
+        equipment: Optional[np.ndarray] = None
+    ):
+        size = len(index)
+        self.time_origin = time_origin
+        self.index = np.asarray(index, dtype=np.int64)
+        self.initial_position = np.asarray(initial_position, dtype=np.int64)
+        self.capacity = np.asarray(capacity, dtype=np.int64)
+        self.operation_start = np.full(size, MISSING_TIME, dtype=np.int64) if operation_start is None \
+            else np.asarray(operation_start, dtype=np.int64)
+        self.operation_end = np.full(size, MISSING_TIME, dtype=np.int64) if operation_end is None \
+            else np.asarray(operation_end, dtype=np.int64)
+        self.configuration_offsets = np.zeros(size + 1, dtype=np.int64) if configuration_offsets is None \
+            else np.asarray(configuration_offsets, dtype=np.int64)
+        self.equipment_offsets = np.zeros(1, dtype=np.int64) if equipment_offsets is None \
+            else np.asarray(equipment_offsets, dtype=np.int64)
+        self.equipment = np.zeros(0, dtype=np.int64) if equipment is None else np.asarray(equipment, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def from_vehicles(cls, vehicles: Sequence[Vehicle], time_origin: datetime, integer_times: bool = False):
+        configuration_offsets = [0]
+        equipment_offsets = [0]
+        equipment = []
+        for vehicle in vehicles:
+            for configuration in vehicle.configurations:
+                equipment.extend(configuration)
+                equipment_offsets.append(len(equipment))
+            configuration_offsets.append(len(equipment_offsets) - 1)
+
+        return cls(
+            time_origin,
+            np.fromiter((vehicle.index for vehicle in vehicles), dtype=np.int64, count=len(vehicles)),
+            get_node_indices([vehicle.initial_position for vehicle in vehicles]),
+            np.fromiter((vehicle.capacity for vehicle in vehicles), dtype=np.int64, count=len(vehicles)),
+            _times_to_seconds([vehicle.operation_start for vehicle in vehicles], time_origin, integer_times),
+            _times_to_seconds([vehicle.operation_end for vehicle in vehicles], time_origin, integer_times),
+            configuration_offsets,
+            equipment_offsets,
+            equipment
+        )
+
+    def to_vehicles(self, integer_times: bool = False) -> List[Vehicle]:
+        configuration_offsets = self.configuration_offsets.tolist()
+        equipment_offsets = self.equipment_offsets.tolist()
+        equipment = self.equipment.tolist()
+        vehicles = []
+        for vehicle_index, (index, position, capacity, operation_start, operation_end) in enumerate(zip(
+            self.index.tolist(),
+            self.initial_position.tolist(),
+            self.capacity.tolist(),
+            _seconds_to_times(self.operation_start, self.time_origin, integer_times),
+            _seconds_to_times(self.operation_end, self.time_origin, integer_times)
+        )):
+            configurations = [
+                equipment[equipment_offsets[configuration]:equipment_offsets[configuration + 1]]
+                for configuration in range(
+                    configuration_offsets[vehicle_index], configuration_offsets[vehicle_index + 1]
+                )
+            ]
+            vehicles.append(Vehicle(index, Node(position), capacity, configurations, operation_start, operation_end))
+        return vehicles
+
+
 class DARPInstance:
+    """
+    DARP instance. The requests and vehicles are available both as objects (requests, vehicles) and as columns
+    (request_columns, vehicle_columns). The instance can be created from either of them, and the other representation
+    is created lazily on the first access.
+
+    The times of the request and vehicle objects and of the plans loaded for the instance are datetimes, or, if
+    integer_times is set, whole seconds since time_origin. The integer times avoid the datetime and timedelta
+    arithmetic in the solution loading and checking; datetimes are then used only for reading and writing files.
+    """
 
     def __init__(
         self,
-        requests: Iterable[Request],
-        vehicles: Sequence[Vehicle],
+        requests: Optional[Sequence[Request]],
+        vehicles: Optional[Sequence[Vehicle]],
         travel_time_provider: TravelTimeProvider,
-        darp_instance_config: DARPInstanceConfiguration
+        darp_instance_config: DARPInstanceConfiguration,
+        request_columns: Optional[RequestColumns] = None,
+        vehicle_columns: Optional[VehicleColumns] = None,
+        time_origin: Optional[datetime] = None,
+        integer_times: bool = False
     ):
-        self.requests = requests
-        self.vehicles: Sequence[Vehicle] = vehicles
+        """
+        @param time_origin: origin of the integer times, required if integer_times is set and the request columns are
+        not provided
+        @param integer_times: whether the times of the request and vehicle objects are seconds since time_origin
+        """
+        if requests is None and request_columns is None:
+            raise ValueError("Either the requests or the request columns have to be provided")
+        if vehicles is None and vehicle_columns is None:
+            raise ValueError("Either the vehicles or the vehicle columns have to be provided")
+        self._requests = requests
+        self._vehicles = vehicles
+        self._request_columns = request_columns
+        self._vehicle_columns = vehicle_columns
+        self._request_map = None
+        self._request_index = None
+        self._time_origin = request_columns.time_origin if request_columns is not None else time_origin
+        if integer_times and self._time_origin is None:
+            raise ValueError("The time origin has to be provided for the integer times")
+        self.integer_times = integer_times
         self.travel_time_provider = travel_time_provider
         self.darp_instance_config = darp_instance_config
-        self.request_map = {r.index: r for r in requests}
+
+    @property
+    def time_origin(self) -> datetime:
+        """
+        Origin of the integer times and of the times in the columnar representation: the instance start time if
+        defined, otherwise the earliest pickup time truncated to whole seconds.
+        """
+        if self._time_origin is None:
+            earliest_pickup_time = min(
+                (request.pickup_action.min_time for request in self._requests), default=None
+            )
+            self._time_origin = _get_time_origin(self.darp_instance_config.start_time, earliest_pickup_time)
+        return self._time_origin
+
+    def get_instance_time(self, time: Optional[datetime]):
+        """Converts the datetime to the time representation of the instance objects (see integer_times)."""
+        if time is None or not self.integer_times:
+            return time
+        return (time - self.time_origin) // timedelta(seconds=1)
+
+    @property
+    def requests(self) -> Sequence[Request]:
+        if self._requests is None:
+            self._requests = self._request_columns.to_requests(self.integer_times)
+        return self._requests
+
+    @requests.setter
+    def requests(self, requests: Sequence[Request]):
+        self._requests = requests
+        self._request_columns = None
+        self._request_map = None
+        self._request_index = None
+
+    @property
+    def vehicles(self) -> Sequence[Vehicle]:
+        if self._vehicles is None:
+            self._vehicles = self._vehicle_columns.to_vehicles(self.integer_times)
+        return self._vehicles
+
+    @vehicles.setter
+    def vehicles(self, vehicles: Sequence[Vehicle]):
+        self._vehicles = vehicles
+        self._vehicle_columns = None
+
+    @property
+    def request_columns(self) -> RequestColumns:
+        if self._request_columns is None:
+            self._request_columns = RequestColumns.from_requests(self._requests, self.time_origin, self.integer_times)
+        return self._request_columns
+
+    @property
+    def vehicle_columns(self) -> VehicleColumns:
+        if self._vehicle_columns is None:
+            self._vehicle_columns = VehicleColumns.from_vehicles(self._vehicles, self.time_origin, self.integer_times)
+        return self._vehicle_columns
+
+    @property
+    def request_map(self) -> Dict[int, Request]:
+        if self._request_map is None:
+            self._request_map = {r.index: r for r in self.requests}
+        return self._request_map
+
+    @property
+    def request_index(self) -> 'darpinstances.request_index.RequestIndex':
+        """Spatio-temporal index of the requests (see RequestIndex), created on the first access."""
+        if self._request_index is None:
+            self._request_index = darpinstances.request_index.RequestIndex(
+                self.request_columns, self.travel_time_provider, self.darp_instance_config.travel_time_divider
+            )
+        return self._request_index
+
+    def find_requests(
+        self,
+        start: Union[datetime, int],
+        end: Union[datetime, int],
+        node=None,
+        max_travel_time: Optional[float] = None
+    ) -> List[Request]:
+        """
+        Returns the requests whose pickup time window overlaps [start, end] and, if the node is given, whose pickup
+        node is reachable from the node in at most max_travel_time seconds, ordered by the pickup min time. See
+        RequestIndex.query.
+        """
+        requests = self.requests
+        return [
+            requests[position] for position in self.request_index.query(start, end, node, max_travel_time).tolist()
+        ]
+
+    def get_request_count(self) -> int:
+        return len(self._requests) if self._requests is not None else len(self._request_columns)
+
+    def get_exact_travel_time_provider(self) -> Tuple[TravelTimeProvider, int]:
+        """
+        Returns the provider of the exact travel times of the instance (see TravelTimeProvider.source_provider) and the
+        travel time divider converting them to seconds. The solutions are checked with them, so that the result of the
+        check does not depend on how the distance matrix is stored.
+        """
+        travel_time_provider = self.travel_time_provider
+        travel_time_divider = self.darp_instance_config.travel_time_divider
+        source_provider = travel_time_provider.source_provider
+        if source_provider is None:
+            return travel_time_provider, travel_time_divider
+        return source_provider, travel_time_divider * travel_time_provider.applied_travel_time_divider \
+            // source_provider.applied_travel_time_divider
 
 
 class Reader(ABC):
@@ -168,16 +833,45 @@ def load_instance_config(config_file_path: Path, set_defaults: bool = True) -> d
 
 
 class Node:
+    """
+    Node of the road graph, identified by its index in the distance matrix. The nodes are interned: Node(idx) returns
+    the same object for all requests and vehicles at the same node.
+    """
+    __slots__ = ('idx',)
+
+    _nodes: Dict[int, 'Node'] = {}
+
     def get_idx(self) -> int:
         return self.idx
 
-    def __init__(self, idx: int):
-        self.idx = idx
+    def __new__(cls, idx: int):
+        idx = int(idx)
+        node = cls._nodes.get(idx)
+        if node is None:
+            node = super().__new__(cls)
+            node.idx = idx
+            node = cls._nodes.setdefault(idx, node)
+        return node
+
+    def __reduce__(self):
+        return Node, (self.idx,)
 
     def __str__(self):
         return str(self.idx)
 
 
+def get_node_indices(nodes: Sequence) -> np.ndarray:
+    """
+    Converts a sequence of nodes (Node objects or node indices) to an array of node indices.
+    """
+    node_array = np.asarray(nodes)
+    if node_array.dtype != object:
+        return node_array
+    return np.fromiter(
+        (node.idx if isinstance(node, Node) else node for node in node_array), dtype=np.int64, count=len(node_array)
+    )
+
+
 def load_vehicles_csv(vehicles_path: Path) -> List[Vehicle]:
     veh_data = darpinstances.inout.load_csv(vehicles_path, "\t")
     vehicles = []
@@ -249,6 +943,16 @@ def load_vehicles_from_json(vehicles_path: Path, stations_path: Path) -> List[Ve
     return vehicles
 
 
+def _get_vehicles_files(instance_dir_path: Path, instance_config: Dict) -> List[Path]:
+    """Returns the existing files the vehicles can be loaded from (see load_vehicles)."""
+    vehicles_files = [
+        instance_dir_path / 'vehicles.csv', instance_dir_path / 'vehicles.json', instance_dir_path / 'station_positions.csv'
+    ]
+    if 'vehicles' in instance_config and 'filepath' in instance_config['vehicles']:
+        vehicles_files.append(instance_dir_path / instance_config['vehicles']['filepath'])
+    return [path for path in vehicles_files if path.exists()]
+
+
 def load_vehicles(instance_dir_path: Path, instance_config: Dict) -> List[Vehicle]:
     # one option is to not define vehicles at all and let the system generate them at the pickup loactions
     if ('vehicles' in instance_config and 'origin' in instance_config['vehicles'] and instance_config['vehicles'][
@@ -273,93 +977,143 @@ def load_vehicles(instance_dir_path: Path, instance_config: Dict) -> List[Vehicl
         raise ValueError("Vehicles file .json or .csv was not found")
 
 
-def _compute_max_delay(instance_config: dict, min_travel_time: int|float) -> float:
+def _compute_max_delays(instance_config: dict, min_travel_times: pd.Series) -> pd.Series:
+    """
+    Computes the maximum delays of the requests: max_prolongation if defined, otherwise the absolute or relative max
+    travel time delay.
+    """
     if 'max_prolongation' in instance_config:
-        return int(instance_config['max_prolongation'])
+        return pd.Series(int(instance_config['max_prolongation']), index=min_travel_times.index)
     elif instance_config['max_travel_time_delay']['mode'] == 'absolute':
-        return instance_config['max_travel_time_delay']['seconds']
+        return pd.Series(instance_config['max_travel_time_delay']['seconds'], index=min_travel_times.index)
     else:
-        return min_travel_time * instance_config['max_travel_time_delay']['relative']
+        return min_travel_times * instance_config['max_travel_time_delay']['relative']
 
 
-def load_demand_legacy(demand_file: TextIO, instance_config: dict, travel_time_provider: TravelTimeProvider):
+LEGACY_DEMAND_COLUMNS = ['time_ms', 'origin', 'dest', 'min_travel_time', 'equipment', 'required_vehicle_id']
+"""Columns of the legacy space-separated demand files. Only the first three columns are mandatory."""
+
+
+def _timestamps_to_local_datetimes(timestamps_ms: np.ndarray) -> np.ndarray:
+    """
+    Converts the POSIX timestamps in milliseconds to naive local datetimes, equivalently to datetime.fromtimestamp.
+    The UTC offset is computed once if it does not change within the timestamp range, otherwise it is computed for
+    each unique timestamp.
     """
-    Old loader for demand files in the format present in the original DARP instances requests.csv files. This loader
-    should not be needed any more, as the new loader is more flexible, but it kept here for possible compatibility
-    issues with old instances. It is used only for the old space-separated format files.
+    utc_times = timestamps_ms.astype('datetime64[ms]')
+    if len(timestamps_ms) == 0:
+        return utc_times
+
+    def get_utc_offset(timestamp_ms: int) -> np.timedelta64:
+        local_time = datetime.fromtimestamp(timestamp_ms / 1000)
+        return np.datetime64(local_time, 'ms') - np.datetime64(int(timestamp_ms), 'ms')
+
+    min_timestamp = int(timestamps_ms.min())
+    max_timestamp = int(timestamps_ms.max())
+    one_day_ms = 24 * 3600 * 1000
+    if max_timestamp - min_timestamp <= one_day_ms and get_utc_offset(min_timestamp) == get_utc_offset(max_timestamp):
+        return utc_times + get_utc_offset(min_timestamp)
+
+    unique_timestamps, inverse = np.unique(timestamps_ms, return_inverse=True)
+    offsets = np.array([get_utc_offset(timestamp) for timestamp in unique_timestamps.tolist()], dtype='timedelta64[ms]')
+    return utc_times + offsets[inverse]
+
+
+def _to_microseconds(seconds) -> np.ndarray:
+    """Converts the durations in seconds to whole microseconds, rounded as in timedelta(seconds=...)."""
+    return np.round(np.asarray(seconds, dtype=float) * 1_000_000).astype(np.int64).astype('timedelta64[us]')
+
+
+def load_demand_legacy(
+    demand_file: TextIO,
+    instance_config: dict,
+    travel_time_provider: TravelTimeProvider,
+    time_origin: Optional[datetime] = None
+):
+    """
+    Old loader for demand files in the format present in the original DARP instances requests.csv files. It is used
+    only for the old space-separated format files. The whole file is parsed at once into columns (see
+    LEGACY_DEMAND_COLUMNS) and the time windows are computed by whole-column operations. The request times are
+    interpreted as POSIX timestamps in milliseconds converted to the local time.
 
     @param demand_file: file object
-    @param requests: list of requests to be filled
     @param instance_config: instance configuration
     @param travel_time_provider: travel time provider
+    @param time_origin: if set, the request times are whole seconds since this time instead of datetimes
     """
-    action_id = 0
-    index = 0
-    travel_time_divider = instance_config.get('travel_time_divider', 1)
-    line_string = demand_file.readline()
-    requests = []
-    while line_string:
-        line = line_string.split()
-        request_id: int = int(index)
-
-        if ' ' in line[0]:
-            request_time = _load_datetime(line[0])
-        else:
-            request_time = datetime.fromtimestamp(int(line[0]) / 1000)
-
-        start_node = Node(int(line[1]))
-        end_node = Node(int(line[2]))
-        equipment = map_equipment_type(line[4]).value if (len(line) > 4) else 0
-
-        min_travel_time = travel_time_provider.get_travel_time(start_node, end_node)
-        min_travel_time = min_travel_time / travel_time_divider
-
-        max_prolongation = _compute_max_delay(instance_config, min_travel_time)
-        max_pickup_delay = instance_config.get('max_pickup_delay', max_prolongation)
-
-        max_pickup_time = request_time + timedelta(seconds=max_pickup_delay)
-        # min_drop_off_time = request_time + timedelta(seconds=int(min_travel_time))
-        max_drop_off_time = request_time + timedelta(seconds=int(min_travel_time)) + timedelta(
-            seconds=max_prolongation
-        ) + timedelta(seconds=instance_config.get('max_pickup_delay', 0))
-        if 'max_pickup_delay' in instance_config:
-            max_drop_off_time += timedelta(seconds=instance_config['max_pickup_delay'])
-
-        vehicle_id = int(line[5]) if len(line) > 5 else 0
-        requests.append(
-            Request(
-                request_id,
-                action_id,
-                start_node,
-                request_time,
-                max_pickup_time,
-                action_id + 1,
-                end_node,
-                # min_drop_off_time,
-                max_drop_off_time,
-                math.ceil(min_travel_time),
-                0,
-                0,
-                equipment,
-                vehicle_id
-            )
-        )
-        line_string = demand_file.readline()
-        action_id += 2
-        index += 1
+    return _create_legacy_requests(_read_legacy_demand(demand_file), instance_config, travel_time_provider, time_origin)
 
-    return requests
 
+def _read_legacy_demand(demand_file: TextIO, chunk_size: Optional[int] = None):
+    return pd.read_csv(
+        demand_file,
+        sep=r'\s+',
+        header=None,
+        names=LEGACY_DEMAND_COLUMNS,
+        dtype={'equipment': str},
+        chunksize=chunk_size
+    )
 
-def _compute_min_pickup_time(instance_config: dict, desired_pickup_time: datetime) -> datetime:
-    if 'enable_negative_delay' in instance_config and instance_config['enable_negative_delay']:
-        min_time_including_negative_delay = desired_pickup_time - timedelta(seconds=instance_config['max_pickup_delay'])
-        if 'min_time' in instance_config['demand']:
-            instance_start_time = _load_datetime(instance_config['demand']['min_time'])
-            if instance_start_time > min_time_including_negative_delay:
-                return instance_start_time
-        return min_time_including_negative_delay
-    return desired_pickup_time
+
+def _create_legacy_requests(
+    request_data: pd.DataFrame,
+    instance_config: dict,
+    travel_time_provider: TravelTimeProvider,
+    time_origin: Optional[datetime] = None
+) -> List[Request]:
+    return create_requests(compute_legacy_time_windows(
+        _prepare_legacy_demand_data(request_data, instance_config, travel_time_provider), instance_config
+    ), time_origin)
+
+
+def _prepare_legacy_demand_data(
+    request_data: pd.DataFrame, instance_config: dict, travel_time_provider: TravelTimeProvider
+) -> pd.DataFrame:
+    """
+    Legacy counterpart of prepare_demand: computes the request columns that do not depend on the delay settings.
+    """
+    request_times = _timestamps_to_local_datetimes(request_data['time_ms'].to_numpy(dtype=np.int64))
+
+    origins = request_data['origin'].to_numpy(dtype=np.int64)
+    destinations = request_data['dest'].to_numpy(dtype=np.int64)
+    min_travel_times = travel_time_provider.get_travel_times(origins, destinations) \
+        / instance_config.get('travel_time_divider', 1)
+
+    equipment_values = {equipment_type.name: equipment_type.value for equipment_type in EquipmentType}
+    return pd.DataFrame({
+        'id': request_data.index,
+        'Pickup_Time': request_times.astype('datetime64[us]'),
+        'start_node': [Node(node) for node in origins.tolist()],
+        'end_node': [Node(node) for node in destinations.tolist()],
+        'min_travel_time': min_travel_times,
+        'equipment': request_data['equipment'].map(equipment_values).fillna(EquipmentType.NONE.value).astype(int),
+        'required_vehicle_id': request_data['required_vehicle_id'].fillna(0).astype(np.int64)
+    }, index=request_data.index)
+
+
+def compute_legacy_time_windows(request_data: pd.DataFrame, instance_config: dict) -> pd.DataFrame:
+    """
+    Legacy counterpart of compute_time_windows, reproducing the time windows of the original instances. The input
+    data frame is not modified.
+    """
+    request_data = request_data.copy()
+    request_times = request_data['Pickup_Time']
+    min_travel_times = request_data['min_travel_time']
+
+    max_delays = _compute_max_delays(instance_config, min_travel_times)
+    max_pickup_delays = max_delays if 'max_pickup_delay' not in instance_config \
+        else instance_config['max_pickup_delay']
+
+    request_data['min_pickup_time'] = request_times
+    request_data['max_pickup_time'] = request_times + _to_microseconds(max_pickup_delays)
+    # the max pickup delay is intentionally added twice, as in the original instances
+    max_drop_off_times = request_times + _to_microseconds(np.trunc(min_travel_times)) \
+        + _to_microseconds(max_delays) + _to_microseconds(instance_config.get('max_pickup_delay', 0))
+    if 'max_pickup_delay' in instance_config:
+        max_drop_off_times += _to_microseconds(instance_config['max_pickup_delay'])
+    request_data['max_drop_off_time'] = max_drop_off_times
+
+    return request_data
 
 
 def get_nearest_node(kdtree: KDTree, transformer: Transformer, latitude: str, longitude: str) -> Node:
@@ -386,38 +1140,104 @@ def get_nearest_node(kdtree: KDTree, transformer: Transformer, latitude: str, lo
 #     )
 
 
-def load_demand(demand_file: TextIO, instance_config: dict, travel_time_provider: TravelTimeProvider):
-    """
-    Function that loads requests from a csv file.
+_nodes_kdtree_cache: Dict[tuple, KDTree] = {}
+"""Process-wide cache of the area node KD-trees, keyed by the nodes file identity and the SRID."""
 
-    @param demand_file: file object
-    @param requests: list of requests to be filled
-    @param instance_config: instance configuration
-    @param travel_time_provider: travel time provider
-    """
+NODES_CACHE_VERSION = 2
 
-    # the presence of the SRID signals that the graph nodes for requests' origin and destination are not precomputed
-    if 'srid' in instance_config:
-        # Create a transformer object
-        transformer = Transformer.from_crs("EPSG:4326", f"EPSG:{instance_config['srid']}", always_xy=True)
 
-        # read the nodes
-        input_stream = open(Path(instance_config['area_dir']) / 'maps/nodes.geojson', encoding='utf8')
-        geojson_nodes = geojson.load(input_stream)
-        coord_list = []
-        for node in tqdm(geojson_nodes['features']):
-            coords = node['geometry']['coordinates']
+def _load_projected_nodes(nodes_cache_filepath: Path, nodes_identity: str) -> Optional[np.ndarray]:
+    """
+    Returns the cached projected node coordinates, or None if the cache does not exist, cannot be read, or it was
+    created from a different nodes file.
+    """
+    if not nodes_cache_filepath.exists():
+        return None
+    try:
+        with np.load(nodes_cache_filepath, allow_pickle=False) as nodes_cache:
+            if int(nodes_cache['version']) != NODES_CACHE_VERSION \
+                    or str(nodes_cache['nodes_identity']) != nodes_identity:
+                return None
+            return nodes_cache['coordinates']
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning("Projected nodes cache %s cannot be read: %s", nodes_cache_filepath, e)
+        return None
+
+
+def get_nodes_kdtree(area_dir: Union[str, Path], srid: int) -> KDTree:
+    """
+    Returns the KD-tree of the area nodes projected to the given SRID. The projected coordinates are cached in the area
+    dir (maps/nodes_<srid>.npz), so the geojson nodes file is parsed only once per area, and the tree is rebuilt from
+    them. The cache is invalidated when the nodes file changes. The tree is also kept in memory and shared by all
+    instances of the area loaded in the process.
+    """
+    maps_dir = Path(area_dir) / 'maps'
+    nodes_filepath = maps_dir / 'nodes.geojson'
+    nodes_identity = darpinstances.instance_snapshot.get_file_identity(nodes_filepath)
+    cache_key = (nodes_identity, srid)
+    if cache_key in _nodes_kdtree_cache:
+        return _nodes_kdtree_cache[cache_key]
+
+    nodes_cache_filepath = maps_dir / f'nodes_{srid}.npz'
+    projected_coordinates = _load_projected_nodes(nodes_cache_filepath, nodes_identity)
+    if projected_coordinates is not None:
+        logging.info("Projected nodes loaded from %s", os.path.realpath(nodes_cache_filepath))
+    else:
+        logging.info("Projecting nodes from %s to EPSG:%s", os.path.realpath(nodes_filepath), srid)
+        transformer = Transformer.from_crs("EPSG:4326", f"EPSG:{srid}", always_xy=True)
+        with open(nodes_filepath, encoding='utf8') as input_stream:
+            geojson_nodes = geojson.load(input_stream)
+        coordinates = np.array(
+            [node['geometry']['coordinates'][:2] for node in geojson_nodes['features']], dtype=float
+        )
+        x, y = transformer.transform(coordinates[:, 0], coordinates[:, 1])
+        projected_coordinates = np.column_stack((x, y))
+        try:
+            tmp_path = nodes_cache_filepath.with_name(
+                f"{nodes_cache_filepath.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            with open(tmp_path, 'wb') as nodes_cache_file:
+                np.savez(
+                    nodes_cache_file,
+                    version=np.array(NODES_CACHE_VERSION),
+                    nodes_identity=np.array(nodes_identity),
+                    coordinates=projected_coordinates
+                )
+            os.replace(tmp_path, nodes_cache_filepath)
+        except OSError as e:
+            logging.warning("Projected nodes cache not saved: %s", e)
+
+    kdtree = KDTree(projected_coordinates)
+    _nodes_kdtree_cache[cache_key] = kdtree
+    return kdtree
+
+
+def get_nearest_nodes(kdtree: KDTree, transformer: Transformer, latitudes, longitudes) -> np.ndarray:
+    """
+    Vectorized version of get_nearest_node: returns the indices of the nodes nearest to the given WGS84 coordinates.
+    """
+    x, y = transformer.transform(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+    return kdtree.query(np.column_stack((x, y)))[1]
 
-            # transform coordinates to UTM
-            coords = transformer.transform(coords[0], coords[1])
 
-            coord_list.append(coords)
-        kdtree = KDTree(coord_list)
+def prepare_demand(demand_file: TextIO, instance_config: dict, travel_time_provider: TravelTimeProvider) -> pd.DataFrame:
+    """
+    Parses the demand csv file and computes the request columns that do not depend on the delay settings: the request
+    ids, the origin and destination nodes, the equipment and the minimal travel time (not rounded, travel time divider
+    applied). All columns are computed by whole-column operations.
 
-    travel_time_divider = instance_config.get('travel_time_divider', 1)
+    @param demand_file: file object
+    @param instance_config: instance configuration
+    @param travel_time_provider: travel time provider
+    @return: data frame with columns Pickup_Time, id, start_node, end_node, equipment, required_vehicle_id and
+    min_travel_time
+    """
+    return _prepare_demand_data(pd.read_csv(demand_file), instance_config, travel_time_provider)
 
-    request_data = pd.read_csv(demand_file)
 
+def _prepare_demand_data(
+    request_data: pd.DataFrame, instance_config: dict, travel_time_provider: TravelTimeProvider
+) -> pd.DataFrame:
     # convert pickup time to datetime
     request_data['Pickup_Time'] = pd.to_datetime(request_data['Pickup_Time'], format="%Y-%m-%d %H:%M:%S")
 
@@ -425,55 +1245,99 @@ def load_demand(demand_file: TextIO, instance_config: dict, travel_time_provider
     if not 'id' in request_data.columns:
         request_data['id'] = request_data.index
 
-    # min pickup time
-    request_data['min_pickup_time'] = [_compute_min_pickup_time(instance_config, desired_pickup_time) for
-        desired_pickup_time in request_data['Pickup_Time']]
-
-    # nodes
+    # nodes. The presence of the SRID signals that the graph nodes for requests' origin and destination are not
+    # precomputed
     if 'srid' in instance_config:
-        request_data['start_node'] = [get_nearest_node(kdtree, transformer, lat, lon) for lat, lon in
-            zip(request_data['Latitude_From'], request_data['Longitude_From'])]
-        request_data['end_node'] = [get_nearest_node(kdtree, transformer, lat, lon) for lat, lon in
-            zip(request_data['Latitude_To'], request_data['Longitude_To'])]
+        transformer = Transformer.from_crs("EPSG:4326", f"EPSG:{instance_config['srid']}", always_xy=True)
+        kdtree = get_nodes_kdtree(instance_config['area_dir'], instance_config['srid'])
+        # origins and destinations are queried together
+        nodes = get_nearest_nodes(
+            kdtree,
+            transformer,
+            np.concatenate((request_data['Latitude_From'].to_numpy(), request_data['Latitude_To'].to_numpy())),
+            np.concatenate((request_data['Longitude_From'].to_numpy(), request_data['Longitude_To'].to_numpy()))
+        )
+        request_count = len(request_data)
+        request_data['start_node'] = [Node(node) for node in nodes[:request_count]]
+        request_data['end_node'] = [Node(node) for node in nodes[request_count:]]
     else:
         request_data.rename(columns={'Node_From': 'start_node', 'Node_To': 'end_node'}, inplace=True)
 
     # equipment
     if 'Slot_Type' in request_data.columns:
-        request_data['equipment'] = [map_equipment_type(slot_type).value for slot_type in request_data['Slot_Type']]
+        equipment_values = {equipment_type.name: equipment_type.value for equipment_type in EquipmentType}
+        request_data['equipment'] = request_data['Slot_Type'].map(equipment_values).fillna(
+            EquipmentType.NONE.value
+        ).astype(int)
     else:
         request_data['equipment'] = 0
 
+    # required vehicle id, if not present, set to None
+    if 'required_vehicle_id' not in request_data:
+        request_data['required_vehicle_id'] = None
+
     # minimum travel time from start to end node
-    request_data['min_travel_time'] = [travel_time_provider.get_travel_time(start_node, end_node) / travel_time_divider
-        for start_node, end_node in zip(request_data['start_node'], request_data['end_node'])]
+    request_data['min_travel_time'] = travel_time_provider.get_travel_times(
+        request_data['start_node'].to_numpy(), request_data['end_node'].to_numpy()
+    ) / instance_config.get('travel_time_divider', 1)
 
-    # max time computations
-    request_data['max_delay'] = [_compute_max_delay(instance_config, min_travel_time) for min_travel_time in
-        request_data['min_travel_time']]
-    if 'max_pickup_delay' in instance_config:
-        request_data['max_pickup_delay'] = instance_config['max_pickup_delay']
+    return request_data
+
+
+def compute_time_windows(request_data: pd.DataFrame, instance_config: dict) -> pd.DataFrame:
+    """
+    Computes the time windows of the requests prepared by prepare_demand according to the delay settings of the
+    instance config. The input data frame is not modified.
+
+    @return: data frame with the min_pickup_time, max_pickup_time and max_drop_off_time columns added
+    """
+    request_data = request_data.copy()
+    pickup_times = request_data['Pickup_Time']
+
+    # min pickup time
+    if instance_config.get('enable_negative_delay', False):
+        min_pickup_times = pickup_times - pd.to_timedelta(instance_config['max_pickup_delay'], unit='s')
+        if 'min_time' in instance_config['demand']:
+            instance_start_time = _load_datetime(instance_config['demand']['min_time'])
+            min_pickup_times = min_pickup_times.clip(lower=instance_start_time)
+        request_data['min_pickup_time'] = min_pickup_times
     else:
-        request_data['max_pickup_delay'] = request_data['max_delay']
+        request_data['min_pickup_time'] = pickup_times
+
+    # max delay
+    min_travel_times = request_data['min_travel_time']
+    max_delays = _compute_max_delays(instance_config, min_travel_times)
 
-    request_data['max_pickup_time'] = request_data['Pickup_Time'] + pd.to_timedelta(request_data['max_pickup_delay'], unit='s')
+    max_pickup_delays = max_delays if 'max_pickup_delay' not in instance_config \
+        else pd.Series(instance_config['max_pickup_delay'], index=request_data.index)
 
-    request_data['max_drop_off_time'] = request_data['Pickup_Time'] + pd.to_timedelta(
-        (request_data['min_travel_time'] + request_data['max_delay'] + instance_config.get('max_pickup_delay', 0)).round(),
-        unit='s'
+    request_data['max_pickup_time'] = pickup_times + pd.to_timedelta(max_pickup_delays, unit='s')
+    request_data['max_drop_off_time'] = pickup_times + pd.to_timedelta(
+        (min_travel_times + max_delays + instance_config.get('max_pickup_delay', 0)).round(), unit='s'
     )
 
-    # required vehicle id, if not present, set to -1
-    if 'required_vehicle_id' not in request_data:
-        request_data['required_vehicle_id'] = None
+    return request_data
 
-    # action ids
-    request_data['pickup_action_id'] = request_data.index * 2
-    request_data['drop_off_action_id'] = request_data.index * 2 + 1
 
-    # travel time rounding
-    request_data['min_travel_time'] = request_data['min_travel_time'].apply(np.ceil)
+def create_requests(request_data: pd.DataFrame, time_origin: Optional[datetime] = None) -> List[Request]:
+    """
+    Creates the Request objects from the data frame with the time windows computed by compute_time_windows.
+
+    @param time_origin: if set, the times are whole seconds since this time (rounded down) instead of datetimes
+    """
+    time_columns = ['min_pickup_time', 'max_pickup_time', 'max_drop_off_time']
+    if time_origin is None:
+        times = [request_data[column].tolist() for column in time_columns]
+    else:
+        times = [_to_seconds(request_data[column], time_origin).tolist() for column in time_columns]
+    min_pickup_times, max_pickup_times, max_drop_off_times = times
+
+    min_travel_times = np.ceil(request_data['min_travel_time'].to_numpy(dtype=float))
+    if not np.isfinite(min_travel_times).all():
+        raise OverflowError("Some requests have an infinite or undefined minimal travel time")
 
+    # action ids, the index of chunked data continues across the chunks
+    pickup_action_ids = request_data.index.to_numpy() * 2
     return [
         Request(
             request_id,
@@ -481,10 +1345,10 @@ def load_demand(demand_file: TextIO, instance_config: dict, travel_time_provider
             start_node,
             min_pickup_time,
             max_pickup_time,
-            drop_off_action_id,
+            pickup_action_id + 1,
             end_node,
             max_drop_off_time,
-            math.ceil(min_travel_time),
+            min_travel_time,
             0,
             0,
             equipment,
@@ -495,69 +1359,352 @@ def load_demand(demand_file: TextIO, instance_config: dict, travel_time_provider
             start_node,
             min_pickup_time,
             max_pickup_time,
-            drop_off_action_id,
             end_node,
             max_drop_off_time,
             min_travel_time,
             equipment,
             required_vehicle_id
         in zip(
-            request_data['id'],
-            request_data['pickup_action_id'],
-            request_data['start_node'],
-            request_data['min_pickup_time'],
-            request_data['max_pickup_time'],
-            request_data['drop_off_action_id'],
-            request_data['end_node'],
-            request_data['max_drop_off_time'],
-            request_data['min_travel_time'],
-            request_data['equipment'],
-            request_data['required_vehicle_id']
+            request_data['id'].tolist(),
+            pickup_action_ids.tolist(),
+            request_data['start_node'].tolist(),
+            min_pickup_times,
+            max_pickup_times,
+            request_data['end_node'].tolist(),
+            max_drop_off_times,
+            min_travel_times.astype(np.int64).tolist(),
+            request_data['equipment'].tolist(),
+            request_data['required_vehicle_id'].tolist()
         )
     ]
 
 
-def load_instance(
-    filepath: Path, travel_time_provider: MatrixTravelTimeProvider = None, demand_file_name: Optional[str] = None
-) -> DARPInstance:
+def _with_integer_times(requests: Sequence[Request], time_origin: datetime) -> List[Request]:
+    """Creates copies of the requests with the times in whole seconds since time_origin. The nodes are kept."""
+    request_columns = RequestColumns.from_requests(requests, time_origin)
+    return [
+        Request(
+            request.index,
+            request.pickup_action.id,
+            request.pickup_action.node,
+            min_pickup_time,
+            max_pickup_time,
+            request.drop_off_action.id,
+            request.drop_off_action.node,
+            max_drop_off_time,
+            request.min_travel_time,
+            request.pickup_action.service_time,
+            request.drop_off_action.service_time,
+            request.equipment,
+            request.required_vehicle_id
+        ) for request, min_pickup_time, max_pickup_time, max_drop_off_time in zip(
+            requests,
+            request_columns.pickup_min_time.tolist(),
+            request_columns.pickup_max_time.tolist(),
+            request_columns.drop_off_max_time.tolist()
+        )
+    ]
+
+
+def load_demand(
+    demand_file: TextIO,
+    instance_config: dict,
+    travel_time_provider: TravelTimeProvider,
+    time_origin: Optional[datetime] = None
+):
+    """
+    Function that loads requests from a csv file.
+
+    @param demand_file: file object
+    @param instance_config: instance configuration
+    @param travel_time_provider: travel time provider
+    @param time_origin: if set, the request times are whole seconds since this time instead of datetimes
+    """
+    request_data = prepare_demand(demand_file, instance_config, travel_time_provider)
+    return create_requests(compute_time_windows(request_data, instance_config), time_origin)
+
+
+def get_instance_nodes(instance: DARPInstance) -> np.ndarray:
+    """
+    Returns the sorted indices of all nodes used by the instance: request origins and destinations and vehicle initial
+    positions.
+    """
+    request_columns = instance.request_columns
+    return np.unique(np.concatenate((
+        request_columns.pickup_node, request_columns.drop_off_node, instance.vehicle_columns.initial_position
+    )))
+
+
+def save_instance_dm(instance: DARPInstance, instance_dir_path: Path) -> Path:
+    """
+    Stores the distance matrix restricted to the nodes used by the instance into the instance dir. load_instance then
+    uses it instead of the area distance matrix.
+
+    @param instance: instance loaded with the area distance matrix
+    @param instance_dir_path: instance dir
+    @return: path to the instance distance matrix
+    """
+    travel_time_provider = instance.travel_time_provider
+    if not isinstance(travel_time_provider, MatrixTravelTimeProvider) or travel_time_provider.node_map is not None:
+        raise ValueError("The instance distance matrix can be extracted only from an area distance matrix")
+    return darpinstances.distance_matrix.save_instance_dm(
+        travel_time_provider.dm,
+        get_instance_nodes(instance),
+        instance_dir_path / darpinstances.distance_matrix.INSTANCE_DM_FILENAME,
+        travel_time_provider.unit,
+        travel_time_provider.applied_travel_time_divider
+    )
+
+
+def _get_demand_travel_time_provider(
+    instance_config: dict, travel_time_provider: TravelTimeProvider
+) -> Tuple[dict, TravelTimeProvider]:
+    """
+    Returns the provider of the travel times from which the requests are computed together with the instance config
+    with the travel time divider that remains to be applied to them. For compacted distance matrices, it is the
+    provider of the exact travel times (see TravelTimeProvider.source_provider), so that the time windows of the
+    requests do not depend on the compaction.
+    """
+    if travel_time_provider.source_provider is not None:
+        travel_time_provider = travel_time_provider.source_provider
+    return _with_remaining_travel_time_divider(instance_config, travel_time_provider), travel_time_provider
+
+
+def _with_remaining_travel_time_divider(instance_config: dict, travel_time_provider: TravelTimeProvider) -> dict:
+    """
+    Returns a copy of the instance config with the travel time divider that remains to be applied to the travel times
+    of the provider: if the provider already applied the divider (a compacted distance matrix), it must not be applied
+    again. The loaded config itself is not modified.
+    """
+    return {
+        **instance_config,
+        'travel_time_divider': _get_remaining_travel_time_divider(instance_config, travel_time_provider)
+    }
+
+
+def _get_remaining_travel_time_divider(instance_config: dict, travel_time_provider: TravelTimeProvider) -> int:
+    travel_time_divider = instance_config.get('travel_time_divider', 1)
+    applied_travel_time_divider = travel_time_provider.applied_travel_time_divider
+    if applied_travel_time_divider == 1:
+        return travel_time_divider
+    if applied_travel_time_divider != travel_time_divider:
+        raise ValueError(
+            f"The distance matrix was compacted with travel time divider {applied_travel_time_divider}, but the "
+            f"instance requires travel time divider {travel_time_divider}"
+        )
+    return 1
+
+
+def _get_default_registry_capacity() -> int:
+    """Half of the physical memory, or 4 GB if it cannot be determined."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+    except (AttributeError, ValueError, OSError):
+        return 4_000_000_000
+
+
+class TravelTimeProviderRegistry:
+    """
+    Process-wide registry of the loaded travel time providers, so that the distance matrix of an area is loaded only
+    once even when the instances of multiple areas are loaded in an interleaved order. The providers are keyed by the
+    identity of the source file (resolved path, size and modification time) and the loading parameters. When a new
+    provider is registered and the memory of the registered providers exceeds max_bytes, the least recently used
+    providers are dropped. Memory-mapped matrices and views of shared memory are not counted, as they are not private
+    memory of the process. The references to the shared memory of the dropped providers are released.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else _get_default_registry_capacity()
+        self._providers: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[tuple, threading.Lock] = {}
+
+    @staticmethod
+    def get_provider_bytes(travel_time_provider: TravelTimeProvider) -> int:
+        dm = getattr(travel_time_provider, 'dm', None)
+        if dm is None or isinstance(dm, np.memmap) or getattr(travel_time_provider, 'is_shared', False):
+            return 0
+        return dm.nbytes
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(self.get_provider_bytes(provider) for provider in self._providers.values())
+
+    def __len__(self):
+        return len(self._providers)
+
+    def get(self, key: tuple, load) -> TravelTimeProvider:
+        """
+        Returns the registered provider for the key, or loads it by calling load() and registers it. Concurrent calls
+        with the same key load the provider only once.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._providers:
+                    self._providers.move_to_end(key)
+                    logging.info("Using registered travel time provider %s", key[0])
+                    return self._providers[key]
+
+            travel_time_provider = load()
+
+            with self._lock:
+                self._providers[key] = travel_time_provider
+                self._evict()
+            return travel_time_provider
+
+    def _evict(self):
+        total_bytes = sum(self.get_provider_bytes(provider) for provider in self._providers.values())
+        while self._providers and total_bytes > self.max_bytes:
+            key, provider = self._providers.popitem(last=False)
+            total_bytes -= self.get_provider_bytes(provider)
+            self._key_locks.pop(key, None)
+            _release_provider(provider)
+            logging.info("Travel time provider %s dropped from the registry", key[0])
+
+    def clear(self):
+        with self._lock:
+            for provider in self._providers.values():
+                _release_provider(provider)
+            self._providers.clear()
+            self._key_locks.clear()
+
+
+def _release_provider(travel_time_provider: TravelTimeProvider):
+    if isinstance(travel_time_provider, MatrixTravelTimeProvider):
+        travel_time_provider.release_shared_memory()
+
+
+travel_time_provider_registry = TravelTimeProviderRegistry()
+"""Registry used by load_instance."""
+
+
+def _load_travel_time_provider(
+    instance_config: dict,
+    instance_dir_path: Path,
+    dm_mode: Optional[Union[str, DMMode]],
+    dm_dtype: Optional[str],
+    use_instance_dm: bool
+) -> Tuple[MatrixTravelTimeProvider, str]:
+    """
+    Loads the travel time provider of the instance (see load_instance for the parameters).
+
+    @return: the travel time provider and the identity of its source file (see instance_snapshot.get_file_identity)
+    """
+    instance_dm_filepath = instance_dir_path / darpinstances.distance_matrix.INSTANCE_DM_FILENAME
+    if use_instance_dm and instance_dm_filepath.exists():
+        dm_filepath = instance_dm_filepath
+    elif 'dm_filepath' in instance_config:
+        dm_filepath = instance_config['dm_filepath']
+    # by default, the dm is located in folder
+    else:
+        dm_filepath = Path(instance_config['area_dir']) / 'dm.h5'
+    if dm_mode is None:
+        dm_mode = instance_config.get('dm_mode', DMMode.LOAD)
+    dm_mode = DMMode(dm_mode)
+
+    # without a distance matrix, the travel times are computed from the road graph
+    edges_filepath = Path(instance_config.get('area_dir', instance_dir_path)) / 'map' / 'edges.csv'
+    if dm_mode != DMMode.GRAPH and not os.path.exists(dm_filepath) and edges_filepath.exists():
+        logging.info("Distance matrix %s not found, computing travel times from the road graph", dm_filepath)
+        dm_mode = DMMode.GRAPH
+
+    # memory budget for the graph and chunked modes
+    cache_size = instance_config.get('dm_cache_size', 1000) * 1_000_000
+
+    if dm_dtype is None:
+        dm_dtype = instance_config.get('dm_dtype')
+    travel_time_divider = instance_config.get('travel_time_divider', 1)
+
+    if dm_mode == DMMode.GRAPH:
+        check_file_exists(edges_filepath)
+        travel_time_source_identity = darpinstances.instance_snapshot.get_file_identity(edges_filepath)
+    else:
+        check_file_exists(dm_filepath)
+        travel_time_source_identity = darpinstances.instance_snapshot.get_file_identity(dm_filepath)
+
+    def load() -> MatrixTravelTimeProvider:
+        if dm_mode == DMMode.GRAPH:
+            return GraphTravelTimeProvider.from_edges_csv(edges_filepath, max_cache_bytes=cache_size)
+
+        logging.info("Reading dm from: {} (mode: {})".format(os.path.realpath(dm_filepath), dm_mode.value))
+        provider = MatrixTravelTimeProvider.read_from_file(dm_filepath, dm_mode, cache_size)
+        if dm_dtype is not None and dm_mode != DMMode.CHUNKED and provider.dm.dtype != np.dtype(dm_dtype):
+            logging.info("Converting dm to %s", dm_dtype)
+            # the exact travel times of the requests are read from the file on demand, csv files are kept in memory
+            source_provider = provider if Path(dm_filepath).suffix == '.csv' \
+                else _open_source_provider(dm_filepath, cache_size)
+            compact_provider = provider.to_compact(
+                travel_time_divider, np.dtype(dm_dtype), source_provider=source_provider
+            )
+            if source_provider is not provider:
+                # the compact matrix is a private copy, the shared matrix is no longer needed
+                provider.release_shared_memory()
+            provider = compact_provider
+        return provider
+
+    registry_key = (
+        travel_time_source_identity,
+        dm_mode,
+        None if dm_dtype is None else np.dtype(dm_dtype).name,
+        travel_time_divider,
+        cache_size
+    )
+    travel_time_provider = travel_time_provider_registry.get(registry_key, load)
+
+    return travel_time_provider, travel_time_source_identity
+
+
+def _open_source_provider(dm_filepath: Union[str, Path], max_cache_bytes: int) -> MatrixTravelTimeProvider:
+    """
+    Opens the distance matrix for reading the exact travel times without loading the whole matrix into memory: it is
+    memory-mapped if possible, otherwise its rows are read on demand (see MatrixTravelTimeProvider.open_chunked).
+    """
+    try:
+        return MatrixTravelTimeProvider.open_mmap(dm_filepath, export_if_needed=False)
+    except ValueError:
+        return MatrixTravelTimeProvider.open_chunked(dm_filepath, max_cache_bytes)
+
+
+def _resolve_instance_paths(instance_config: dict, instance_dir_path: Path):
+    """
+    Makes the paths in the instance config absolute. The relative paths are relative to the instance dir.
+    """
+    if 'area_dir' in instance_config:
+        instance_config['area_dir'] = instance_dir_path / instance_config['area_dir']
+    if 'dm_filepath' in instance_config:
+        instance_config['dm_filepath'] = instance_dir_path / instance_config['dm_filepath']
+    if 'demand' in instance_config and 'filepath' in instance_config['demand']:
+        instance_config['demand']['filepath'] = instance_dir_path / instance_config['demand']['filepath']
+
+
+def _load_instance_config_and_demand_path(filepath: Path, demand_file_name: Optional[str]) -> Tuple[dict, Path]:
+    """
+    Loads the instance config with the paths made absolute and returns it together with the checked demand file path.
+    """
     instance_config = load_instance_config(filepath, set_defaults=False)
     instance_dir_path = filepath.parent
+    _resolve_instance_paths(instance_config, instance_dir_path)
 
-    # Here, we are completing the possibly relative paths. Therefore, we need to change the dir because dm path
-    # loaded from instance config is relative to the instance dir
-    os.chdir(instance_dir_path)
     if demand_file_name is None:
         demand_path = instance_config['demand']['filepath']
     else:
         demand_path = instance_dir_path / demand_file_name
     check_file_exists(demand_path)
+    return instance_config, demand_path
 
-    vehicles = load_vehicles(instance_dir_path, instance_config)
 
-    # dm loading
-    if travel_time_provider is None:
-        if 'dm_filepath' in instance_config:
-            dm_filepath = instance_config['dm_filepath']
-        # by default, the dm is located in folder
-        else:
-            dm_filepath = Path(instance_config['area_dir']) / 'dm.h5'
-        check_file_exists(dm_filepath)
-        logging.info("Reading dm from: {}".format(os.path.realpath(dm_filepath)))
-        travel_time_provider = MatrixTravelTimeProvider.read_from_file(dm_filepath)
-    else:
-        logging.info("Using provided travel time provider")
-
-    logging.info("Reading DARP instance from: {}".format(os.path.realpath(demand_path)))
+def _is_csv_demand(demand_file: TextIO) -> bool:
+    """Checks whether the demand file is in the csv format (or in the legacy space-separated format)."""
+    file_begin = demand_file.tell()
+    header = demand_file.readline()
+    demand_file.seek(file_begin)
+    return ',' in header
 
-    with open(demand_path, "r", encoding="utf-8") as demand_file:
-        file_begin = demand_file.tell()
-        header = demand_file.readline()
-        demand_file.seek(file_begin)
-        if ',' in header:
-            requests = load_demand(demand_file, instance_config, travel_time_provider)
-        else:
-            requests = load_demand_legacy(demand_file, instance_config, travel_time_provider)
 
+def _create_darp_instance_configuration(instance_config: dict) -> DARPInstanceConfiguration:
     max_pickup_delay = instance_config.get('max_pickup_delay', 0)
     enable_negative_delay = instance_config.get('enable_negative_delay', False)
 
@@ -580,7 +1727,7 @@ def load_instance(
 
     travel_time_divider = instance_config.get('travel_time_divider', 1)
 
-    darp_instance_config = DARPInstanceConfiguration(
+    return DARPInstanceConfiguration(
         0,
         0,
         False,
@@ -593,9 +1740,325 @@ def load_instance(
         enable_negative_delay,
         vehicle_capacity
     )
-    return DARPInstance(requests, vehicles, travel_time_provider, darp_instance_config)
+
+
+def load_instance(
+    filepath: Path,
+    travel_time_provider: MatrixTravelTimeProvider = None,
+    demand_file_name: Optional[str] = None,
+    dm_mode: Optional[Union[str, DMMode]] = None,
+    dm_dtype: Optional[str] = None,
+    use_instance_dm: bool = True,
+    use_snapshot: bool = True,
+    integer_times: bool = False
+) -> DARPInstance:
+    """
+    Loads the DARP instance from the instance configuration file.
+
+    @param filepath: path to the instance configuration file
+    @param travel_time_provider: travel time provider to use. If not provided, the distance matrix is read from the file
+    specified in the instance config
+    @param demand_file_name: name of the demand file, overrides the demand file path from the instance config
+    @param dm_mode: how the distance matrix is accessed (see DMMode). Overrides the `dm_mode` field of the instance
+    config. By default, the whole matrix is loaded into memory.
+    @param dm_dtype: if set, the loaded distance matrix is converted to this compact type with the travel time divider
+    applied (see MatrixTravelTimeProvider.to_compact). Overrides the `dm_dtype` field of the instance config.
+    @param use_instance_dm: if True and the instance dir contains the distance matrix restricted to the instance nodes
+    (see save_instance_dm), it is used instead of the area distance matrix
+    @param use_snapshot: if True, the requests and vehicles are loaded from the binary instance snapshot when it is
+    valid, and the snapshot is written after the instance is parsed (see darpinstances.instance_snapshot). Snapshots
+    are not used with a provided travel time provider, as its identity is unknown.
+    @param integer_times: if True, the times of the requests and vehicles are whole seconds since the instance time
+    origin (see DARPInstance.time_origin) instead of datetimes. The demand is then converted directly from the parsed
+    columns. The snapshots are used, but they are written only by the loading with datetimes, as the integer times
+    do not keep the sub-second precision of the legacy demand.
+    """
+    filepath = Path(filepath).absolute()
+    instance_config, demand_path = _load_instance_config_and_demand_path(filepath, demand_file_name)
+    instance_dir_path = filepath.parent
+
+    # dm loading
+    if travel_time_provider is None:
+        travel_time_provider, travel_time_source_identity = _load_travel_time_provider(
+            instance_config, instance_dir_path, dm_mode, dm_dtype, use_instance_dm
+        )
+    else:
+        logging.info("Using provided travel time provider")
+        travel_time_source_identity = None
+
+    demand_config, demand_travel_time_provider = _get_demand_travel_time_provider(instance_config, travel_time_provider)
+    # if the provider already applied the travel time divider, it must not be applied again
+    instance_config = _with_remaining_travel_time_divider(instance_config, travel_time_provider)
+
+    snapshot = None
+    snapshot_key = None
+    if use_snapshot and travel_time_source_identity is not None:
+        snapshot_identities = [travel_time_source_identity, demand_config['travel_time_divider']]
+        if 'srid' in instance_config:
+            nodes_filepath = Path(instance_config['area_dir']) / 'maps/nodes.geojson'
+            snapshot_identities.append(darpinstances.instance_snapshot.get_file_identity(nodes_filepath))
+        snapshot_key = darpinstances.instance_snapshot.compute_snapshot_key(
+            [filepath, demand_path, *_get_vehicles_files(instance_dir_path, instance_config)], snapshot_identities
+        )
+        snapshot = darpinstances.instance_snapshot.load_snapshot(
+            darpinstances.instance_snapshot.get_snapshot_path(filepath, snapshot_key)
+        )
+
+    darp_instance_config = _create_darp_instance_configuration(instance_config)
+    time_origin = None
+    if snapshot is not None:
+        requests, vehicles = snapshot
+        if integer_times:
+            earliest_pickup_time = min((request.pickup_action.min_time for request in requests), default=None)
+            time_origin = _get_time_origin(darp_instance_config.start_time, earliest_pickup_time)
+            requests = _with_integer_times(requests, time_origin)
+    else:
+        vehicles = load_vehicles(instance_dir_path, instance_config)
+
+        logging.info("Reading DARP instance from: {}".format(os.path.realpath(demand_path)))
+
+        with open(demand_path, "r", encoding="utf-8") as demand_file:
+            if _is_csv_demand(demand_file):
+                request_data = compute_time_windows(
+                    prepare_demand(demand_file, demand_config, demand_travel_time_provider), demand_config
+                )
+            else:
+                legacy_demand = _read_legacy_demand(demand_file)
+                request_data = compute_legacy_time_windows(
+                    _prepare_legacy_demand_data(legacy_demand, demand_config, demand_travel_time_provider),
+                    demand_config
+                )
+
+        if integer_times:
+            earliest_pickup_time = request_data['min_pickup_time'].min() if len(request_data) > 0 else None
+            if earliest_pickup_time is not None:
+                earliest_pickup_time = earliest_pickup_time.to_pydatetime()
+            time_origin = _get_time_origin(darp_instance_config.start_time, earliest_pickup_time)
+        requests = create_requests(request_data, time_origin)
+
+        if snapshot_key is not None and not integer_times:
+            try:
+                darpinstances.instance_snapshot.save_snapshot(filepath, snapshot_key, requests, vehicles)
+            except (OSError, ValueError, TypeError) as e:
+                logging.warning("Instance snapshot not saved: %s", e)
+
+    if integer_times:
+        vehicles = VehicleColumns.from_vehicles(vehicles, time_origin).to_vehicles(integer_times=True)
+    return DARPInstance(
+        requests, vehicles, travel_time_provider, darp_instance_config, time_origin=time_origin,
+        integer_times=integer_times
+    )
+
+
+def load_instances(paths: Iterable[Path], max_workers: Optional[int] = None, **kwargs) -> List[DARPInstance]:
+    """
+    Loads multiple instances in parallel threads. The loading is mostly I/O-bound (HDF5, CSV and YAML reading), so the
+    reads of different instances overlap.
+
+    @param paths: paths to the instance configuration files
+    @param max_workers: maximum number of threads, see ThreadPoolExecutor
+    @param kwargs: other arguments of load_instance, used for all instances
+    @return: the instances in the order of the paths
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda path: load_instance(path, **kwargs), paths))
+
+
+def load_instance_family(
+    area_dir: Path, config_file_name: str = 'config.yaml', max_workers: Optional[int] = None, **kwargs
+) -> Dict[Path, DARPInstance]:
+    """
+    Loads all instances of an area, i.e., all instances in instances/start_*/duration_*/max_delay_* in the area dir.
+    The distance matrix shared by the instances is loaded only once (see TravelTimeProviderRegistry).
+
+    @param area_dir: area dir
+    @param config_file_name: name of the instance configuration files
+    @param max_workers: maximum number of loading threads, see load_instances
+    @param kwargs: other arguments of load_instance, used for all instances
+    @return: the instances keyed by the instance configuration file paths, ordered by the paths
+    """
+    paths = sorted((Path(area_dir) / 'instances').glob(f'start_*/duration_*/max_delay_*/{config_file_name}'))
+    logging.info("Loading %d instances from %s", len(paths), os.path.realpath(area_dir))
+    return dict(zip(paths, load_instances(paths, max_workers, **kwargs)))
+
+
+DELAY_SETTINGS = ('max_prolongation', 'max_travel_time_delay', 'max_pickup_delay', 'enable_negative_delay')
+"""Instance config fields that can differ between the instances derived from one DemandBase."""
+
+
+class DemandBase:
+    """
+    Parsed demand of an instance together with its vehicles and travel time provider. It holds the request columns
+    that do not depend on the delay settings (nodes, min travel times, ...), so that instances differing only in the
+    delay settings (see DELAY_SETTINGS) can be created without parsing the demand and computing the travel times again.
+    Create by load_demand_base.
+    """
+
+    def __init__(
+        self,
+        instance_config: dict,
+        request_data: pd.DataFrame,
+        legacy: bool,
+        vehicles: List[Vehicle],
+        travel_time_provider: TravelTimeProvider
+    ):
+        self.instance_config = instance_config
+        self.request_data = request_data
+        self.legacy = legacy
+        self.vehicles = vehicles
+        self.travel_time_provider = travel_time_provider
+
+    def create_instance(self, **delay_settings) -> DARPInstance:
+        """
+        Creates the instance with the given delay settings. The settings not given are taken from the instance
+        config of the base, a setting given as None is removed (e.g., max_prolongation=None to apply the
+        max_travel_time_delay). The time windows are recomputed, all other request data, the vehicles and the travel
+        time provider are shared by all created instances.
+
+        @raise ValueError: if a setting other than the delay settings is given
+        """
+        unknown_settings = set(delay_settings) - set(DELAY_SETTINGS)
+        if unknown_settings:
+            raise ValueError(f"Only the delay settings {DELAY_SETTINGS} can be changed, not {sorted(unknown_settings)}")
+
+        instance_config = dict(self.instance_config)
+        for key, value in delay_settings.items():
+            if value is None:
+                instance_config.pop(key, None)
+            else:
+                instance_config[key] = value
+
+        if self.legacy:
+            request_data = compute_legacy_time_windows(self.request_data, instance_config)
+        else:
+            request_data = compute_time_windows(self.request_data, instance_config)
+        return DARPInstance(
+            create_requests(request_data),
+            self.vehicles,
+            self.travel_time_provider,
+            _create_darp_instance_configuration(instance_config)
+        )
+
+
+def load_demand_base(
+    filepath: Path,
+    travel_time_provider: MatrixTravelTimeProvider = None,
+    demand_file_name: Optional[str] = None,
+    dm_mode: Optional[Union[str, DMMode]] = None,
+    dm_dtype: Optional[str] = None,
+    use_instance_dm: bool = True
+) -> DemandBase:
+    """
+    Parses the demand of the instance once for deriving instances with different delay settings, e.g.:
+
+        base = load_demand_base(config_path)
+        instances = [base.create_instance(max_prolongation=delay) for delay in (60, 180, 300)]
+
+    See load_instance for the parameters.
+    """
+    filepath = Path(filepath).absolute()
+    instance_config, demand_path = _load_instance_config_and_demand_path(filepath, demand_file_name)
+    instance_dir_path = filepath.parent
+
+    if travel_time_provider is None:
+        travel_time_provider, _ = _load_travel_time_provider(
+            instance_config, instance_dir_path, dm_mode, dm_dtype, use_instance_dm
+        )
+    demand_config, demand_travel_time_provider = _get_demand_travel_time_provider(instance_config, travel_time_provider)
+    instance_config = _with_remaining_travel_time_divider(instance_config, travel_time_provider)
+    vehicles = load_vehicles(instance_dir_path, instance_config)
+
+    logging.info("Reading demand from: {}".format(os.path.realpath(demand_path)))
+    with open(demand_path, "r", encoding="utf-8") as demand_file:
+        legacy = not _is_csv_demand(demand_file)
+        if legacy:
+            request_data = _prepare_legacy_demand_data(
+                _read_legacy_demand(demand_file), demand_config, demand_travel_time_provider
+            )
+        else:
+            request_data = prepare_demand(demand_file, demand_config, demand_travel_time_provider)
+
+    return DemandBase(instance_config, request_data, legacy, vehicles, travel_time_provider)
+
+
+def iter_instance_batches(
+    filepath: Path,
+    window: timedelta,
+    travel_time_provider: MatrixTravelTimeProvider = None,
+    demand_file_name: Optional[str] = None,
+    dm_mode: Optional[Union[str, DMMode]] = None,
+    dm_dtype: Optional[str] = None,
+    use_instance_dm: bool = True,
+    chunk_size: int = 10_000
+) -> Iterator[DARPInstance]:
+    """
+    Loads the DARP instance incrementally in batches of requests, e.g., for rolling-horizon experiments. The demand file
+    is read in chunks, so the memory is bounded by the window size rather than by the whole demand.
+
+    Each batch is a DARPInstance containing the requests with the min pickup time in one time window. The windows have
+    the given length and start at the min pickup time of the first request; empty windows are skipped. All batches
+    share the vehicles, the travel time provider and the instance configuration. The request indices and action ids
+    are the same as in the instance loaded by load_instance.
+
+    @param filepath: path to the instance configuration file
+    @param window: length of the time window of a batch
+    @param chunk_size: number of demand file lines parsed at once
+    @raise ValueError: if the requests in the demand file are not ordered by the pickup time
+    See load_instance for the other parameters.
+    """
+    filepath = Path(filepath).absolute()
+    instance_config, demand_path = _load_instance_config_and_demand_path(filepath, demand_file_name)
+    instance_dir_path = filepath.parent
+
+    if travel_time_provider is None:
+        travel_time_provider, _ = _load_travel_time_provider(
+            instance_config, instance_dir_path, dm_mode, dm_dtype, use_instance_dm
+        )
+    demand_config, demand_travel_time_provider = _get_demand_travel_time_provider(instance_config, travel_time_provider)
+    instance_config = _with_remaining_travel_time_divider(instance_config, travel_time_provider)
+    vehicles = load_vehicles(instance_dir_path, instance_config)
+    darp_instance_config = _create_darp_instance_configuration(instance_config)
+
+    logging.info("Reading DARP instance batches from: {}".format(os.path.realpath(demand_path)))
+    with open(demand_path, "r", encoding="utf-8") as demand_file:
+        if _is_csv_demand(demand_file):
+            request_chunks = (
+                create_requests(compute_time_windows(
+                    _prepare_demand_data(chunk, demand_config, demand_travel_time_provider), demand_config
+                ))
+                for chunk in pd.read_csv(demand_file, chunksize=chunk_size)
+            )
+        else:
+            request_chunks = (
+                _create_legacy_requests(chunk, demand_config, demand_travel_time_provider)
+                for chunk in _read_legacy_demand(demand_file, chunk_size)
+            )
+
+        window_start = None
+        batch = []
+        last_pickup_time = None
+        for requests in request_chunks:
+            for request in requests:
+                pickup_time = request.pickup_action.min_time
+                if last_pickup_time is not None and pickup_time < last_pickup_time:
+                    raise ValueError(
+                        f"The requests in {demand_path} are not ordered by the pickup time (request {request.index})"
+                    )
+                last_pickup_time = pickup_time
+
+                if window_start is None:
+                    window_start = pickup_time
+                if pickup_time >= window_start + window:
+                    if batch:
+                        yield DARPInstance(batch, vehicles, travel_time_provider, darp_instance_config)
+                        batch = []
+                    window_start += ((pickup_time - window_start) // window) * window
+                batch.append(request)
+
+        if batch:
+            yield DARPInstance(batch, vehicles, travel_time_provider, darp_instance_config)
 
 
 @MatrixTravelTimeProvider.get_travel_time.register
-def _(self, from_node: Node, to_dode: Node):
-    return self.get_travel_time(from_node.idx, to_dode.idx)
+def _(self, from_node: Node, to_node: Node):
+    return self.get_travel_time(from_node.idx, to_node.idx if isinstance(to_node, Node) else to_node)
@@ -7,11 +7,11 @@ import geopandas as gpd
 import pandas as pd
 from pathlib import Path
 
+import darpinstances.distance_matrix
 import darpinstances.instance_generation.map
 import darpinstances.instance_generation.demand_generation
 import darpinstances.instance_generation.vehicles
 from darpinstances.instance import load_instance_config
-import darpbenchmark.exec
 
 
 def generate_dm(config: Dict, nodes: gpd.GeoDataFrame, edges: gpd.GeoDataFrame, allow_zero_length_edges: bool = True):
@@ -26,44 +26,14 @@ def generate_dm(config: Dict, nodes: gpd.GeoDataFrame, edges: gpd.GeoDataFrame,
     if os.path.exists(abs_path_with_extension) or os.path.exists(abs_path):
         logging.info("Skipping DM generation, the file is already generated.")
     else:
-        logging.info(f"Generating distance matrix in {abs_path_with_extension}")
-        map_dir = config['map']['path']
-        xeng_file_path = os.path.join(map_dir, "map.xeng")
-        xeng_file_path = os.path.abspath(xeng_file_path)
+        logging.info(f"Generating distance matrix in {abs_path}")
 
-        # length to travel time conversion, 50 km/h
-        if 'speed' in edges:
-            logging.info("Using real speed from edges")
-            # estimated travel time in seconds
-            edges["travel_time"] = round(edges["length"] / edges["speed"] * 3.6).astype(int)
-        else:
-            logging.info("Using default speed of 50 km/h")
-            try:
-                edges["travel_time"] = edges["length"].apply(lambda x: round(int(x) / 14))
-            except ValueError as v:
-                logging.warning("Suspicious max speed, trying float conversion: %s", v)
-                edges["travel_time"] = edges["length"].apply(lambda x: round(float(x) / 14))
+        # length to travel time conversion
+        edges["travel_time"] = darpinstances.distance_matrix.compute_edge_travel_times(edges, allow_zero_length_edges)
 
-        if not allow_zero_length_edges:
-            edges.loc[edges["travel_time"] == 0, 'travel_time'] = 1
-
-        xeng = pd.DataFrame(edges[["u", "v", "travel_time"]])
-        xeng["one_way"] = 1
-        xeng.to_csv(xeng_file_path, sep=" ", header=["XGI", str(len(nodes)), str(len(edges)), ""], index=False)
-
-        # call distance utils to generate dm
-        command = [
-            "shortestPathsPreprocessor",
-            "create",
-            "dm",
-            "xengraph",
-            "csv",
-            "fast",
-            xeng_file_path,
-            abs_path
-        ]
-
-        darpbenchmark.exec.call_executable(command)
+        node_count = max(len(nodes), int(max(edges["u"].max(), edges["v"].max())) + 1)
+        graph = darpinstances.distance_matrix.edges_to_graph(edges, node_count)
+        darpinstances.distance_matrix.build_dm(graph, abs_path, processes=config.get('dm_processes'))
 
 
 def generate_instance(config_filepath: Path):
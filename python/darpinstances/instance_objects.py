@@ -20,6 +20,8 @@ class ActionType(Enum):
 
 
 class Action:
+    __slots__ = ('id', 'node', 'min_time', 'max_time', 'action_type', 'request', 'service_time')
+
     def __init__(self, action_id, node, min_time: datetime, max_time: datetime, action_type: ActionType,
                  request, service_time: int = 0):
         self.id = action_id
@@ -35,6 +37,8 @@ class Action:
 
 
 class Request:
+    __slots__ = ('index', 'pickup_action', 'drop_off_action', 'min_travel_time', 'equipment', 'required_vehicle_id')
+
     def __init__(
         self,
         index: int,
@@ -70,6 +74,8 @@ class Request:
 
 
 class Vehicle:
+    __slots__ = ('index', 'initial_position', 'capacity', 'configurations', 'operation_start', 'operation_end')
+
     def __init__(self, index: int, initial_position, capacity: int, configurations: List[List[int]] = [], operation_start: datetime = None, operation_end: datetime = None):
         self.index = index
         self.initial_position = initial_position
@@ -80,6 +86,8 @@ class Vehicle:
 
 
 class VirtualVehicle(Vehicle):
+    __slots__ = ('time_to_start',)
+
     def __init__(self, capacity: int, time_start):
         super().__init__(0, None, capacity)
         self.time_to_start = time_start
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""
+Binary snapshots of the parsed instance demand and vehicles. Parsing the demand file includes the travel time lookups
+and the time window computation for every request, which is by far the most expensive part of the instance loading.
+The snapshot stores the result in flat numpy arrays, so that the requests and vehicles can be rebuilt without
+parsing. The snapshot is content-addressed: its name contains a hash of the instance config, demand and vehicle files
+and the identity of the travel time source, so a snapshot is never used for a changed instance.
+"""
+import hashlib
+import logging
+import os
+import threading
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import darpinstances.instance
+from darpinstances.instance_objects import Request, Vehicle
+
+SNAPSHOT_VERSION = 1
+"""Version of the snapshot format. Increase on any change of the stored arrays or of the demand loading semantics."""
+
+SNAPSHOT_SUFFIX = '.snapshot.npz'
+
+
+def get_file_identity(path: Union[str, Path]) -> str:
+    """
+    Returns a cheap identity of a large file (e.g., the distance matrix) based on its resolved path, size and
+    modification time. Used instead of the content hash for files that are too large to be hashed on each load.
+    """
+    stat = os.stat(path)
+    return f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def compute_snapshot_key(content_files: Iterable[Union[str, Path]], identities: Sequence[str]) -> str:
+    """
+    Computes the snapshot key from the content of the instance files and the identities of the other inputs.
+
+    :param content_files: files hashed by content (config, demand, vehicles)
+    :param identities: other inputs of the loading, e.g., the distance matrix identity and the loading parameters
+    """
+    key_hash = hashlib.sha1(f"darp-instance-snapshot-{SNAPSHOT_VERSION}".encode())
+    for path in content_files:
+        key_hash.update(os.path.basename(path).encode())
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                key_hash.update(block)
+    for identity in identities:
+        key_hash.update(b'\0')
+        key_hash.update(str(identity).encode())
+    return key_hash.hexdigest()[:16]
+
+
+def get_snapshot_path(config_path: Path, key: str) -> Path:
+    return config_path.parent / f"{config_path.stem}.{key}{SNAPSHOT_SUFFIX}"
+
+
+def _encode_nodes(nodes: Sequence) -> Tuple[np.ndarray, bool]:
+    is_node = [isinstance(node, darpinstances.instance.Node) for node in nodes]
+    if any(is_node) and not all(is_node):
+        raise ValueError("Mixed node representations cannot be stored in a snapshot")
+    return darpinstances.instance.get_node_indices(nodes).astype(np.int64), all(is_node) and len(is_node) > 0
+
+
+def _decode_nodes(indices: np.ndarray, as_objects: bool) -> list:
+    if as_objects:
+        return [darpinstances.instance.Node(index) for index in indices.tolist()]
+    return indices.tolist()
+
+
+def _encode_times(times: Sequence[Optional[datetime]]) -> Tuple[np.ndarray, bool]:
+    for time in times:
+        if time is not None and time.tzinfo is not None:
+            raise ValueError("Timezone-aware times cannot be stored in a snapshot")
+    is_timestamp = len(times) > 0 and all(isinstance(time, pd.Timestamp) for time in times)
+    return np.array(times, dtype='datetime64[ns]').view(np.int64), is_timestamp
+
+
+def _decode_times(values: np.ndarray, as_timestamps: bool) -> list:
+    missing = values == np.iinfo(np.int64).min
+    if as_timestamps:
+        times = list(pd.DatetimeIndex(values.astype('datetime64[ns]')))
+    else:
+        times = values.astype('datetime64[ns]').astype('datetime64[us]').tolist()
+    if missing.any():
+        times = [None if is_missing else time for time, is_missing in zip(times, missing.tolist())]
+    return times
+
+
+def _encode_optional(values: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    missing = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    return np.array([0 if value is None else value for value in values]), missing
+
+
+def _decode_optional(values: np.ndarray, missing: np.ndarray) -> list:
+    return [None if is_missing else value for value, is_missing in zip(values.tolist(), missing.tolist())]
+
+
+def save_snapshot(config_path: Path, key: str, requests: List[Request], vehicles: List[Vehicle]) -> Path:
+    """
+    Stores the requests and vehicles to the snapshot file of the instance config. The file is written atomically, and
+    older snapshots of the same instance config are removed.
+
+    :raises ValueError: if the objects cannot be represented in the snapshot
+    """
+    pickups = [request.pickup_action for request in requests]
+    drop_offs = [request.drop_off_action for request in requests]
+    pickup_nodes, pickup_nodes_are_objects = _encode_nodes([action.node for action in pickups])
+    drop_off_nodes, drop_off_nodes_are_objects = _encode_nodes([action.node for action in drop_offs])
+    pickup_min_times, request_times_are_timestamps = _encode_times([action.min_time for action in pickups])
+    pickup_max_times, _ = _encode_times([action.max_time for action in pickups])
+    drop_off_max_times, _ = _encode_times([action.max_time for action in drop_offs])
+    required_vehicle_ids, required_vehicle_id_missing = _encode_optional(
+        [request.required_vehicle_id for request in requests]
+    )
+
+    vehicle_positions, vehicle_positions_are_objects = _encode_nodes(
+        [vehicle.initial_position for vehicle in vehicles]
+    )
+    operation_starts, _ = _encode_times([vehicle.operation_start for vehicle in vehicles])
+    operation_ends, _ = _encode_times([vehicle.operation_end for vehicle in vehicles])
+
+    # the vehicle configurations are stored as two levels of offsets into the flat equipment list
+    configuration_offsets = [0]
+    equipment_offsets = [0]
+    equipment = []
+    for vehicle in vehicles:
+        for configuration in vehicle.configurations:
+            equipment.extend(configuration)
+            equipment_offsets.append(len(equipment))
+        configuration_offsets.append(len(equipment_offsets) - 1)
+
+    arrays = {
+        'version': np.array(SNAPSHOT_VERSION),
+        'request_index': np.array([request.index for request in requests], dtype=np.int64),
+        'pickup_id': np.array([action.id for action in pickups], dtype=np.int64),
+        'drop_off_id': np.array([action.id for action in drop_offs], dtype=np.int64),
+        'pickup_node': pickup_nodes,
+        'drop_off_node': drop_off_nodes,
+        'pickup_min_time': pickup_min_times,
+        'pickup_max_time': pickup_max_times,
+        'drop_off_max_time': drop_off_max_times,
+        'min_travel_time': np.array([request.min_travel_time for request in requests], dtype=np.int64),
+        'pickup_service_time': np.array([action.service_time for action in pickups], dtype=np.int64),
+        'drop_off_service_time': np.array([action.service_time for action in drop_offs], dtype=np.int64),
+        'equipment': np.array([request.equipment for request in requests], dtype=np.int64),
+        'required_vehicle_id': required_vehicle_ids,
+        'required_vehicle_id_missing': required_vehicle_id_missing,
+        'request_flags': np.array([pickup_nodes_are_objects, drop_off_nodes_are_objects, request_times_are_timestamps]),
+        'vehicle_index': np.array([vehicle.index for vehicle in vehicles], dtype=np.int64),
+        'vehicle_position': vehicle_positions,
+        'vehicle_capacity': np.array([vehicle.capacity for vehicle in vehicles], dtype=np.int64),
+        'vehicle_operation_start': operation_starts,
+        'vehicle_operation_end': operation_ends,
+        'vehicle_configuration_offsets': np.array(configuration_offsets, dtype=np.int64),
+        'vehicle_equipment_offsets': np.array(equipment_offsets, dtype=np.int64),
+        'vehicle_equipment': np.array(equipment, dtype=np.int64),
+        'vehicle_flags': np.array([vehicle_positions_are_objects]),
+    }
+
+    snapshot_path = get_snapshot_path(config_path, key)
+    tmp_path = snapshot_path.with_name(f"{snapshot_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'wb') as snapshot_file:
+        np.savez(snapshot_file, **arrays)
+    os.replace(tmp_path, snapshot_path)
+
+    for old_snapshot in config_path.parent.glob(get_snapshot_path(config_path, '?' * len(key)).name):
+        if old_snapshot != snapshot_path:
+            old_snapshot.unlink(missing_ok=True)
+
+    logging.info("Instance snapshot saved to %s", os.path.realpath(snapshot_path))
+    return snapshot_path
+
+
+def load_snapshot(snapshot_path: Path) -> Optional[Tuple[List[Request], List[Vehicle]]]:
+    """
+    Rebuilds the requests and vehicles from the snapshot file. Returns None if the snapshot does not exist, it was
+    stored in an incompatible format, or it cannot be read (e.g., a truncated copy), so that the instance is parsed
+    and the snapshot is written again.
+    """
+    if not snapshot_path.exists():
+        return None
+    try:
+        return _read_snapshot(snapshot_path)
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+        logging.warning("Instance snapshot %s cannot be read: %s", snapshot_path, e)
+        return None
+
+
+def _read_snapshot(snapshot_path: Path) -> Optional[Tuple[List[Request], List[Vehicle]]]:
+    with np.load(snapshot_path, allow_pickle=False) as snapshot:
+        if int(snapshot['version']) != SNAPSHOT_VERSION:
+            return None
+        arrays = {key: snapshot[key] for key in snapshot.files}
+
+    pickup_nodes_are_objects, drop_off_nodes_are_objects, request_times_are_timestamps = arrays['request_flags']
+    request_columns = zip(
+        arrays['request_index'].tolist(),
+        arrays['pickup_id'].tolist(),
+        _decode_nodes(arrays['pickup_node'], pickup_nodes_are_objects),
+        _decode_times(arrays['pickup_min_time'], request_times_are_timestamps),
+        _decode_times(arrays['pickup_max_time'], request_times_are_timestamps),
+        arrays['drop_off_id'].tolist(),
+        _decode_nodes(arrays['drop_off_node'], drop_off_nodes_are_objects),
+        _decode_times(arrays['drop_off_max_time'], request_times_are_timestamps),
+        arrays['min_travel_time'].tolist(),
+        arrays['pickup_service_time'].tolist(),
+        arrays['drop_off_service_time'].tolist(),
+        arrays['equipment'].tolist(),
+        _decode_optional(arrays['required_vehicle_id'], arrays['required_vehicle_id_missing'])
+    )
+    requests = [Request(*columns) for columns in request_columns]
+
+    configuration_offsets = arrays['vehicle_configuration_offsets'].tolist()
+    equipment_offsets = arrays['vehicle_equipment_offsets'].tolist()
+    equipment = arrays['vehicle_equipment'].tolist()
+    vehicle_columns = zip(
+        arrays['vehicle_index'].tolist(),
+        _decode_nodes(arrays['vehicle_position'], arrays['vehicle_flags'][0]),
+        arrays['vehicle_capacity'].tolist(),
+        _decode_times(arrays['vehicle_operation_start'], False),
+        _decode_times(arrays['vehicle_operation_end'], False)
+    )
+    vehicles = []
+    for vehicle_index, (index, position, capacity, operation_start, operation_end) in enumerate(vehicle_columns):
+        configurations = [
+            equipment[equipment_offsets[configuration]:equipment_offsets[configuration + 1]]
+            for configuration in range(
+                configuration_offsets[vehicle_index], configuration_offsets[vehicle_index + 1]
+            )
+        ]
+        vehicles.append(Vehicle(index, position, capacity, configurations, operation_start, operation_end))
+
+    logging.info("Instance loaded from snapshot %s", os.path.realpath(snapshot_path))
+    return requests, vehicles
@@ -0,0 +1,84 @@
+"""
+Spatio-temporal index of the instance requests. It answers queries like "requests whose pickup time window overlaps
+[start, end] and whose pickup node can be reached from a given node in at most X seconds" without scanning all
+requests: the requests are sorted by the pickup min time, so the time window candidates are found by binary search,
+and only these candidates are filtered by the travel times, looked up at once for their distinct pickup nodes.
+"""
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+import numpy as np
+
+import darpinstances.instance
+
+
+class RequestIndex:
+    """
+    Index of the requests by the pickup time window and the pickup node. The times are compared at the whole-second
+    resolution of the request columns. The query results are the positions of the requests in the instance request
+    list, ordered by the pickup min time. Create by DARPInstance.request_index.
+    """
+
+    def __init__(
+        self,
+        request_columns: 'darpinstances.instance.RequestColumns',
+        travel_time_provider: 'darpinstances.instance.TravelTimeProvider',
+        travel_time_divider: int = 1
+    ):
+        """
+        :param request_columns: columns of the indexed requests
+        :param travel_time_provider: travel time provider used for the spatial queries
+        :param travel_time_divider: divider converting the travel times of the provider to seconds
+        """
+        self.time_origin = request_columns.time_origin
+        self.travel_time_provider = travel_time_provider
+        self.travel_time_divider = travel_time_divider
+        self._order = np.argsort(request_columns.pickup_min_time, kind='stable')
+        self._min_times = request_columns.pickup_min_time[self._order]
+        self._max_times = request_columns.pickup_max_time[self._order]
+        self._nodes = request_columns.pickup_node[self._order]
+        # the longest pickup window bounds how early a window overlapping the query interval can start
+        self._max_window_length = int((self._max_times - self._min_times).max()) if len(self._order) > 0 else 0
+
+    def __len__(self):
+        return len(self._order)
+
+    def _to_seconds(self, time: Union[datetime, int]) -> int:
+        if isinstance(time, datetime):
+            return (time - self.time_origin) // timedelta(seconds=1)
+        return int(time)
+
+    def query(
+        self,
+        start: Union[datetime, int],
+        end: Union[datetime, int],
+        node=None,
+        max_travel_time: Optional[float] = None
+    ) -> np.ndarray:
+        """
+        Returns the positions of the requests whose pickup time window overlaps the interval [start, end] and, if the
+        node is given, whose pickup node is reachable from the node in at most max_travel_time seconds.
+
+        :param start: interval start, a datetime or seconds since time_origin
+        :param end: interval end, a datetime or seconds since time_origin
+        :param node: node (Node or node index) the pickup nodes are reached from
+        :param max_travel_time: maximum travel time from the node in seconds, required if the node is given
+        """
+        if node is not None and max_travel_time is None:
+            raise ValueError("The max travel time has to be provided for the spatial query")
+        start = self._to_seconds(start)
+        end = self._to_seconds(end)
+
+        first = np.searchsorted(self._min_times, start - self._max_window_length, side='left')
+        last = np.searchsorted(self._min_times, end, side='right')
+        candidates = np.arange(first, last)[self._max_times[first:last] >= start]
+
+        if node is not None and len(candidates) > 0:
+            candidate_nodes, inverse = np.unique(self._nodes[candidates], return_inverse=True)
+            node_index = darpinstances.instance.get_node_indices([node])[0]
+            travel_times = self.travel_time_provider.get_travel_times(
+                np.full(len(candidate_nodes), node_index), candidate_nodes
+            ) / self.travel_time_divider
+            candidates = candidates[travel_times[inverse] <= max_travel_time]
+
+        return self._order[candidates]
@@ -1,12 +1,16 @@
 import logging
+import os
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Set, Tuple, Dict, Iterable
+from typing import Optional, Set, Tuple, Dict, Iterable, Iterator, List
+import numpy as np
 import pandas as pd
 from pandera.typing import Series
 
-from darpinstances.inout import load_json
-from darpinstances.instance import DARPInstance, Request, Vehicle
+from darpinstances import compact_solution
+from darpinstances.inout import load_json, JsonStreamReader
+from darpinstances.instance import DARPInstance, Request, Vehicle, RequestColumns, get_node_indices, MISSING_TIME, \
+    _times_to_seconds, _seconds_to_times, _timestamps_to_local_datetimes, _get_time_origin as _get_instance_time_origin
 from darpinstances.instance_objects import ActionType, Action
 from darpinstances.vehicle_plan import VehiclePlan, ActionData
 
@@ -14,18 +18,30 @@ from darpinstances.vehicle_plan import VehiclePlan, ActionData
 class Solution:
     def __init__(
         self,
-        vehicle_plans: Iterable[VehiclePlan],
+        vehicle_plans: Optional[Iterable[VehiclePlan]],
         cost: Optional[int],
-        dropped_requests=Optional[Set[int]],
-        feasible=True
+        dropped_requests: Optional[Set[int]] = None,
+        feasible=True,
+        plan_columns: Optional['SolutionColumns'] = None,
+        request_map: Optional[Dict[int, Request]] = None,
+        vehicle_map: Optional[Dict[int, Vehicle]] = None,
+        time_origin: Optional[datetime] = None
     ):
         """
         Constructor
-        :param vehicle_plans: List of vehicle plans
+        :param vehicle_plans: List of vehicle plans, or None if the plans are created lazily from the plan columns
         :param cost: Total cost
         :param dropped_requests: Set of dropped requests' indices
+        :param plan_columns: columnar representation of the plans
+        :param request_map: requests by index, required to create the plans from the plan columns
+        :param vehicle_map: vehicles by index, required to create the plans from the plan columns
+        :param time_origin: origin of the plan times if they are integer times (see DARPInstance.integer_times)
         """
-        self.vehicle_plans = vehicle_plans
+        self._vehicle_plans = vehicle_plans
+        self._plan_columns = plan_columns
+        self._request_map = request_map
+        self._vehicle_map = vehicle_map
+        self.time_origin = time_origin
         self.cost = cost
         self.feasible = feasible
         if dropped_requests is None:
@@ -37,87 +53,655 @@ class Solution:
     def make_infeasible(cls):
         return cls([], 0, None, False)
 
+    @property
+    def vehicle_plans(self) -> Iterable[VehiclePlan]:
+        if self._vehicle_plans is None:
+            self._vehicle_plans = self._plan_columns.to_plans(
+                self._request_map, self._vehicle_map, self.time_origin is not None
+            )
+        return self._vehicle_plans
+
+    @vehicle_plans.setter
+    def vehicle_plans(self, vehicle_plans: Iterable[VehiclePlan]):
+        self._vehicle_plans = vehicle_plans
+        self._plan_columns = None
+
+    @property
+    def plan_columns(self) -> 'SolutionColumns':
+        """Columnar representation of the plans, created from the vehicle plans if the solution was loaded as objects."""
+        if self._plan_columns is None:
+            self._plan_columns = SolutionColumns.from_plans(
+                self._vehicle_plans, self.time_origin, self.time_origin is not None
+            )
+        return self._plan_columns
+
     def __str__(self):
         return 'solution: cost {}.\nPlans: {}.'.format(self.cost, '\n'.join([str(p) for p in self.vehicle_plans]))
 
 
-def _load_datetime(string: str):
-    return datetime.strptime(string, '%Y-%m-%d %H:%M:%S')
+class SolutionColumns:
+    """
+    Columnar (CSR) representation of the solution plans. The actions of the i-th plan are
+    plan_offsets[i]:plan_offsets[i + 1] of the action arrays. The times are whole seconds since time_origin, with
+    MISSING_TIME for undefined times, and the undefined plan costs are NaN. The action types are the ActionType values
+    and the actions are identified by the index of their request.
+    """
 
+    def __init__(
+        self,
+        time_origin: datetime,
+        plan_offsets: np.ndarray,
+        vehicle_id: np.ndarray,
+        departure_time: np.ndarray,
+        arrival_time: np.ndarray,
+        cost: np.ndarray,
+        action_request_index: np.ndarray,
+        action_type: np.ndarray,
+        action_arrival_time: np.ndarray,
+        action_departure_time: np.ndarray
+    ):
+        self.time_origin = time_origin
+        self.plan_offsets = np.asarray(plan_offsets, dtype=np.int64)
+        self.vehicle_id = np.asarray(vehicle_id, dtype=np.int64)
+        self.departure_time = np.asarray(departure_time, dtype=np.int64)
+        self.arrival_time = np.asarray(arrival_time, dtype=np.int64)
+        self.cost = np.asarray(cost, dtype=np.float64)
+        self.action_request_index = np.asarray(action_request_index, dtype=np.int64)
+        self.action_type = np.asarray(action_type, dtype=np.int8)
+        self.action_arrival_time = np.asarray(action_arrival_time, dtype=np.int64)
+        self.action_departure_time = np.asarray(action_departure_time, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.vehicle_id)
+
+    def get_action_count(self) -> int:
+        return len(self.action_request_index)
 
-def load_json_solution(filepath, use_virtual_vehicles, request_map, vehicle_map):
+    @classmethod
+    def from_plans(
+        cls, plans: Iterable[VehiclePlan], time_origin: Optional[datetime] = None, integer_times: bool = False
+    ):
+        """
+        :param time_origin: origin of the column times, the earliest plan departure time truncated to whole seconds by
+        default. Required if integer_times.
+        :param integer_times: whether the times of the plans are seconds since time_origin instead of datetimes
+        """
+        plans = list(plans)
+        actions_data = [action_data for plan in plans for action_data in plan.actions]
+        if time_origin is None:
+            if integer_times:
+                raise ValueError("The time origin has to be provided for the integer times")
+            time_origin = _get_instance_time_origin(None, min(
+                (plan.departure_time for plan in plans if plan.departure_time is not None), default=None
+            ))
+        plan_offsets = np.zeros(len(plans) + 1, dtype=np.int64)
+        np.cumsum([len(plan.actions) for plan in plans], out=plan_offsets[1:])
+        return cls(
+            time_origin,
+            plan_offsets,
+            np.fromiter((plan.vehicle.index for plan in plans), dtype=np.int64, count=len(plans)),
+            _times_to_seconds([plan.departure_time for plan in plans], time_origin, integer_times),
+            _times_to_seconds([plan.arrival_time for plan in plans], time_origin, integer_times),
+            np.fromiter(
+                (np.nan if plan.cost is None else plan.cost for plan in plans), dtype=np.float64, count=len(plans)
+            ),
+            np.fromiter(
+                (action_data.action.request.index for action_data in actions_data),
+                dtype=np.int64,
+                count=len(actions_data)
+            ),
+            np.fromiter(
+                (action_data.action.action_type.value for action_data in actions_data),
+                dtype=np.int8,
+                count=len(actions_data)
+            ),
+            _times_to_seconds([action_data.arrival_time for action_data in actions_data], time_origin, integer_times),
+            _times_to_seconds([action_data.departure_time for action_data in actions_data], time_origin, integer_times)
+        )
+
+    def to_plans(
+        self, request_map: Dict[int, Request], vehicle_map: Dict[int, Vehicle], integer_times: bool = False
+    ) -> List[VehiclePlan]:
+        """
+        Creates the VehiclePlan objects referencing the actions of the instance requests. The times are datetimes, or
+        seconds since time_origin if integer_times.
+
+        :raises KeyError: if some request or vehicle is not in the maps
+        """
+        actions = _get_instance_actions(
+            request_map, self.action_request_index, self.action_type == ActionType.PICKUP.value
+        )
+        actions_data = [
+            ActionData(*columns) for columns in zip(
+                actions,
+                _seconds_to_times(self.action_arrival_time, self.time_origin, integer_times),
+                _seconds_to_times(self.action_departure_time, self.time_origin, integer_times)
+            )
+        ]
+        costs = [
+            None if np.isnan(cost) else int(cost) if cost.is_integer() else cost for cost in self.cost.tolist()
+        ]
+        return [
+            VehiclePlan(vehicle_map[vehicle_id], actions_data[start:end], cost, departure_time, arrival_time)
+            for vehicle_id, start, end, cost, departure_time, arrival_time in zip(
+                self.vehicle_id.tolist(),
+                self.plan_offsets[:-1].tolist(),
+                self.plan_offsets[1:].tolist(),
+                costs,
+                _seconds_to_times(self.departure_time, self.time_origin, integer_times),
+                _seconds_to_times(self.arrival_time, self.time_origin, integer_times)
+            )
+        ]
+
+
+def _load_csv_times(seconds: np.ndarray, simulation_start_time: datetime, time_origin: Optional[datetime]) -> list:
+    """Loads the csv solution times in whole seconds since the simulation start, see _load_times."""
+    seconds = seconds.astype(np.int64)
+    if time_origin is None:
+        times = np.datetime64(simulation_start_time, 'us') + seconds.astype('timedelta64[s]')
+        return times.astype('datetime64[us]').tolist()
+    return (seconds + (simulation_start_time - time_origin) // timedelta(seconds=1)).tolist()
+
+
+def _parse_datetimes(strings: list) -> np.ndarray:
+    return pd.to_datetime(pd.Series(strings, dtype=object), format='%Y-%m-%d %H:%M:%S').to_numpy()
+
+
+def _load_time_array(values: list) -> np.ndarray:
+    """
+    Loads the solution times (datetime strings or POSIX timestamps interpreted in the local time zone) at once as
+    datetime64 values. The format is detected once for all values: the timestamps are converted directly and the
+    datetime strings are parsed by a single vectorized call. Only the values of a file mixing both formats are split
+    by the format.
+    """
+    value_types = set(map(type, values))
+    if value_types == {int}:
+        return _timestamps_to_local_datetimes(np.array(values, dtype=np.int64) * 1000).astype('datetime64[us]')
+    if value_types == {str}:
+        return _parse_datetimes(values).astype('datetime64[us]')
+
+    is_timestamp = np.fromiter((isinstance(value, int) for value in values), dtype=bool, count=len(values))
+    times = np.empty(len(values), dtype='datetime64[us]')
+    timestamps = [value for value, timestamp in zip(values, is_timestamp.tolist()) if timestamp]
+    times[is_timestamp] = _timestamps_to_local_datetimes(np.array(timestamps, dtype=np.int64) * 1000)
+    strings = [value for value, timestamp in zip(values, is_timestamp.tolist()) if not timestamp]
+    times[~is_timestamp] = _parse_datetimes(strings)
+    return times
+
+
+def _get_seconds(times: np.ndarray, time_origin: datetime) -> np.ndarray:
+    return (times - np.datetime64(time_origin, 'us')) // np.timedelta64(1, 's')
+
+
+def _load_times(values: list, time_origin: Optional[datetime]) -> list:
+    """
+    Loads the solution times at once (see _load_time_array) as datetimes, or as whole seconds since time_origin if it
+    is set (see DARPInstance.integer_times).
+    """
+    times = _load_time_array(values)
+    if time_origin is None:
+        return times.tolist()
+    return _get_seconds(times, time_origin).tolist()
+
+
+def _load_optional_seconds(values: list, time_origin: datetime) -> np.ndarray:
+    """Loads the optional solution times as seconds since time_origin, MISSING_TIME for the missing (None) values."""
+    present = np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+    seconds = np.full(len(values), MISSING_TIME, dtype=np.int64)
+    seconds[present] = _get_seconds(_load_time_array([value for value in values if value is not None]), time_origin)
+    return seconds
+
+
+def load_json_solution(
+    filepath,
+    use_virtual_vehicles,
+    request_map,
+    vehicle_map,
+    time_origin=None,
+    columnar: bool = False,
+    request_columns: Optional[RequestColumns] = None,
+    trusted: bool = False
+):
+    """
+    Loads the JSON solution. The plans are first loaded to the plan columns, with all times parsed at once, and the
+    actions are checked against the instance on the integer columns.
+
+    :param columnar: if True, the plan objects are created only when accessed (see SolutionColumns)
+    :param request_columns: columns of the requests in the order of the request map, created from the request map if
+    not provided
+    :param trusted: if True, the solution actions are not compared with the instance actions
+    """
     json_data = load_json(filepath)
 
     # handle infesible solutions
     if "feasible" in json_data and json_data["feasible"] == False:
         return Solution.make_infeasible()
 
-    vehicle_plans = []
-    total_missmatch_actions = 0
-    for json_plan in json_data["plans"]:
-        plan, mismatch_actions_count = _load_plan(json_plan, use_virtual_vehicles, vehicle_map, request_map)
-        vehicle_plans.append(plan)
-        total_missmatch_actions += mismatch_actions_count
-
-    if total_missmatch_actions > 0:
-        raise Exception(
-            f"Mismatch in actions found in the solution file. Total mismatch count: {total_missmatch_actions}"
+    if request_columns is None and not trusted:
+        request_columns = RequestColumns.from_requests(
+            list(request_map.values()),
+            datetime(1970, 1, 1) if time_origin is None else time_origin,
+            time_origin is not None
         )
+    dropped_requests = {int(request["id"]) for request in json_data["dropped_requests"]}
+    plan_columns = _load_plan_columns(
+        json_data["plans"], use_virtual_vehicles, vehicle_map, request_map, request_columns, time_origin, trusted
+    )
+    if columnar:
+        return Solution(
+            None, json_data["cost"], dropped_requests, True, plan_columns, request_map, vehicle_map, time_origin
+        )
+    vehicle_plans = plan_columns.to_plans(request_map, vehicle_map, time_origin is not None)
+    return Solution(vehicle_plans, json_data["cost"], dropped_requests, time_origin=time_origin)
 
-    dropped_requests = set()
-    for request in json_data["dropped_requests"]:
-        dropped_requests.add(int(request["id"]))
-    return Solution(vehicle_plans, json_data["cost"], dropped_requests)
-
-
-def _load_vehicle_from_csv(vehicle_row: pd.Series, simulation_start_time: datetime, vehicle_capacity: int) -> Vehicle:
-    operation_start = simulation_start_time + timedelta(seconds=int(vehicle_row['time']))
-    return Vehicle(vehicle_row['vehicle_id'], vehicle_row['node_id'], vehicle_capacity, operation_start=operation_start)
 
+class StreamedSolution:
+    """
+    Solution read incrementally from the JSON solution file. The plans are parsed one at a time while iterating
+    vehicle_plans, so only the current plan is kept in memory. The vehicle plans can be iterated only once. The cost and
+    the dropped requests are available after the iteration, as they can follow the plans in the file. The feasibility
+    flag is read ahead if it precedes the plans, otherwise it is known only after the iteration. Create by
+    load_json_solution_stream.
+    """
 
-def load_csv_solution(filepath, request_map, simulation_start_time: datetime, vehicle_capacity: int) \
-    -> Tuple[Solution, Series[Vehicle]]:
+    def __init__(
+        self,
+        filepath: Path,
+        use_virtual_vehicles: bool,
+        request_map: Dict[int, Request],
+        vehicle_map: Dict[int, Vehicle],
+        time_origin: Optional[datetime] = None,
+        trusted: bool = False
+    ):
+        self.filepath = filepath
+        self.cost = None
+        self.dropped_requests = set()
+        self._feasible = None
+        self._plans = self._parse(use_virtual_vehicles, request_map, vehicle_map, time_origin, trusted)
+        self._first_plan = None
+        self._read_ahead = False
+
+    def _parse(self, use_virtual_vehicles, request_map, vehicle_map, time_origin, trusted) -> Iterator[VehiclePlan]:
+        logging.info("Streaming json file from: %s", os.path.realpath(self.filepath))
+        with open(self.filepath, encoding="utf-8") as file:
+            reader = JsonStreamReader(file)
+            for key in reader.iter_object():
+                if key == "plans":
+                    total_missmatch_actions = 0
+                    for json_plan in reader.iter_array():
+                        plan, mismatch_actions_count = _load_plan(
+                            json_plan, use_virtual_vehicles, vehicle_map, request_map, time_origin, trusted
+                        )
+                        total_missmatch_actions += mismatch_actions_count
+                        yield plan
+                    if total_missmatch_actions > 0:
+                        raise Exception(
+                            "Mismatch in actions found in the solution file. Total mismatch count: "
+                            f"{total_missmatch_actions}"
+                        )
+                elif key == "dropped_requests":
+                    self.dropped_requests = {int(request["id"]) for request in reader.iter_array()}
+                elif key == "cost":
+                    self.cost = reader.read_value()
+                elif key == "feasible":
+                    self._feasible = reader.read_value()
+
+    @property
+    def feasible(self) -> bool:
+        if self._feasible is None and not self._read_ahead:
+            # parses the file up to the first plan, which is kept for the iteration
+            self._read_ahead = True
+            self._first_plan = next(self._plans, None)
+        return self._feasible is not False
+
+    @property
+    def vehicle_plans(self) -> Iterator[VehiclePlan]:
+        if self._first_plan is not None:
+            first_plan, self._first_plan = self._first_plan, None
+            yield first_plan
+        yield from self._plans
+
+
+def load_json_solution_stream(
+    filepath, use_virtual_vehicles, request_map, vehicle_map, time_origin=None, trusted: bool = False
+) -> StreamedSolution:
+    """
+    Loads the JSON solution incrementally, see StreamedSolution. The result is checked by
+    SolutionChecker.check_solution in the same way as the solution loaded by load_json_solution, but the memory does
+    not grow with the size of the solution.
+
+    :param trusted: if True, the solution actions are not compared with the instance actions
+    """
+    return StreamedSolution(filepath, use_virtual_vehicles, request_map, vehicle_map, time_origin, trusted)
+
+
+def load_csv_solution(
+    filepath,
+    request_map,
+    simulation_start_time: datetime,
+    vehicle_capacity: int,
+    time_origin=None,
+    columnar: bool = False,
+    trusted: bool = False
+) -> Tuple[Solution, Series[Vehicle]]:
+    """
+    Loads the solution from the simulation output csv file with one row per vehicle action. All rows are processed by
+    whole-column operations: the vehicles are created from the vehicle start rows ('E'), and the pickup ('P') and
+    drop-off ('D') rows are sorted by the vehicle, so that the actions of each plan are a contiguous range given by the
+    plan offsets (CSR layout). The action rows keep their file order within each plan.
+
+    :param columnar: if True, the plan objects are created only when accessed (see SolutionColumns)
+    :param trusted: if True, the nodes of the solution actions are not compared with the instance actions
+    """
     data = pd.read_csv(filepath)
+    row_action_types = data['action'].to_numpy()
 
-    # vehicle_plans = []
+    # vehicles
+    vehicle_rows = data[row_action_types == 'E']
+    vehicles = pd.Series([
+        Vehicle(vehicle_id, node, vehicle_capacity, operation_start=operation_start)
+        for vehicle_id, node, operation_start in zip(
+            vehicle_rows['vehicle_id'].tolist(),
+            vehicle_rows['node_id'].tolist(),
+            _load_csv_times(vehicle_rows['time'].to_numpy(), simulation_start_time, time_origin)
+        )
+    ], index=vehicle_rows.index, dtype=object)
+    vehicle_map = {vehicle.index: vehicle for vehicle in vehicles}
+
+    # plan actions sorted by the vehicle
+    action_rows = data[(row_action_types == 'P') | (row_action_types == 'D')]
+    action_rows = action_rows.iloc[np.argsort(action_rows['vehicle_id'].to_numpy(), kind='stable')]
+    plan_vehicle_ids, plan_starts = np.unique(action_rows['vehicle_id'].to_numpy(), return_index=True)
+    plan_offsets = np.append(plan_starts, len(action_rows))
+
+    request_indices = action_rows['request_id'].to_numpy(dtype=np.int64)
+    is_pickup = action_rows['action'].to_numpy() == 'P'
+
+    # node check
+    if not trusted:
+        actions = _get_instance_actions(request_map, request_indices, is_pickup)
+        instance_nodes = get_node_indices([action.node for action in actions])
+        solution_nodes = action_rows['node_id'].to_numpy()
+        for row in np.flatnonzero(instance_nodes != solution_nodes).tolist():
+            logging.warning(
+                "Node mismatch for request %d, action %d: Action from instance: %d, action from solution: %d",
+                actions[row].request.index,
+                action_rows.index[row] - 1,
+                instance_nodes[row],
+                solution_nodes[row]
+            )
 
-    vehicles = data[data['action'] == 'E'][['vehicle_id', 'node_id', 'time']].apply(
-        _load_vehicle_from_csv, axis=1, args=(simulation_start_time, vehicle_capacity)
+    # vehicles without any pickup or drop-off have no plan
+    empty_plan_vehicle_ids = np.setdiff1d(data['vehicle_id'].to_numpy(), plan_vehicle_ids)
+    for vehicle_id in empty_plan_vehicle_ids.tolist():
+        logging.debug("Empty plan for vehicle %d", vehicle_map[vehicle_id].index)
+    if len(empty_plan_vehicle_ids) > 0:
+        logging.warning("%d empty plans were removed", len(empty_plan_vehicle_ids))
+
+    columns_time_origin = simulation_start_time if time_origin is None else time_origin
+    departure_times = action_rows['time'].to_numpy().astype(np.int64) \
+        + (simulation_start_time - columns_time_origin) // timedelta(seconds=1)
+    plan_columns = SolutionColumns(
+        columns_time_origin,
+        plan_offsets,
+        plan_vehicle_ids,
+        departure_times[plan_offsets[:-1]],
+        departure_times[plan_offsets[1:] - 1],
+        np.full(len(plan_vehicle_ids), np.nan),
+        request_indices,
+        np.where(is_pickup, ActionType.PICKUP.value, ActionType.DROP_OFF.value),
+        np.full(len(action_rows), MISSING_TIME, dtype=np.int64),
+        departure_times
     )
 
-    vehicle_map = dict()
-    for vehicle in vehicles:
-        vehicle_map[vehicle.index] = vehicle
+    if columnar:
+        return Solution(None, None, set(), True, plan_columns, request_map, vehicle_map, time_origin), vehicles
+    vehicle_plans = plan_columns.to_plans(request_map, vehicle_map, time_origin is not None)
+    return Solution(vehicle_plans, None, set(), time_origin=time_origin), vehicles
+
+
+def _get_instance_actions(
+    request_map: Dict[int, Request], request_indices: np.ndarray, is_pickup: np.ndarray
+) -> List[Action]:
+    """
+    Returns the instance actions of the requests with the given indices, the pickup actions where is_pickup is True
+    and the drop-off actions otherwise.
+
+    :raises KeyError: if some request is not in the request map
+    """
+    request_positions = _get_request_positions(request_map, request_indices)
+    requests = list(request_map.values())
+    instance_actions = np.empty((len(requests), 2), dtype=object)
+    instance_actions[:, 0] = [request.pickup_action for request in requests]
+    instance_actions[:, 1] = [request.drop_off_action for request in requests]
+    return instance_actions[request_positions, np.where(is_pickup, 0, 1)].tolist()
+
+
+def load_compact_solution(
+    filepath,
+    use_virtual_vehicles,
+    request_map,
+    vehicle_map,
+    request_columns: Optional[RequestColumns],
+    time_origin=None,
+    columnar: bool = False,
+    trusted: bool = False
+) -> Solution:
+    """
+    Loads the solution stored in the compact format (see darpinstances.compact_solution). The plan columns are
+    created directly from the stored arrays, and the actions are checked against the instance on the integer columns.
+
+    :param request_columns: columns of the requests in the order of the request map, not used if trusted
+    :param columnar: if True, the plan objects are created only when accessed (see SolutionColumns)
+    :param trusted: if True, the solution actions are not compared with the instance actions
+    """
+    arrays = compact_solution.load_compact_arrays(filepath)
+    flags = compact_solution.get_flags(arrays)
+    metadata = compact_solution.get_metadata(arrays)
 
-    vehicle_plans = data.groupby("vehicle_id").apply(
-        _load_plan_from_csv, request_map, vehicle_map, simulation_start_time
-    )
-    # remove empty plans
-    # nonempty_filter = vehicle_plans.notnull()
-    non_empty_vehicle_plans = vehicle_plans[vehicle_plans.notnull()]
-    if len(non_empty_vehicle_plans) != len(vehicle_plans):
-        logging.warning("%d empty plans were removed", len(vehicle_plans) - len(non_empty_vehicle_plans))
+    # handle infesible solutions
+    if "feasible" in metadata and metadata["feasible"] == False:
+        return Solution.make_infeasible()
 
-    # for json_plan in json_data["plans"]:
-    #     plan, mismatch_actions_count = _load_plan(json_plan, use_virtual_vehicles, vehicle_map,  request_map)
-    #     vehicle_plans.append(plan)
+    dropped_requests = {int(request["id"]) for request in metadata["dropped_requests"]}
 
-    return Solution(non_empty_vehicle_plans, None, set()), vehicles
+    if use_virtual_vehicles:
+        vehicle_ids = np.full(len(arrays['plan_vehicle_id']), vehicle_map[0].index)
+    else:
+        vehicle_ids = [vehicle_map[vehicle_id].index for vehicle_id in arrays['plan_vehicle_id'].tolist()]
 
+    def load_times(name: str) -> np.ndarray:
+        if flags['times_are_timestamps']:
+            times = _timestamps_to_local_datetimes(arrays[name] * 1000)
+        else:
+            times = arrays[name].astype('datetime64[s]')
+        return times.astype('datetime64[us]')
+
+    departure_times = load_times('plan_departure_time')
+    columns_time_origin = time_origin
+    if columns_time_origin is None:
+        columns_time_origin = _get_instance_time_origin(
+            None, departure_times.min().tolist() if len(departure_times) > 0 else None
+        )
+
+    def load_seconds(name: str, origin: datetime) -> np.ndarray:
+        seconds = _get_seconds(load_times(name), origin)
+        if f'{name}_missing' in arrays:
+            seconds[arrays[f'{name}_missing']] = MISSING_TIME
+        return seconds
+
+    if not trusted:
+        positions = arrays['action_position'].copy()
+        positions[arrays['action_position_missing']] = -1
+        mismatch_actions_count = _count_action_mismatches(
+            request_columns,
+            _get_request_positions(request_map, arrays['action_request_index']),
+            arrays['action_type'] == ActionType.PICKUP.value,
+            load_seconds('action_min_time', request_columns.time_origin),
+            load_seconds('action_max_time', request_columns.time_origin),
+            positions
+        )
+        if mismatch_actions_count > 0:
+            raise Exception(
+                f"Mismatch in actions found in the solution file. Total mismatch count: {mismatch_actions_count}"
+            )
 
-def load_solution(filepath: Path, instance: DARPInstance) -> Solution:
+    plan_columns = SolutionColumns(
+        columns_time_origin,
+        arrays['plan_offsets'],
+        vehicle_ids,
+        _get_seconds(departure_times, columns_time_origin),
+        load_seconds('plan_arrival_time', columns_time_origin),
+        compact_solution.get_plan_costs(arrays),
+        arrays['action_request_index'],
+        arrays['action_type'],
+        load_seconds('action_arrival_time', columns_time_origin),
+        load_seconds('action_departure_time', columns_time_origin)
+    )
+    cost = metadata["cost"]
+    if columnar:
+        return Solution(None, cost, dropped_requests, True, plan_columns, request_map, vehicle_map, time_origin)
+    vehicle_plans = plan_columns.to_plans(request_map, vehicle_map, time_origin is not None)
+    return Solution(vehicle_plans, cost, dropped_requests, time_origin=time_origin)
+
+
+def _count_action_mismatches(
+    request_columns: RequestColumns,
+    request_positions: np.ndarray,
+    is_pickup: np.ndarray,
+    min_times: np.ndarray,
+    max_times: np.ndarray,
+    positions: np.ndarray
+) -> int:
+    """
+    Compares the solution actions with the instance actions, equivalently to _action_fields_equals, and logs the
+    mismatches. The min time is compared only for the pickup actions. The missing fields are not compared.
+
+    :param request_positions: positions of the action requests in the request columns
+    :param min_times: min times in seconds since the request columns time origin, MISSING_TIME if missing
+    :param max_times: max times in seconds since the request columns time origin, MISSING_TIME if missing
+    :param positions: node indices of the action positions, -1 if missing
+    :return: number of the actions with at least one mismatch
+    """
+    instance_min_times = request_columns.pickup_min_time[request_positions]
+    instance_max_times = np.where(
+        is_pickup,
+        request_columns.pickup_max_time[request_positions],
+        request_columns.drop_off_max_time[request_positions]
+    )
+    instance_nodes = np.where(
+        is_pickup, request_columns.pickup_node[request_positions], request_columns.drop_off_node[request_positions]
+    )
+    def format_time(seconds: int) -> datetime:
+        return request_columns.time_origin + timedelta(seconds=seconds)
+
+    fields = (
+        ("min time", is_pickup & (min_times != MISSING_TIME), instance_min_times, min_times, format_time),
+        ("max time", max_times != MISSING_TIME, instance_max_times, max_times, format_time),
+        ("position", positions != -1, instance_nodes, positions, int),
+    )
+    mismatch = np.zeros(len(request_positions), dtype=bool)
+    for name, compared, instance_values, solution_values, format_value in fields:
+        field_mismatch = compared & (instance_values != solution_values)
+        for action in np.flatnonzero(field_mismatch).tolist():
+            logging.warning(
+                "%s action for request %d %s mismatch: Action from instance: %s, action from solution: %s",
+                "Pickup" if is_pickup[action] else "Drop-off",
+                request_columns.index[request_positions[action]],
+                name,
+                format_value(int(instance_values[action])),
+                format_value(int(solution_values[action]))
+            )
+        mismatch |= field_mismatch
+    return int(mismatch.sum())
+
+
+def _get_request_positions(request_map: Dict[int, Request], request_ids: np.ndarray) -> np.ndarray:
+    """
+    Returns the positions of the requests with the given ids in the request map (in its iteration order).
+
+    :raises KeyError: if some request is not in the request map
+    """
+    map_request_ids = np.fromiter(request_map.keys(), dtype=np.int64, count=len(request_map))
+    if len(map_request_ids) == 0:
+        if len(request_ids) > 0:
+            raise KeyError(int(request_ids[0]))
+        return np.zeros(0, dtype=np.int64)
+    sorter = np.argsort(map_request_ids)
+    positions = sorter[np.minimum(np.searchsorted(map_request_ids, request_ids, sorter=sorter), len(sorter) - 1)]
+    unknown = map_request_ids[positions] != request_ids
+    if unknown.any():
+        raise KeyError(int(request_ids[unknown][0]))
+    return positions
+
+
+def _get_time_origin(instance: DARPInstance) -> Optional[datetime]:
+    """Returns the origin of the instance times if the instance uses the integer times, otherwise None."""
+    return instance.time_origin if instance.integer_times else None
+
+
+def load_solution(
+    filepath: Path, instance: DARPInstance, stream: bool = False, columnar: bool = False, trusted: bool = False
+) -> Solution:
+    """
+    Loads the solution of the instance. The times of the plans are in the time representation of the instance (see
+    DARPInstance.integer_times).
+
+    :param stream: if True, the JSON solution is parsed incrementally while its plans are iterated (see
+    StreamedSolution)
+    :param columnar: if True, the plans are loaded to the plan columns (Solution.plan_columns) and the plan objects are
+    created only when accessed. Ignored if stream is True.
+    :param trusted: if True, the solution actions are not compared with the instance actions (time windows and
+    positions), e.g., for solutions produced by a known solver for this instance
+
+    The solution format is given by the file suffix: JSON (.json), compact (.npz, see darpinstances.compact_solution),
+    or the simulation output csv otherwise.
+    """
     request_map, vehicle_map = _prepare_maps(instance)
+    request_columns = None if trusted else instance.request_columns
 
     logging.info(f"Loading solution from {filepath}")
 
-    if filepath.suffix == '.json':
-        return load_json_solution(filepath, instance.darp_instance_config.virtual_vehicles, request_map, vehicle_map)
+    if filepath.suffix == compact_solution.COMPACT_SOLUTION_SUFFIX:
+        return load_compact_solution(
+            filepath,
+            instance.darp_instance_config.virtual_vehicles,
+            request_map,
+            vehicle_map,
+            request_columns,
+            _get_time_origin(instance),
+            columnar,
+            trusted
+        )
+    elif filepath.suffix == '.json':
+        if stream:
+            return load_json_solution_stream(
+                filepath,
+                instance.darp_instance_config.virtual_vehicles,
+                request_map,
+                vehicle_map,
+                _get_time_origin(instance),
+                trusted
+            )
+        return load_json_solution(
+            filepath,
+            instance.darp_instance_config.virtual_vehicles,
+            request_map,
+            vehicle_map,
+            _get_time_origin(instance),
+            columnar,
+            request_columns,
+            trusted
+        )
     else:
         solution, vehicles = load_csv_solution(
             filepath,
             request_map,
             instance.darp_instance_config.start_time,
-            instance.darp_instance_config.vehicle_capacity
+            instance.darp_instance_config.vehicle_capacity,
+            _get_time_origin(instance),
+            columnar,
+            trusted
         )
         instance.vehicles = vehicles
         return solution
@@ -144,13 +728,25 @@ def _get_action_info_string(action):
     return f"{type_string} action for request {action['request_index']}"
 
 
-def _action_fields_equals(action_from_instance: Action, action: Dict) -> bool:
+def _get_position_index(position) -> int:
+    """Returns the node index of the action position in the solution, a number or an object with the node index."""
+    return position["index"] if isinstance(position, dict) else position
+
+
+def _action_fields_equals(action_from_instance: Action, action: Dict, min_time=None, max_time=None) -> bool:
+    """
+    Compares the solution action with the instance action.
+
+    :param min_time: min time of the solution action in the object time representation (see _load_times), None if the
+    action has no min time
+    :param max_time: max time of the solution action in the object time representation, None if the action has no max
+    time
+    """
     correct = True
 
     # min time constraint (has meaning only for pickup actions)
-    if action_from_instance.action_type == ActionType.PICKUP and "min_time" in action:
-        min_time_solution = _load_datetime(action["min_time"])
-        if min_time_solution != action_from_instance.min_time:
+    if action_from_instance.action_type == ActionType.PICKUP and min_time is not None:
+        if min_time != action_from_instance.min_time:
             logging.warning(
                 "%s min time mismatch: Action from instance: %s, action from solution: %s",
                 _get_action_info_string(action),
@@ -160,157 +756,173 @@ def _action_fields_equals(action_from_instance: Action, action: Dict) -> bool:
             correct = False
 
     # max time constraint
-    if "max_time" in action:
-        max_time_solution = _load_datetime(action["max_time"])
-        if max_time_solution != action_from_instance.max_time:
-            logging.warning(
-                "%s max time mismatch: Action from instance: %s, action from solution: %s",
-                _get_action_info_string(action),
-                action_from_instance.max_time,
-                action["max_time"]
-            )
-            correct = False
-
-    # action position
-    if "position" in action and action["position"] != action_from_instance.node.get_idx():
+    if max_time is not None and max_time != action_from_instance.max_time:
         logging.warning(
-            "%s position mismatch: Action from instance: %s, action from solution: %s",
+            "%s max time mismatch: Action from instance: %s, action from solution: %s",
             _get_action_info_string(action),
-            action_from_instance.node.get_idx(),
-            action["position"]
+            action_from_instance.max_time,
+            action["max_time"]
         )
         correct = False
 
+    # action position
+    if "position" in action:
+        instance_position = get_node_indices([action_from_instance.node])[0]
+        if _get_position_index(action["position"]) != instance_position:
+            logging.warning(
+                "%s position mismatch: Action from instance: %s, action from solution: %s",
+                _get_action_info_string(action),
+                instance_position,
+                action["position"]
+            )
+            correct = False
+
     return correct
 
 
+def _load_optional_times(json_objects: List[Dict], key: str, time_origin: Optional[datetime]) -> list:
+    """Loads the optional time field of the JSON objects at once, None for the objects without the field."""
+    times = iter(_load_times([json_object[key] for json_object in json_objects if key in json_object], time_origin))
+    return [next(times) if key in json_object else None for json_object in json_objects]
+
+
 def _load_plan(
-    json_data, use_virtual_vehicles: bool, vehicle_map: Dict[int, Vehicle], request_map: Dict[int, Request]
+    json_data,
+    use_virtual_vehicles: bool,
+    vehicle_map: Dict[int, Vehicle],
+    request_map: Dict[int, Request],
+    time_origin: Optional[datetime] = None,
+    trusted: bool = False
 ) -> Tuple[VehiclePlan, int]:
-    if use_virtual_vehicles:
-        vehicle = vehicle_map[0]
-    else:
-        # legacy name for id
-        if 'index' in json_data["vehicle"]:
-            vehicle = vehicle_map[json_data["vehicle"]["index"]]
-        else:
-            vehicle = vehicle_map[int(json_data["vehicle"]["id"])]
+    vehicle = _get_plan_vehicle(json_data, use_virtual_vehicles, vehicle_map)
     actions_data_list = []
 
+    # time loading, the plan times followed by the arrival and departure time of each action
+    times = _load_times(
+        [json_data["departure_time"], json_data["arrival_time"]] + [
+            action_data[key] for action_data in json_data["actions"] for key in ("arrival_time", "departure_time")
+        ],
+        time_origin
+    )
+    actions = [action_data["action"] for action_data in json_data["actions"]]
+    if not trusted:
+        min_times = _load_optional_times(actions, "min_time", time_origin)
+        max_times = _load_optional_times(actions, "max_time", time_origin)
+
     # action data loading
     mismatch_actions_count = 0
-    for action_data in json_data["actions"]:
-        action = action_data["action"]
-
-        # time loading
-        arrival_time_val = action_data["arrival_time"]
-        departure_time_val = action_data["departure_time"]
-        if isinstance(arrival_time_val, int):
-            arrival_time = datetime.fromtimestamp(arrival_time_val)
-            departure_time = datetime.fromtimestamp(departure_time_val)
-        else:
-            arrival_time = _load_datetime(arrival_time_val)
-            departure_time = _load_datetime(departure_time_val)
-
+    for index, action in enumerate(actions):
         # mapping to request
         request = request_map[action["request_index"]]
 
         # get the action definition from instance data
-        action_type = ActionType.PICKUP if action["type"] == "pickup" else ActionType.DROP_OFF
-        if action_type == action_type.PICKUP:
+        if action["type"] == "pickup":
             action_from_instance = request.pickup_action
         else:
             action_from_instance = request.drop_off_action
 
-        action_field_equals = _action_fields_equals(action_from_instance, action)
-        if not action_field_equals:
+        if not trusted and not _action_fields_equals(action_from_instance, action, min_times[index], max_times[index]):
             mismatch_actions_count += 1
 
-        actions_data_list.append(ActionData(action_from_instance, arrival_time, departure_time))
-
-    if isinstance(json_data["departure_time"], int):
-        departure_datetime = datetime.fromtimestamp(json_data["departure_time"])
-        arrival_datetime = datetime.fromtimestamp(json_data["arrival_time"])
-    else:
-        departure_datetime = _load_datetime(json_data["departure_time"])
-        arrival_datetime = _load_datetime(json_data["arrival_time"])
+        actions_data_list.append(ActionData(action_from_instance, times[2 * index + 2], times[2 * index + 3]))
 
-    vh_plan = VehiclePlan(vehicle, actions_data_list, json_data["cost"], departure_datetime, arrival_datetime)
+    vh_plan = VehiclePlan(vehicle, actions_data_list, json_data["cost"], times[0], times[1])
     return vh_plan, mismatch_actions_count
 
 
-def load_plan(filepath: str, instance: DARPInstance) -> Tuple[VehiclePlan, int]:
-    json_data = load_json(filepath)
-
-    request_map, vehicle_map = _prepare_maps(instance)
-
-    vp = _load_plan(json_data, instance.darp_instance_config.virtual_vehicles, vehicle_map, request_map)
-
-    return vp
-
-
-def _load_action_from_csv(
-    action_row: pd.Series, simulation_start_time: datetime, request_map: Dict[int, Request]
-) -> Optional[ActionData]:
-    action_type_str = action_row['action']
-
-    if action_type_str not in ["P", "D"]:
-        return None
-
-    request_id = action_row['request_id']
-    node = action_row['node_id']
-
-    # time loading
-    arrival_time = None
-    departure_time = simulation_start_time + timedelta(seconds=int(action_row['time']))
-
-    # mapping to request
-    request = request_map[request_id]
+def _get_plan_vehicle(json_data, use_virtual_vehicles: bool, vehicle_map: Dict[int, Vehicle]) -> Vehicle:
+    if use_virtual_vehicles:
+        return vehicle_map[0]
+    # legacy name for id
+    if 'index' in json_data["vehicle"]:
+        return vehicle_map[json_data["vehicle"]["index"]]
+    return vehicle_map[int(json_data["vehicle"]["id"])]
 
-    # get the action definition from instance data
-    action_type = ActionType.PICKUP if action_type_str == "P" else ActionType.DROP_OFF
-    if action_type == action_type.PICKUP:
-        action_from_instance = request.pickup_action
-    else:
-        action_from_instance = request.drop_off_action
 
-    if action_from_instance.node != node:
-        logging.warning(
-            "Node mismatch for request %d, action %d: Action from instance: %d, action from solution: %d",
-            request_id,
-            action_row.name - 1,
-            action_from_instance.node,
-            node
+def _load_plan_columns(
+    json_plans: list,
+    use_virtual_vehicles: bool,
+    vehicle_map: Dict[int, Vehicle],
+    request_map: Dict[int, Request],
+    request_columns: Optional[RequestColumns],
+    time_origin: Optional[datetime] = None,
+    trusted: bool = False
+) -> SolutionColumns:
+    """
+    Loads the JSON plans to the plan columns. All times are parsed at once, and the actions are checked against the
+    instance on the integer columns (see _count_action_mismatches) unless trusted. The column times are relative to
+    time_origin if it is set (integer times), otherwise to the earliest plan departure time.
+
+    :param request_columns: columns of the requests in the order of the request map, not used if trusted
+    """
+    plan_offsets = [0]
+    vehicle_ids = []
+    costs = []
+    plan_times = []
+    actions = []
+    action_times = []
+    for json_plan in json_plans:
+        vehicle_ids.append(_get_plan_vehicle(json_plan, use_virtual_vehicles, vehicle_map).index)
+        costs.append(np.nan if json_plan["cost"] is None else json_plan["cost"])
+        plan_times.append(json_plan["departure_time"])
+        plan_times.append(json_plan["arrival_time"])
+        for action_data in json_plan["actions"]:
+            actions.append(action_data["action"])
+            action_times.append(action_data["arrival_time"])
+            action_times.append(action_data["departure_time"])
+        plan_offsets.append(len(actions))
+
+    action_request_indices = np.fromiter(
+        (action["request_index"] for action in actions), dtype=np.int64, count=len(actions)
+    )
+    is_pickup = np.fromiter((action["type"] == "pickup" for action in actions), dtype=bool, count=len(actions))
+    request_positions = _get_request_positions(request_map, action_request_indices)
+
+    if not trusted:
+        mismatch_actions_count = _count_action_mismatches(
+            request_columns,
+            request_positions,
+            is_pickup,
+            _load_optional_seconds([action.get("min_time") for action in actions], request_columns.time_origin),
+            _load_optional_seconds([action.get("max_time") for action in actions], request_columns.time_origin),
+            np.fromiter(
+                (-1 if "position" not in action else _get_position_index(action["position"]) for action in actions),
+                dtype=np.int64,
+                count=len(actions)
+            )
         )
+        if mismatch_actions_count > 0:
+            raise Exception(
+                f"Mismatch in actions found in the solution file. Total mismatch count: {mismatch_actions_count}"
+            )
 
-    return ActionData(action_from_instance, arrival_time, departure_time)
-
+    plan_times = _load_time_array(plan_times)
+    action_times = _load_time_array(action_times)
+    if time_origin is None:
+        time_origin = _get_instance_time_origin(None, plan_times.min().tolist() if len(plan_times) > 0 else None)
+    plan_seconds = _get_seconds(plan_times, time_origin)
+    action_seconds = _get_seconds(action_times, time_origin)
+    return SolutionColumns(
+        time_origin,
+        plan_offsets,
+        vehicle_ids,
+        plan_seconds[0::2],
+        plan_seconds[1::2],
+        costs,
+        action_request_indices,
+        np.where(is_pickup, ActionType.PICKUP.value, ActionType.DROP_OFF.value),
+        action_seconds[0::2],
+        action_seconds[1::2]
+    )
 
-def _load_plan_from_csv(
-    plan_data: pd.DataFrame,
-    request_map: Dict[int, Request],
-    vehicle_map: Dict[int, Vehicle],
-    simulation_start_time: datetime
-) -> VehiclePlan:
-    vehicle = vehicle_map[plan_data.name]
 
-    # action data loading
-    actions_data_list = plan_data.apply(
-        _load_action_from_csv,
-        axis=1,
-        args=(simulation_start_time, request_map)
-    )
-    # remove None values
-    actions_data_list = actions_data_list[actions_data_list.notnull()]
-    if len(actions_data_list) == 0:
-        logging.debug("Empty plan for vehicle %d", vehicle.index)
-        return None
+def load_plan(filepath: str, instance: DARPInstance) -> Tuple[VehiclePlan, int]:
+    json_data = load_json(filepath)
 
-    # actions_data_list = [_load_action_from_csv(action_index, time, action_type_str, node, request_id, simulation_start_time,
-    # request_map for action_index, time, action_type_str, node, request_id in zip
+    request_map, vehicle_map = _prepare_maps(instance)
 
-    departure_datetime = actions_data_list.iloc[0].departure_time
-    arrival_datetime = actions_data_list.iloc[-1].departure_time
+    vp = _load_plan(
+        json_data, instance.darp_instance_config.virtual_vehicles, vehicle_map, request_map, _get_time_origin(instance)
+    )
 
-    vh_plan = VehiclePlan(vehicle, actions_data_list, None, departure_datetime, arrival_datetime)
-    return vh_plan
+    return vp
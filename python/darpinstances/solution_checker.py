@@ -6,7 +6,7 @@ import os.path
 from datetime import timedelta
 from enum import Enum, auto
 from pathlib import Path
-from typing import Tuple, Set, Optional, Dict, List
+from typing import Tuple, Set, Optional, Dict, List, Callable, Union
 
 import pandas as pd
 
@@ -38,6 +38,16 @@ class Failure(Enum):
     PLAN_DEPARTURE_TIME = auto()
 
 
+def _get_duration(instance: DARPInstance) -> Callable[[int], Union[int, timedelta]]:
+    """
+    Returns the function converting a duration in seconds to the time representation of the instance: int for the
+    integer times (see DARPInstance.integer_times), timedelta otherwise.
+    """
+    if instance.integer_times:
+        return int
+    return lambda seconds: timedelta(seconds=seconds)
+
+
 class SolutionChecker:
     def __init__(self, max_error_count: int = 10):
         self.error_count = 0
@@ -58,8 +68,10 @@ class SolutionChecker:
     ) -> Tuple[int, bool, Set[Request]]:
         plan_ok = True
         cost = 0.0
+        duration = _get_duration(instance)
 
-        if instance.darp_instance_config.start_time and plan.departure_time < instance.darp_instance_config.start_time:
+        start_time = instance.get_instance_time(instance.darp_instance_config.start_time)
+        if start_time is not None and plan.departure_time < start_time:
             plan_ok = False
             failures[Failure.PLAN_DEPARTURE_TIME] += 1
             print(
@@ -77,7 +89,7 @@ class SolutionChecker:
         onboard_requests = set()
         departure_times = dict()
         vehicle_index = plan.vehicle.index
-        travel_time_provider = instance.travel_time_provider
+        travel_time_provider, travel_time_divider = instance.get_exact_travel_time_provider()
         served_requests = set()
         vehicle_configurations = copy.deepcopy(plan.vehicle.configurations)
         used_equipment = []
@@ -95,7 +107,7 @@ class SolutionChecker:
         # operation time check
         operation_start = plan.vehicle.operation_start
         operation_end = plan.vehicle.operation_end
-        if (operation_start and (plan.departure_time < operation_start)):
+        if (operation_start is not None and (plan.departure_time < operation_start)):
             print(
                 "{} plan starts at {}. operation starts at {}, plan should not start before operation".format(
                     plan_counter,
@@ -105,7 +117,7 @@ class SolutionChecker:
             )
             plan_ok = False
             self._increment_error()
-        if (operation_end and (plan.arrival_time > operation_end)):
+        if (operation_end is not None and (plan.arrival_time > operation_end)):
             print(
                 "{} plan ends at {}. operation ends at {}, plan should not end after operation".format(
                     plan_counter,
@@ -116,7 +128,13 @@ class SolutionChecker:
             plan_ok = False
             self._increment_error()
 
-        travel_time_divider = instance.darp_instance_config.travel_time_divider
+        # travel times of all plan legs are looked up at once. For virtual vehicles, the first leg is replaced by the
+        # vehicle's time to start
+        action_nodes = [action_data.action.node for action_data in plan.actions]
+        if action_nodes:
+            first_leg_start = action_nodes[0] if instance.darp_instance_config.virtual_vehicles \
+                else plan.vehicle.initial_position
+            leg_travel_times = travel_time_provider.get_travel_times([first_leg_start] + action_nodes[:-1], action_nodes)
 
         for action_index, action_data in enumerate(plan.actions):
             action = action_data.action
@@ -142,23 +160,21 @@ class SolutionChecker:
                     self._increment_error()
 
             if previous_action:
-                travel_time = travel_time_provider.get_travel_time(previous_action.node, action_data.action.node)
+                travel_time = leg_travel_times[action_index]
             else:
                 if instance.darp_instance_config.virtual_vehicles:
                     travel_time = plan.vehicle.time_to_start
                 else:
-                    travel_time = travel_time_provider.get_travel_time(
-                        plan.vehicle.initial_position, action_data.action.node
-                    )
+                    travel_time = leg_travel_times[action_index]
             # adjust travel time if the provider is not in seconds
             travel_time = travel_time / travel_time_divider
 
-            time += timedelta(seconds=int(travel_time))
+            time += duration(int(travel_time))
 
             # arrival time check
             if action_data.arrival_time is not None:
                 diff = action_data.arrival_time - time
-                if diff > timedelta(seconds=1):
+                if diff > duration(1):
                     logging.warning(
                         f"[{plan_counter}. plan, {action_index + 1}. Action] Arrival time mismatch (expected {time}, "
                         f"was {action_data.arrival_time}) when handling request {action_data.action.request.index}"
@@ -166,7 +182,7 @@ class SolutionChecker:
                     self._increment_error()
 
             # max time check
-            max_time = action_data.action.max_time + timedelta(seconds=instance.darp_instance_config.max_pickup_delay)
+            max_time = action_data.action.max_time + duration(instance.darp_instance_config.max_pickup_delay)
             if time > max_time:
                 logging.warning(
                     "[{}. plan, {}. Action] Action max time exceeded ({} > {}) when handling request {}.".format(
@@ -232,10 +248,10 @@ class SolutionChecker:
             if action.action_type == ActionType.PICKUP and time < action_data.action.min_time:
                 pause_duration = action_data.action.min_time - time
                 time = action_data.action.min_time
-                if (pause_duration > timedelta(seconds=min_pause_length)):
+                if (pause_duration > duration(min_pause_length)):
                     driving_start = time
 
-            if (max_pause_interval and time - driving_start > timedelta(seconds=max_pause_interval)):
+            if (max_pause_interval and time - driving_start > duration(max_pause_interval)):
                 print(
                     "in Request {} driver is active {} min, max is {}.".format(
                         action_data.action.request.index,
@@ -264,10 +280,8 @@ class SolutionChecker:
                     self._increment_error()
 
             # service time
-            time += timedelta(seconds=int(action_data.action.service_time))
-            max_departure_time = action_data.departure_time + timedelta(
-                seconds=instance.darp_instance_config.max_pickup_delay
-            )
+            time += duration(int(action_data.action.service_time))
+            max_departure_time = action_data.departure_time + duration(instance.darp_instance_config.max_pickup_delay)
 
             # departure time check
             if max_departure_time < time:
@@ -288,10 +302,12 @@ class SolutionChecker:
 
         # return to init position
         if previous_action and instance.darp_instance_config.return_to_depot:
-            travel_time_to_depot = travel_time_provider.get_travel_time(previous_action.node, plan.vehicle.initial_position)
+            travel_time_to_depot = travel_time_provider.get_travel_times(
+                [previous_action.node], [plan.vehicle.initial_position]
+            )[0]
             travel_time_to_depot = travel_time_to_depot / travel_time_divider
             cost += travel_time_to_depot
-            time += timedelta(seconds=int(travel_time_to_depot))
+            time += duration(int(travel_time_to_depot))
 
         # max route time check
         max_route_duration = instance.darp_instance_config.max_route_duration
@@ -322,6 +338,11 @@ class SolutionChecker:
         return cost, plan_ok, served_requests
 
     def check_solution(self, instance: DARPInstance, solution: Solution) -> Tuple[bool, Dict[Failure, int]]:
+        """
+        Checks the solution plan by plan. Only the state of the current plan and the sets of the served requests and
+        used vehicles are kept, so a streamed solution (see darpinstances.solution.StreamedSolution) is checked in
+        constant memory with respect to the number of plans.
+        """
         failures = {Failure.PLAN_DEPARTURE_TIME: 0}
 
         if not solution.feasible:
@@ -344,6 +365,11 @@ class SolutionChecker:
             served_requests.update(plan_served_requests)
             plan_counter += 1
 
+        # the feasibility flag of a streamed solution can follow the plans
+        if not solution.feasible:
+            logging.info("Solution is infeasible")
+            return True, failures
+
         # all request served check
         for request in instance.requests:
             if request not in served_requests and request.index not in solution.dropped_requests:
@@ -393,23 +419,16 @@ class SolutionChecker:
         stats = []
         last_instance_path = None
         last_instance = None
-        travel_time_provider = None
-        last_area = None
         columns = ['solution path', 'ok']
-        for root, solution_path, area in zip(dir_df['root'], dir_df['solution path'], dir_df['area']):
+        for root, solution_path in zip(dir_df['root'], dir_df['solution path']):
             config_path = os.path.join(root, "config.yaml")
             experiment_config = darpinstances.experiments.load_experiment_config(config_path)
             instance_path = Path(experiment_config['instance'])
             if instance_path == last_instance_path:
                 instance = last_instance
             else:
-                if last_area == area:
-                    instance, _ = darpinstances.solution_checker.load_instance(
-                        instance_path,
-                        last_instance.travel_time_provider
-                    )
-                else:
-                    instance, _ = darpinstances.solution_checker.load_instance(instance_path)
+                # the distance matrices are shared by the instances of an area through the provider registry
+                instance, _ = darpinstances.solution_checker.load_instance(instance_path)
 
             solution = darpinstances.solution.load_solution(solution_path, instance)
 
@@ -422,7 +441,6 @@ class SolutionChecker:
 
             last_instance_path = instance_path
             last_instance = instance
-            last_area = area
 
         stat_df = pd.DataFrame(stats)
         stat_df.columns = columns
@@ -441,19 +459,25 @@ class SolutionChecker:
         return stat_df
 
 
-def load_data(solution_file_path: Path, instance_path: Optional[Path], demand_file_name: Optional[str] = None) -> Tuple[DARPInstance, Solution]:
+def load_data(
+    solution_file_path: Path,
+    instance_path: Optional[Path],
+    demand_file_name: Optional[str] = None,
+    integer_times: bool = False,
+    stream: bool = False,
+    trusted: bool = False
+) -> Tuple[DARPInstance, Solution]:
     check_file_exists(solution_file_path)
     solution_dir_path = solution_file_path.parent
-    os.chdir(solution_dir_path)
 
     if instance_path is None:
         experiment_config_path = solution_dir_path / "config.yaml"
         experiment_config = darpinstances.experiments.load_experiment_config(experiment_config_path)
         instance_path = Path(experiment_config['instance'])
 
-    instance, _ = load_instance(instance_path, demand_file_name=demand_file_name)
+    instance, _ = load_instance(instance_path, demand_file_name=demand_file_name, integer_times=integer_times)
 
-    solution = darpinstances.solution.load_solution(solution_file_path, instance)
+    solution = darpinstances.solution.load_solution(solution_file_path, instance, stream, trusted=trusted)
 
     return instance, solution
 
@@ -463,10 +487,13 @@ def load_data(solution_file_path: Path, instance_path: Optional[Path], demand_fi
 def load_instance(
     instance_path: Path,
     travel_time_provider: Optional[TravelTimeProvider] = None,
-    demand_file_name: Optional[str] = None
+    demand_file_name: Optional[str] = None,
+    integer_times: bool = False
 ) -> Tuple[DARPInstance, TravelTimeProvider]:
     if instance_path.suffix == '.yaml':
-        instance = darpinstances.instance.load_instance(instance_path, travel_time_provider, demand_file_name)
+        instance = darpinstances.instance.load_instance(
+            instance_path, travel_time_provider, demand_file_name, integer_times=integer_times
+        )
         travel_time_provider = instance.travel_time_provider
     else:
         instance = load_cordeau(instance_path)
@@ -478,6 +505,15 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Scrip for checking DARP solutions')
     parser.add_argument('solution', type=Path, help='Path to solution file (JSON)')
     parser.add_argument('-i', '--instance', type=str, help='Path to instance config file (YAML)', required=False)
+    parser.add_argument(
+        '-s', '--integer-times', action='store_true', help='Check with times in seconds since the instance start'
+    )
+    parser.add_argument(
+        '--stream', action='store_true', help='Parse the JSON solution incrementally to bound the memory'
+    )
+    parser.add_argument(
+        '--trusted', action='store_true', help='Skip the comparison of the solution actions with the instance actions'
+    )
 
     args = parser.parse_args()
 
@@ -496,9 +532,10 @@ if __name__ == '__main__':
         experiment_config = darpinstances.experiments.load_experiment_config(exp_config_path)
         instance_path = Path(experiment_config['instance'])
         logging.info("Instance path loaded from the experiment config: %s", instance_path)
-        os.chdir(solution_file_path.parent)
 
     check_file_exists(instance_path)
 
-    instance, solution = load_data(solution_file_path, instance_path)
+    instance, solution = load_data(
+        solution_file_path, instance_path, integer_times=args.integer_times, stream=args.stream, trusted=args.trusted
+    )
     check_solution(instance, solution)
@@ -7,6 +7,8 @@ from darpinstances.instance_objects import Action
 
 
 class ActionData:
+    __slots__ = ('action', 'arrival_time', 'departure_time', 'other_index', 'position')
+
     def __init__(self, action: Action, arrival_time: Optional[datetime] = None, departure_time: Optional[datetime] = None):
         self.action = action
         self.arrival_time = arrival_time
@@ -22,6 +24,7 @@ class ActionData:
 
 
 class VehiclePlan:
+    __slots__ = ('departure_time', 'arrival_time', 'actions', 'vehicle', 'cost')
 
     def get_departure_time(self):
         return self.departure_time
@@ -3,14 +3,14 @@ from pathlib import Path
 
 import pandas as pd
 
+import darpinstances.distance_matrix
 from darpinstances.instance import MatrixTravelTimeProvider
 
 
 def compute_trips_travel_times(dm: MatrixTravelTimeProvider, inst_path: Path):
     inst = pd.read_csv(inst_path, sep="\t")
     if "min_travel_time" not in inst.columns:
-        inst["min_travel_time"] = [dm.get_travel_time(origin, destination) for origin, destination in
-                                   zip(inst["origin"], inst["dest"])]
+        inst["min_travel_time"] = dm.get_travel_times(inst["origin"].to_numpy(), inst["dest"].to_numpy())
         inst.to_csv(inst_path, sep="\t", index=False)
 
 
@@ -22,9 +22,13 @@ def compute_instance_dm(dm: MatrixTravelTimeProvider, inst_path: Path):
     vehicle_origins = vehicles["origin"].unique()
 
     locations = sorted(set(trip_origins).union(set(trip_destinations)).union(set(vehicle_origins)))
-    # for location in locations:
-    #     for other_location in locations:
-    #         dm.get_travel_time(location, other_location)
+    darpinstances.distance_matrix.save_instance_dm(
+        dm.dm,
+        locations,
+        inst_path / darpinstances.distance_matrix.INSTANCE_DM_FILENAME,
+        dm.unit,
+        dm.applied_travel_time_divider
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+"""
+Memory benchmark of the instance object model. It creates the same synthetic requests (with their actions, nodes and
+plan action data) once with the object model of the darpinstances package (slots, interned nodes) and once with
+equivalent plain classes with per-instance dictionaries, which was the original object model, and reports the memory
+allocated per request. Optionally, it also measures the memory of loading a real instance.
+"""
+import argparse
+import gc
+import logging
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+import darpinstances.instance
+from darpinstances.instance import Node
+from darpinstances.instance_objects import ActionType, Request
+from darpinstances.vehicle_plan import ActionData
+
+
+class _DictNode:
+    def __init__(self, idx: int):
+        self.idx = idx
+
+
+class _DictAction:
+    def __init__(self, action_id, node, min_time, max_time, action_type, request, service_time=0):
+        self.id = action_id
+        self.node = node
+        self.min_time = min_time
+        self.max_time = max_time
+        self.action_type = action_type
+        self.request = request
+        self.service_time = service_time
+
+
+class _DictRequest:
+    def __init__(
+        self,
+        index,
+        pickup_id,
+        pickup_node,
+        pickup_min_time,
+        pickup_max_time,
+        dropoff_id,
+        drop_off_node,
+        drop_off_max_time,
+        min_travel_time,
+        pickup_service_time=0,
+        drop_off_service_time=0,
+        equipment=0,
+        required_vehicle_id=None
+    ):
+        self.index = index
+        self.pickup_action = _DictAction(
+            pickup_id, pickup_node, pickup_min_time, pickup_max_time, ActionType.PICKUP, self, pickup_service_time
+        )
+        self.drop_off_action = _DictAction(
+            dropoff_id, drop_off_node, None, drop_off_max_time, ActionType.DROP_OFF, self, drop_off_service_time
+        )
+        self.min_travel_time = min_travel_time
+        self.equipment = equipment
+        self.required_vehicle_id = required_vehicle_id
+
+
+class _DictActionData:
+    def __init__(self, action, arrival_time=None, departure_time=None):
+        self.action = action
+        self.arrival_time = arrival_time
+        self.departure_time = departure_time
+        self.other_index = None
+        self.position = None
+
+
+def measure(create: Callable[[], list]) -> int:
+    """Returns the memory allocated by the objects created by the function and still referenced."""
+    gc.collect()
+    tracemalloc.start()
+    objects = create()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return allocated
+
+
+def create_objects(request_count: int, node_count: int, request_class, node_class, action_data_class) -> list:
+    rng = np.random.default_rng(0)
+    origins = rng.integers(0, node_count, request_count).tolist()
+    destinations = rng.integers(0, node_count, request_count).tolist()
+    start = datetime(2023, 1, 1, 18)
+    objects = []
+    for index, (origin, destination) in enumerate(zip(origins, destinations)):
+        pickup_time = start + timedelta(seconds=index % 3600)
+        request = request_class(
+            index,
+            2 * index,
+            node_class(origin),
+            pickup_time,
+            pickup_time + timedelta(seconds=180),
+            2 * index + 1,
+            node_class(destination),
+            pickup_time + timedelta(seconds=900),
+            600
+        )
+        objects.append(request)
+        objects.append(action_data_class(request.pickup_action, pickup_time, pickup_time))
+        objects.append(action_data_class(request.drop_off_action, pickup_time, pickup_time))
+    return objects
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory benchmark of the instance object model')
+    parser.add_argument('-r', '--requests', type=int, default=200_000, help='Number of synthetic requests')
+    parser.add_argument('-n', '--nodes', type=int, default=50_000, help='Number of distinct graph nodes')
+    parser.add_argument('-i', '--instance', type=Path, help='Path to instance config file (YAML) to measure')
+    args = parser.parse_args()
+
+    dict_bytes = measure(
+        lambda: create_objects(args.requests, args.nodes, _DictRequest, _DictNode, _DictActionData)
+    )
+    compact_bytes = measure(lambda: create_objects(args.requests, args.nodes, Request, Node, ActionData))
+
+    print(f"Synthetic requests: {args.requests}, nodes: {args.nodes}")
+    print(f"Plain objects:   {dict_bytes / args.requests:8.1f} B per request ({dict_bytes / 1e6:.1f} MB)")
+    print(f"Compact objects: {compact_bytes / args.requests:8.1f} B per request ({compact_bytes / 1e6:.1f} MB)")
+    print(f"Reduction: {1 - compact_bytes / dict_bytes:.1%}")
+
+    if args.instance is not None:
+        logging.getLogger().setLevel(logging.WARNING)
+        instance_holder = []
+        instance_bytes = measure(lambda: instance_holder.append(
+            darpinstances.instance.load_instance(args.instance, use_snapshot=False)
+        ) or instance_holder)
+        request_count = len(instance_holder[0].requests)
+        print(
+            f"Instance {args.instance}: {request_count} requests, "
+            f"{instance_bytes / max(request_count, 1):.1f} B per request including the travel time provider"
+        )
@@ -0,0 +1,116 @@
+from datetime import timedelta
+
+import h5py
+import numpy as np
+import pytest
+import yaml
+
+from darpinstances.compact_solution import convert_solution
+from darpinstances.inout import save_json
+from darpinstances.instance import load_instance
+from darpinstances.solution import load_solution
+from darpinstances.solution_checker import SolutionChecker
+
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _create_instance(instance_dir):
+    # travel times in milliseconds, mostly not whole seconds, so that rounding them changes the time windows
+    rng = np.random.default_rng(0)
+    dm = rng.integers(1_000, 200_000, size=(8, 8), dtype=np.int32)
+    np.fill_diagonal(dm, 0)
+    with h5py.File(instance_dir / 'dm.h5', 'w') as dm_file:
+        dm_file.create_dataset('dm', data=dm)
+
+    requests = [('2023-01-01 18:00:13', 1, 2), ('2023-01-01 18:00:32', 3, 4), ('2023-01-01 18:01:07', 5, 6)]
+    (instance_dir / 'requests.csv').write_text(
+        "Pickup_Time,Node_From,Node_To\n" + "".join(f"{time},{start},{end}\n" for time, start, end in requests)
+    )
+    (instance_dir / 'vehicles.csv').write_text("0\t4\n7\t4\n7\t4\n")
+    with open(instance_dir / 'config.yaml', 'w') as config_file:
+        yaml.safe_dump({
+            'area_dir': '.',
+            'demand': {'filepath': 'requests.csv'},
+            'dm_filepath': 'dm.h5',
+            'max_pickup_delay': 120,
+            'max_prolongation': 180,
+            'travel_time_divider': 1000,
+            'vehicles': {'start_time': '2023-01-01 17:00:00'},
+        }, config_file)
+    return instance_dir / 'config.yaml'
+
+
+def _get_travel_time(instance, from_node, to_node) -> timedelta:
+    travel_time = instance.travel_time_provider.get_travel_times([from_node], [to_node])[0]
+    return timedelta(seconds=int(travel_time / instance.darp_instance_config.travel_time_divider))
+
+
+def _create_solution(instance) -> dict:
+    """A feasible solution serving each request by a separate vehicle."""
+    plans = []
+    for request, vehicle in zip(instance.requests, instance.vehicles):
+        pickup, drop_off = request.pickup_action, request.drop_off_action
+        departure_time = pickup.min_time - _get_travel_time(instance, vehicle.initial_position, pickup.node)
+        drop_off_time = pickup.min_time + _get_travel_time(instance, pickup.node, drop_off.node)
+        arrival_time = drop_off_time + _get_travel_time(instance, drop_off.node, vehicle.initial_position)
+        plans.append({
+            'cost': None,
+            'vehicle': {'index': vehicle.index},
+            'departure_time': departure_time.strftime(_TIME_FORMAT),
+            'arrival_time': arrival_time.strftime(_TIME_FORMAT),
+            'actions': [
+                {
+                    'action': {
+                        'id': pickup.id,
+                        'request_index': request.index,
+                        'type': 'pickup',
+                        'position': pickup.node,
+                        'min_time': pickup.min_time.strftime(_TIME_FORMAT),
+                        'max_time': pickup.max_time.strftime(_TIME_FORMAT)
+                    },
+                    'arrival_time': pickup.min_time.strftime(_TIME_FORMAT),
+                    'departure_time': pickup.min_time.strftime(_TIME_FORMAT)
+                },
+                {
+                    'action': {
+                        'id': drop_off.id,
+                        'request_index': request.index,
+                        'type': 'drop_off',
+                        'position': drop_off.node,
+                        'max_time': drop_off.max_time.strftime(_TIME_FORMAT)
+                    },
+                    'arrival_time': drop_off_time.strftime(_TIME_FORMAT),
+                    'departure_time': drop_off_time.strftime(_TIME_FORMAT)
+                }
+            ]
+        })
+    return {'cost': None, 'dropped_requests': [], 'plans': plans}
+
+
+def _get_time_windows(instance) -> list:
+    return [
+        (request.pickup_action.min_time, request.pickup_action.max_time, request.drop_off_action.max_time,
+            request.min_travel_time)
+        for request in instance.requests
+    ]
+
+
+@pytest.mark.parametrize('solution_suffix', ['.json', '.npz'])
+def test_solution_of_default_instance_loads_with_compact_dm(tmp_path, solution_suffix):
+    config_path = _create_instance(tmp_path)
+    instance = load_instance(config_path, use_snapshot=False)
+    compact_instance = load_instance(config_path, dm_dtype='uint16', use_snapshot=False)
+    assert compact_instance.travel_time_provider.dm.dtype == np.uint16
+    assert _get_time_windows(compact_instance) == _get_time_windows(instance)
+
+    solution_path = tmp_path / 'solution.json'
+    save_json(_create_solution(instance), solution_path)
+    if solution_suffix != '.json':
+        convert_solution(solution_path, solution_path.with_suffix(solution_suffix))
+        solution_path = solution_path.with_suffix(solution_suffix)
+
+    for loaded_instance in (instance, compact_instance):
+        checker = SolutionChecker(1)
+        ok, _ = checker.check_solution(loaded_instance, load_solution(solution_path, loaded_instance))
+        assert ok
+        assert checker.error_count == 0
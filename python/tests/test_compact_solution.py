@@ -0,0 +1,85 @@
+import copy
+import json
+
+import pytest
+
+from darpinstances.compact_solution import compact_to_json, json_to_compact
+
+
+def _create_solution() -> dict:
+    return {
+        "cost": 172,
+        "cost_minutes": 3,
+        "dropped_requests": [],
+        "plans": [{
+            "cost": 172,
+            "vehicle": {"index": 0, "init_position": {"index": 30}, "capacity": 4},
+            "departure_time": "2023-01-01 17:57:57",
+            "arrival_time": "2023-01-01 18:02:34",
+            "actions": [
+                {
+                    "action": {
+                        "id": 0,
+                        "request_index": 0,
+                        "type": "pickup",
+                        "position": 33,
+                        "min_time": "2023-01-01 18:00:13",
+                        "max_time": "2023-01-01 18:02:13"
+                    },
+                    "arrival_time": "2023-01-01 18:00:13",
+                    "departure_time": "2023-01-01 18:00:13"
+                },
+                {
+                    "action": {
+                        "id": 1, "request_index": 0, "type": "drop_off", "position": 35, "max_time": "2023-01-01 18:07:19"
+                    },
+                    "arrival_time": "2023-01-01 18:00:49",
+                    "departure_time": "2023-01-01 18:00:49"
+                }
+            ]
+        }]
+    }
+
+
+def _create_timestamp_solution() -> dict:
+    solution = _create_solution()
+    for plan in solution["plans"]:
+        plan["departure_time"] = 1672592277
+        plan["arrival_time"] = 1672592554
+        for action_data in plan["actions"]:
+            action_data["arrival_time"] = action_data["departure_time"] = 1672592413
+            action_data["action"]["max_time"] = 1672592533
+            action_data["action"].pop("min_time", None)
+    return solution
+
+
+def _create_solution_without_actions() -> dict:
+    solution = _create_solution()
+    solution["plans"][0]["actions"] = []
+    return solution
+
+
+def _create_solution_without_plans() -> dict:
+    solution = _create_solution()
+    solution["plans"] = []
+    return solution
+
+
+def _create_solution_with_various_costs() -> dict:
+    solution = _create_solution()
+    plan = solution["plans"][0]
+    solution["plans"] = [dict(plan, cost=cost) for cost in (12.0, 12.5, 2 ** 53 + 1, None)]
+    return solution
+
+
+@pytest.mark.parametrize("create_solution", [
+    _create_solution,
+    _create_timestamp_solution,
+    _create_solution_without_actions,
+    _create_solution_without_plans,
+    _create_solution_with_various_costs,
+])
+def test_round_trip(create_solution):
+    solution = create_solution()
+    # compared as JSON text, so that the value types (e.g., 12 and 12.0) are distinguished
+    assert json.dumps(compact_to_json(json_to_compact(copy.deepcopy(solution)))) == json.dumps(solution)